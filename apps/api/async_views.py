@@ -0,0 +1,92 @@
+"""
+Async versions of the read endpoints, served under /api/async/ when running on ASGI
+(WEB_MODE=asgi in run_web_service.sh).
+
+They return the same payloads as the REST framework views in apps.api.views, but every
+query goes through the async ORM (aget and async iteration), so a worker keeps serving
+other requests while one waits on the database or on a slow client.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.api.pagination import KeysetPagination
+from apps.api.views import KEY_FIELDS, CompanyViewSet, UserViewSet, make_etag, parse_fields
+
+
+def has_view_permission(user, model):
+    """
+    Returns whether `user` is authenticated and holds the view permission of `model`.
+    Runs in the sync thread, since loading the session user may query the database.
+    """
+    opts = model._meta
+    return user.is_authenticated and user.has_perm('%s.view_%s' % (opts.app_label, opts.model_name))
+
+
+def json_response(request, data, etag=None, status=200):
+    """
+    Returns `data` as JSON, or a 304 when the client already holds `etag`.
+    """
+    if etag is not None:
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+    response = JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+class AsyncStoreReadView(View):
+    """
+    Async read only endpoint over the live rows of a StoreModel, see StoreReadViewSet.
+    """
+    model = None
+    fields = ()
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, store_code=None):
+        if not await sync_to_async(has_view_permission)(request.user, self.model):
+            return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+        try:
+            fields = parse_fields(request.GET.get('fields'), self.fields)
+            if store_code is None:
+                return await self.list(request, fields)
+            return await self.retrieve(request, store_code, fields)
+        except APIException as e:
+            return json_response(request, e.detail, status=e.status_code)
+
+    def get_queryset(self, fields):
+        return self.model.available_objects.values(*dict.fromkeys(KEY_FIELDS + tuple(fields)))
+
+    async def list(self, request, fields):
+        paginator = KeysetPagination()
+        rows = await paginator.apaginate_queryset(self.get_queryset(fields), request)
+        etag = make_etag(fields, [(row['store_code'], row['modified']) for row in rows], paginator.next_cursor)
+        data = {
+            'next': paginator.get_next_link(),
+            'results': [{field: row[field] for field in fields} for row in rows],
+        }
+        return json_response(request, data, etag)
+
+    async def retrieve(self, request, store_code, fields):
+        try:
+            row = await self.get_queryset(fields).aget(store_code=store_code)
+        except self.model.DoesNotExist:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        etag = make_etag(fields, [(row['store_code'], row['modified'])])
+        return json_response(request, {field: row[field] for field in fields}, etag)
+
+
+class AsyncCompanyView(AsyncStoreReadView):
+    model = CompanyViewSet.model
+    fields = CompanyViewSet.fields
+
+
+class AsyncUserView(AsyncStoreReadView):
+    model = UserViewSet.model
+    fields = UserViewSet.fields
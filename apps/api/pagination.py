@@ -0,0 +1,108 @@
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from apps.core.store import cursors
+from apps.core.store.cursors import encode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (created, store_code) pair of a cursor built by encode_cursor.
+
+    Raises:
+        NotFound: If the cursor is not valid.
+    """
+    try:
+        return cursors.decode_cursor(cursor)
+    except ValueError:
+        raise NotFound('Invalid cursor')
+
+
+def filter_after_cursor(queryset, cursor):
+    """
+    Returns the rows of `queryset` that come after `cursor` in (-created, -store_code) order.
+
+    Raises:
+        NotFound: If the cursor is not valid.
+    """
+    try:
+        return cursors.filter_after_cursor(queryset, cursor)
+    except ValueError:
+        raise NotFound('Invalid cursor')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over (created, store_code), newest first.
+
+    Each page is a range scan that starts right after the last row (c, s) of the previous
+    one (WHERE created <= c AND (created < c OR store_code < s)), backed by the live_crt
+    index of StoreModel, so deep pages cost the same as the first one, unlike OFFSET. The
+    cursor is opaque to clients and pages only move forward.
+    """
+    ordering = ('-created', '-store_code')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        try:
+            requested = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return min(max(requested, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Returns the rows of the page. `queryset` must select `created` and `store_code`.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            queryset = filter_after_cursor(queryset, cursor)
+        return self.split_page(list(queryset.order_by(*self.ordering)[:page_size + 1]), page_size)
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Async version of paginate_queryset, for the async views.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            queryset = filter_after_cursor(queryset, cursor)
+        return self.split_page([row async for row in queryset.order_by(*self.ordering)[:page_size + 1]], page_size)
+
+    def split_page(self, rows, page_size):
+        """
+        Drops the extra row fetched to know whether there is a next page and sets its cursor.
+        """
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = encode_cursor(rows[-1]['created'], rows[-1]['store_code'])
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
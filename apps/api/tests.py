@@ -0,0 +1,105 @@
+import pytest
+from datetime import datetime, timezone
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from .pagination import decode_cursor, encode_cursor
+from .views import conditional_response, make_etag, parse_fields
+
+
+def test_uni_cursor_round_trip():
+    """
+    Test function that verifies a keyset cursor decodes back to its (created, store_code) pair.
+    """
+    created = datetime(2024, 5, 17, 10, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created, 'COMP123456789abcd')
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (created, 'COMP123456789abcd')
+
+
+@pytest.mark.parametrize("cursor", ['zzz', '', encode_cursor(datetime(2024, 1, 1), 'X')[:-3]])
+def test_uni_invalid_cursor_is_not_found(cursor):
+    """
+    Test function that verifies malformed cursors are rejected with a 404.
+    :param cursor: The malformed cursor
+    """
+    with pytest.raises(NotFound):
+        decode_cursor(cursor)
+
+
+def test_uni_filter_after_cursor_bounds_the_range_scan():
+    """
+    Test function that verifies the keyset condition is led by a created <= cursor conjunct, not a
+    bare OR the index can not range scan.
+    """
+    from apps.core.company.models import Company
+    from .pagination import filter_after_cursor
+
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    queryset = filter_after_cursor(Company.all_objects.all(), encode_cursor(created, 'COMP1'))
+    where = queryset.query.where
+    assert where.connector == 'AND'
+    assert [child.lookup_name for child in where.children if hasattr(child, 'lookup_name')] == ['lte']
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, ['store_code', 'name', 'created']),
+    ('created, store_code', ['store_code', 'created']),  # Kept in declaration order
+    ('name,,name', ['name']),
+])
+def test_uni_parse_fields(value, expected):
+    """
+    Test function that verifies sparse fieldsets select the requested fields only.
+    :param value: The ?fields= value
+    :param expected: The selected fields
+    """
+    assert parse_fields(value, ('store_code', 'name', 'created')) == expected
+
+
+def test_uni_parse_fields_rejects_unknown():
+    """
+    Test function that verifies unknown fields in a sparse fieldset are a validation error.
+    """
+    with pytest.raises(ValidationError):
+        parse_fields('name,password', ('store_code', 'name'))
+
+
+def test_uni_conditional_response_not_modified():
+    """
+    Test function that verifies a matching If-None-Match gets an empty 304 and other requests the data.
+    """
+    modified = datetime(2024, 5, 17, tzinfo=timezone.utc)
+    etag = make_etag(['name'], [('COMP123456789abcd', modified)])
+    assert etag != make_etag(['name', 'created'], [('COMP123456789abcd', modified)])
+    factory = APIRequestFactory()
+
+    response = conditional_response(Request(factory.get('/', HTTP_IF_NONE_MATCH='"other", ' + etag)), etag, {'a': 1})
+    assert response.status_code == 304
+    assert response.data is None
+    response = conditional_response(Request(factory.get('/')), etag, {'a': 1})
+    assert (response.status_code, response.data, response['ETag']) == (200, {'a': 1}, etag)
+
+
+@pytest.mark.django_db
+def test_company_list_pages_with_cursor(settings):
+    """
+    Test function that verifies the company list is paged newest first through the next links, with the page size from API_PAGE_SIZE.
+    :param settings: Pytest-django fixture used to set the page size
+    """
+    from rest_framework.test import APIClient
+    from apps.core.company.models import Company
+    from apps.core.users.models import CustomUser
+
+    settings.API_PAGE_SIZE = 2
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    for i in range(3):
+        Company.objects.create(name='company%d' % i)
+    expected = list(Company.available_objects.order_by('-created', '-store_code').values_list('store_code', flat=True))
+    client = APIClient()
+    client.force_authenticate(CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    first = client.get('/api/companies/', {'fields': 'store_code'}).json()
+    assert [row['store_code'] for row in first['results']] == expected[:2]
+    second = client.get(first['next']).json()
+    assert [row['store_code'] for row in second['results']] == expected[2:]
+    assert second['next'] is None
@@ -0,0 +1,16 @@
+from django.urls import path
+from rest_framework.routers import SimpleRouter
+
+from apps.api.async_views import AsyncCompanyView, AsyncUserView
+from apps.api.views import CompanyViewSet, UserViewSet
+
+router = SimpleRouter()
+router.register('companies', CompanyViewSet, basename='company')
+router.register('users', UserViewSet, basename='user')
+
+urlpatterns = router.urls + [
+    path('async/companies/', AsyncCompanyView.as_view(), name='async-company-list'),
+    path('async/companies/<str:store_code>/', AsyncCompanyView.as_view(), name='async-company-detail'),
+    path('async/users/', AsyncUserView.as_view(), name='async-user-list'),
+    path('async/users/<str:store_code>/', AsyncUserView.as_view(), name='async-user-detail'),
+]
@@ -0,0 +1,115 @@
+import hashlib
+
+from rest_framework import status, viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import DjangoModelPermissions, IsAuthenticated
+from rest_framework.response import Response
+
+from apps.api.pagination import KeysetPagination
+from apps.core.company.models import Company
+from apps.core.users.models import CustomUser
+
+# Columns every query selects: the keyset of the pagination and the ETag version
+KEY_FIELDS = ('store_code', 'created', 'modified')
+
+
+def parse_fields(value, allowed):
+    """
+    Returns the fields of a sparse fieldset (?fields=a,b) in `allowed` order, or all of them.
+
+    Raises:
+        ValidationError: If a requested field is not in `allowed`.
+    """
+    if not value:
+        return list(allowed)
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValidationError({'fields': 'Unknown fields: %s' % ', '.join(sorted(unknown))})
+    return [field for field in allowed if field in requested]
+
+
+def make_etag(fields, versions, *extra):
+    """
+    Returns a strong ETag for the rows identified by (store_code, modified) `versions`.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(','.join(fields).encode())
+    for store_code, modified in versions:
+        digest.update(('|%s@%s' % (store_code, modified.isoformat())).encode())
+    for value in extra:
+        digest.update(('|%s' % value).encode())
+    return '"%s"' % digest.hexdigest()
+
+
+def conditional_response(request, etag, data):
+    """
+    Returns a 304 response when the client already holds `etag`, the data otherwise.
+    """
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
+
+
+class ViewModelPermissions(DjangoModelPermissions):
+    """
+    DjangoModelPermissions that also requires the view permission for reads.
+    """
+    perms_map = dict(DjangoModelPermissions.perms_map, **{
+        'GET': ['%(app_label)s.view_%(model_name)s'],
+        'HEAD': ['%(app_label)s.view_%(model_name)s'],
+    })
+
+
+class StoreReadViewSet(viewsets.GenericViewSet):
+    """
+    Read only endpoints over the live rows of a StoreModel.
+
+    Lists are built from .values() dicts, without model instances or serializers, and paged
+    with KeysetPagination. ?fields= selects a sparse fieldset. Detail lookups go through the
+    read-through cache (StoreModel.get_cached). Every response carries an ETag, and a request
+    with a matching If-None-Match gets an empty 304.
+    """
+    model = None
+    fields = ()
+    lookup_field = 'store_code'
+    pagination_class = KeysetPagination
+    permission_classes = [IsAuthenticated, ViewModelPermissions]
+
+    def get_queryset(self):
+        return self.model.available_objects.all()
+
+    def get_fields(self):
+        return parse_fields(self.request.query_params.get('fields'), self.fields)
+
+    def list(self, request):
+        fields = self.get_fields()
+        queryset = self.get_queryset().values(*dict.fromkeys(KEY_FIELDS + tuple(fields)))
+        rows = self.paginator.paginate_queryset(queryset, request, view=self)
+        etag = make_etag(
+            fields, [(row['store_code'], row['modified']) for row in rows], self.paginator.next_cursor
+        )
+        data = self.paginator.get_paginated_response([{field: row[field] for field in fields} for row in rows]).data
+        return conditional_response(request, etag, data)
+
+    def retrieve(self, request, store_code=None):
+        fields = self.get_fields()
+        instance = self.model.get_cached(store_code)
+        if instance is None:
+            raise NotFound()
+        etag = make_etag(fields, [(instance.store_code, instance.modified)])
+        return conditional_response(request, etag, {field: getattr(instance, field) for field in fields})
+
+
+class CompanyViewSet(StoreReadViewSet):
+    model = Company
+    fields = ('store_code', 'name', 'tax_document', 'doctype', 'created', 'modified')
+
+
+class UserViewSet(StoreReadViewSet):
+    model = CustomUser
+    fields = (
+        'store_code', 'username', 'email', 'first_name', 'last_name', 'user_type', 'is_active',
+        'date_joined', 'created', 'modified',
+    )
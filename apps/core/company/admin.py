@@ -1,10 +1,13 @@
 from django.contrib import admin
+from apps.core.store.admin import StoreModelAdminMixin
 from .models import (
     Company
 )
 
-class CompanyAdmin(admin.ModelAdmin):
+class CompanyAdmin(StoreModelAdminMixin, admin.ModelAdmin):
     fields = ('name', 'doctype', 'tax_document')
     list_display = ('store_code', 'name', 'doctype', 'tax_document', 'created')
+    search_fields = ('store_code', 'name')
+    search_help_text = 'Whole store code, or start of the company name.'
 
 admin.site.register(Company, CompanyAdmin)
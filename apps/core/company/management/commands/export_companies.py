@@ -0,0 +1,8 @@
+from apps.core.company.models import Company
+from apps.core.store.management.base import BaseExportCommand
+
+
+class Command(BaseExportCommand):
+    help = 'Streams companies into a CSV or JSONL file in store code order. Resumable with --checkpoint.'
+    model = Company
+    fields = ('store_code', 'name', 'tax_document', 'doctype', 'created', 'modified')
@@ -0,0 +1,24 @@
+from apps.core.company.models import Company
+from apps.core.store.management.base import BaseImportCommand
+from apps.core.store.transfer import insert_instances, validate_instances
+
+FIELDS = ('store_code', 'name', 'tax_document', 'doctype', 'created', 'modified')
+
+
+class Command(BaseImportCommand):
+    help = (
+        'Imports companies from a CSV or JSONL file in chunked bulk inserts. Rows without store_code '
+        'get a new one. Invalid rows are reported and skipped. Resumable with --checkpoint.'
+    )
+    model = Company
+
+    def build(self, chunk):
+        numbered = [
+            (number, Company(**{field: row[field] for field in FIELDS if row.get(field) is not None}))
+            for number, row in chunk
+        ]
+        # Uniqueness is left to the insert, so validation runs no query
+        return validate_instances(Company, numbered)
+
+    def insert(self, items):
+        return insert_instances(Company, items)
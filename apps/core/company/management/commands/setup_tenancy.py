@@ -0,0 +1,66 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from apps.core.company.tenancy import ALL_TENANTS, TENANT_SETTING, TenantModel, get_tenant_models
+
+
+class Command(BaseCommand):
+    help = (
+        'Enables Postgres row level security on the tenant owned tables, with a policy that '
+        'only shows the rows of the tenant in the app.tenant setting: every row when it is "*", '
+        'none when it is empty or not set. The application only sends the tenant with '
+        'TENANT_ROW_LEVEL_SECURITY. Safe to run more than once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Model labels, every TenantModel by default.')
+        parser.add_argument('--disable', action='store_true', help='Drop the policies and disable row level security.')
+
+    def handle(self, *args, **options):
+        if options['models']:
+            models = [apps.get_model(label) for label in options['models']]
+        else:
+            models = get_tenant_models()
+        for model in models:
+            if not issubclass(model, TenantModel):
+                raise CommandError('%s is not a TenantModel' % model._meta.label)
+            self.setup_model(model, options['disable'])
+
+    def setup_model(self, model, disable):
+        using = router.db_for_write(model)
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Row level security needs Postgres, database "%s" is %s' % (using, connection.vendor))
+
+        quote = connection.ops.quote_name
+        names = {
+            'table': quote(model._meta.db_table),
+            'policy': quote('%s_tenant' % model._meta.db_table),
+            'column': quote(model._meta.get_field('company').column),
+            # NULL when the setting is empty or missing, which matches no row
+            'tenant': "NULLIF(current_setting('%s', true), '')" % TENANT_SETTING,
+            'all': "'%s'" % ALL_TENANTS,
+        }
+        statements = ['DROP POLICY IF EXISTS {policy} ON {table}']
+        if disable:
+            statements += [
+                'ALTER TABLE {table} NO FORCE ROW LEVEL SECURITY',
+                'ALTER TABLE {table} DISABLE ROW LEVEL SECURITY',
+            ]
+        else:
+            statements += [
+                (
+                    'CREATE POLICY {policy} ON {table} '
+                    'USING ({tenant} = {all} OR {column} = {tenant}) '
+                    'WITH CHECK ({tenant} = {all} OR {column} = {tenant})'
+                ),
+                'ALTER TABLE {table} ENABLE ROW LEVEL SECURITY',
+                # The application usually connects as the owner of the tables, which skips
+                # the policies unless they are forced
+                'ALTER TABLE {table} FORCE ROW LEVEL SECURITY',
+            ]
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql.format(**names))
+        self.stdout.write('%s: row level security %s' % (model._meta.label, 'disabled' if disable else 'enabled'))
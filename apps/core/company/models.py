@@ -1,10 +1,15 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
+from apps.core.store.indexes import PrefixIndex
 from apps.core.store.models import StoreModel
-from django.core.exceptions import ValidationError
 
 
 class Company(StoreModel):
     STORE_CODE_PREFIX = "COMP"
+    STORE_HISTORY = True
+    SEARCH_FIELDS = (('name', 'A'),)
 
     doctypes = (
         ('TIN', 'TIN'),
@@ -35,20 +40,26 @@ class Company(StoreModel):
         default='SSN',
     )
 
-    class Meta:
+    # Kept current by a trigger, see the setup_search command
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta(StoreModel.Meta):
         verbose_name = 'Company'
         verbose_name_plural = 'Companies'
+        # Backs the case insensitive name prefix searches of the admin and autocomplete()
+        indexes = StoreModel.Meta.indexes + [
+            PrefixIndex(Upper('name'), condition=Q(is_removed=False), name='company_company_live_name'),
+        ]
+
+    @classmethod
+    def get_or_create_by_tax_document(cls, tax_document, defaults=None):
+        """
+        Returns (company, created) for `tax_document`, creating the company when there is none.
+        Safe under concurrent callers, see StoreQuerySetMixin.get_or_create_unique.
 
-    def save(self, *args, **kwargs):
-        MAX_TRIES = 10
-        tries = 0
-        while tries < MAX_TRIES:
-            try:
-                self.store_code = self.gen_strcode()
-                super(Company, self).save(*args, **kwargs)
-            except Exception as e:
-                # If an error occurs, print an error message and retry
-                tries += 1
-                print("Error adding Company instance. Trying again ({}/{}): {}".format(tries, MAX_TRIES, e))
-         # If the maximum number of retries is reached and the request still fails, return Exception
-        raise ValidationError("Failed to save Company instance after {} tries".format(MAX_TRIES))
\ No newline at end of file
+        Raises:
+            ValueError: If `tax_document` is None or blank, which never conflicts with a row.
+        """
+        if tax_document is None or not str(tax_document).strip():
+            raise ValueError('The tax document must be set')
+        return cls.all_objects.get_or_create_unique('tax_document', tax_document, defaults)
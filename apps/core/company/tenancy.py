@@ -0,0 +1,222 @@
+"""
+Companies as tenants of the rows of other StoreModels.
+
+Tenant owned models extend TenantModel, which adds a `company` foreign key and a composite
+(company, created) index so the queries of one tenant only read that tenant's index range
+however many tenants there are.
+
+The active tenant is kept in a context variable. TenantMiddleware sets it to the company of
+the authenticated user for each request, code outside requests (commands, tasks) uses
+`use_tenant()`. While a tenant is active the `objects` and `available_objects` managers of
+tenant owned models only return its rows, so the API, the admin and any other code built on
+them are scoped. `all_objects` is never scoped: it is meant for jobs over every tenant and
+feeds the shared store caches, whose instances are checked with is_visible() instead.
+
+With settings.TENANT_ROW_LEVEL_SECURITY Postgres enforces the same scoping: every query
+sends the active tenant in the `app.tenant` setting, and the policies created by the
+setup_tenancy command hide the rows of the other tenants even from raw SQL. The policies
+fail closed, a query without a tenant sees no row, so code that works on every tenant (the
+authentication backends, commands and tasks) runs inside `use_tenant(ALL_TENANTS)`, or
+connects with a role that has BYPASSRLS.
+"""
+import re
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.db.backends.signals import connection_created
+
+from apps.core.store.managers import SoftDeletableStoreManager
+from apps.core.store.models import StoreModel
+
+# Postgres setting read by the row level security policies
+TENANT_SETTING = 'app.tenant'
+# Statements the policies apply to, the others (DDL, maintenance) are sent as they are
+ROW_SECURITY_STATEMENT_RE = re.compile(r'\s*\(*\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+# Tenant of the code that works on the rows of every tenant, see use_tenant()
+ALL_TENANTS = '*'
+
+# Store code of the active Company, ALL_TENANTS, or None when no tenant was set
+_current_tenant = ContextVar('current_tenant', default=None)
+
+
+def get_tenant_code(tenant):
+    return tenant.store_code if isinstance(tenant, models.Model) else tenant
+
+
+def get_current_tenant():
+    """
+    Returns the store code of the active tenant, or None when queries are not scoped.
+    """
+    tenant = _current_tenant.get()
+    return None if tenant == ALL_TENANTS else tenant
+
+
+@contextmanager
+def use_tenant(tenant):
+    """
+    Makes `tenant` (a Company or its store code, None for no tenant) the active tenant of the block.
+
+    Neither ALL_TENANTS nor None scope the managers, but with row level security only
+    ALL_TENANTS reads the rows of every tenant: without a tenant Postgres returns no row.
+    """
+    token = _current_tenant.set(get_tenant_code(tenant))
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+class TenantManagerMixin(object):
+    """
+    Manager mixin that only returns the rows of the active tenant, when there is one.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        tenant = get_current_tenant()
+        if tenant is not None:
+            queryset = queryset.filter(company_id=tenant)
+        return queryset
+
+
+class TenantManager(TenantManagerMixin, SoftDeletableStoreManager):
+    """
+    Manager over the live rows of the active tenant, or every live row when there is none.
+    """
+
+
+class TenantModel(StoreModel):
+    """
+    Abstract StoreModel owned by a Company.
+
+    New rows without a company get the active tenant when they are saved or bulk inserted
+    through the StoreQuerySet methods. The single column
+    index of the foreign key is left out, the (company, created) index covers its lookups.
+    A company can not be deleted while it owns rows, so the archival of a removed company
+    waits until its rows are gone.
+    """
+    company = models.ForeignKey(
+        'company.Company',
+        on_delete=models.PROTECT,
+        db_index=False,
+        blank=True,
+        null=True,
+    )
+
+    objects = TenantManager(_emit_deprecation_warnings=True)
+    available_objects = TenantManager()
+
+    class Meta(StoreModel.Meta):
+        abstract = True
+        default_manager_name = 'objects'
+        indexes = StoreModel.Meta.indexes + [
+            models.Index(fields=['company', '-created'], name='%(app_label)s_%(class)s_tnt_crt'),
+        ]
+
+    def is_visible(self):
+        tenant = get_current_tenant()
+        return tenant is None or self.company_id == tenant
+
+    def validate_unique(self, exclude=None):
+        # Unique values are unique across tenants, so they are checked against every row
+        with use_tenant(ALL_TENANTS):
+            super().validate_unique(exclude)
+
+    def prepare_insert(self):
+        if self.company_id is None:
+            self.company_id = get_current_tenant()
+
+
+def get_tenant_models():
+    return [model for model in apps.get_models() if issubclass(model, TenantModel)]
+
+
+def with_tenant(sql, params, tenant):
+    """
+    Returns `sql` and `params` prefixed with the statement that sets `tenant` as app.tenant for
+    the transaction of the query.
+    """
+    if isinstance(params, Mapping):
+        return (
+            'SELECT set_config(%(tenant_setting)s, %(tenant)s, true); ' + sql,
+            dict(params, tenant_setting=TENANT_SETTING, tenant=tenant),
+        )
+    if params is None:
+        # psycopg2 only reads placeholders when there are parameters, then '%' must be doubled
+        sql, params = sql.replace('%', '%%'), ()
+    return 'SELECT set_config(%s, %s, true); ' + sql, [TENANT_SETTING, tenant, *params]
+
+
+def tenant_execute(execute, sql, params, many, context):
+    """
+    Execute wrapper that sends the active tenant to Postgres with each query the row level
+    security policies apply to.
+
+    The tenant is set with is_local=true in the same round trip as the query, so it lasts
+    for the transaction of the query only (statements sent together run in one transaction)
+    and nothing is left on the server connection, which a pooler such as PgBouncer in
+    transaction mode may hand to another client next. Server side cursors can not be
+    prefixed, the tenant is set for the session before them; PgBouncer setups disable them.
+    """
+    if not ROW_SECURITY_STATEMENT_RE.match(sql):
+        return execute(sql, params, many, context)
+    tenant = _current_tenant.get() or ''
+    if getattr(context['cursor'].cursor, 'name', None):
+        with context['connection'].connection.cursor() as cursor:
+            cursor.execute('SELECT set_config(%s, %s, false)', [TENANT_SETTING, tenant])
+        return execute(sql, params, many, context)
+    if many:
+        prefixed = [with_tenant(sql, item, tenant) for item in params]
+        return execute(prefixed[0][0] if prefixed else sql, [item for _, item in prefixed], many, context)
+    return execute(*with_tenant(sql, params, tenant), many, context)
+
+
+def install(connection, **kwargs):
+    """
+    Adds the execute wrapper to each new Postgres connection when row level security is on.
+    """
+    if (
+        getattr(settings, 'TENANT_ROW_LEVEL_SECURITY', False) and connection.vendor == 'postgresql'
+        and tenant_execute not in connection.execute_wrappers
+    ):
+        connection.execute_wrappers.append(tenant_execute)
+
+
+connection_created.connect(install, dispatch_uid='apps.core.company.tenancy.install')
+
+
+class TenantMiddleware(object):
+    """
+    Makes the company of the authenticated user the active tenant of the request. Goes after
+    AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_tenant(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return getattr(user, 'company_id', None)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_tenant(self.get_tenant(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The user is loaded lazily with a sync query
+        tenant = await sync_to_async(self.get_tenant)(request)
+        with use_tenant(tenant):
+            return await self.get_response(request)
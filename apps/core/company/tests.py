@@ -1,3 +1,197 @@
-from django.test import TestCase
+import pytest
+from types import SimpleNamespace
+from django.core.exceptions import ValidationError
+from django.db.models import ProtectedError
+from apps.core.company.models import Company
+from apps.core.company.tenancy import ALL_TENANTS, TENANT_SETTING, TenantMiddleware, get_current_tenant, tenant_execute, use_tenant
+from apps.core.users.models import CustomUser, UserProfile
 
-# Create your tests here.
+
+def test_uni_tenant_managers_scope_to_the_active_tenant():
+    """
+    Test function that verifies objects and available_objects filter by the active tenant of
+    use_tenant(), restore the outer one on exit and are not scoped without a tenant, unlike all_objects.
+    """
+    def where(queryset):
+        return str(queryset.query).split(' WHERE ')[-1]
+
+    assert '"company_id" =' not in where(CustomUser.objects.all())
+    with use_tenant(Company(store_code='COMP1')):
+        assert get_current_tenant() == 'COMP1'
+        with use_tenant('COMP2'):
+            assert '"company_id" = COMP2' in where(UserProfile.available_objects.all())
+        assert '"company_id" = COMP1' in where(CustomUser.objects.filter(username='u'))
+        assert '"company_id" = COMP1' in where(UserProfile.objects.all())
+        assert '"company_id" =' not in where(CustomUser.all_objects.filter(username='u'))
+        assert CustomUser(username='new').company_id is None
+    assert get_current_tenant() is None
+    assert CustomUser._default_manager.name == 'objects'
+
+
+def test_uni_tenant_execute_sends_the_tenant_with_each_query():
+    """
+    Test function that verifies the row level security wrapper sets app.tenant for the
+    transaction of every query in the same round trip, and leaves other statements alone.
+    """
+    executed = []
+
+    def execute(sql, params, many, context):
+        executed.append((sql, params))
+
+    context = {'connection': SimpleNamespace(), 'cursor': SimpleNamespace(cursor=SimpleNamespace(name=None))}
+    prefix = 'SELECT set_config(%s, %s, true); '
+    with use_tenant('COMP1'):
+        tenant_execute(execute, 'SELECT * FROM t WHERE a = %s', [1], False, context)
+        tenant_execute(execute, "SELECT * FROM t WHERE a LIKE 'x%'", None, False, context)
+        tenant_execute(execute, 'UPDATE t SET a = %(a)s', {'a': 1}, False, context)
+        tenant_execute(execute, 'INSERT INTO t VALUES (%s)', [[1], [2]], True, context)
+        tenant_execute(execute, 'CREATE INDEX CONCURRENTLY i ON t (a)', None, False, context)
+    tenant_execute(execute, '(SELECT 1)', [], False, context)
+
+    assert executed == [
+        (prefix + 'SELECT * FROM t WHERE a = %s', [TENANT_SETTING, 'COMP1', 1]),
+        (prefix + "SELECT * FROM t WHERE a LIKE 'x%%'", [TENANT_SETTING, 'COMP1']),
+        ('SELECT set_config(%(tenant_setting)s, %(tenant)s, true); UPDATE t SET a = %(a)s',
+         {'a': 1, 'tenant_setting': TENANT_SETTING, 'tenant': 'COMP1'}),
+        (prefix + 'INSERT INTO t VALUES (%s)', [[TENANT_SETTING, 'COMP1', 1], [TENANT_SETTING, 'COMP1', 2]]),
+        ('CREATE INDEX CONCURRENTLY i ON t (a)', None),
+        (prefix + '(SELECT 1)', [TENANT_SETTING, '']),
+    ]
+
+
+def test_uni_all_tenants_is_sent_to_the_database_but_scopes_nothing():
+    """
+    Test function that verifies use_tenant(ALL_TENANTS) leaves the managers unscoped while
+    the row level security wrapper sends the sentinel the policies let through.
+    """
+    executed = []
+
+    def execute(sql, params, many, context):
+        executed.append((sql, params))
+
+    context = {'connection': SimpleNamespace(), 'cursor': SimpleNamespace(cursor=SimpleNamespace(name=None))}
+    with use_tenant(ALL_TENANTS):
+        assert get_current_tenant() is None
+        tenant_execute(execute, '(SELECT 1)', [], False, context)
+
+    assert executed == [('SELECT set_config(%s, %s, true); (SELECT 1)', [TENANT_SETTING, ALL_TENANTS])]
+
+
+def test_uni_tenant_middleware_activates_the_company_of_the_user(rf):
+    """
+    Test function that verifies the request runs with the company of an authenticated user as
+    the active tenant, and with none for anonymous users or after the response.
+    :param rf: Pytest fixture with a RequestFactory
+    """
+    from django.http import HttpResponse
+
+    seen = []
+    middleware = TenantMiddleware(lambda request: seen.append(get_current_tenant()) or HttpResponse())
+    for user in (
+        SimpleNamespace(is_authenticated=True, company_id='COMP1'),
+        SimpleNamespace(is_authenticated=False, company_id='COMP1'),
+    ):
+        request = rf.get('/')
+        request.user = user
+        middleware(request)
+    assert seen == ['COMP1', None]
+    assert get_current_tenant() is None
+
+
+@pytest.fixture
+def tenants(settings):
+    """
+    Two companies with a staff user each, allowed to read the users.
+    """
+    from django.contrib.auth.models import Permission
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    view_user = Permission.objects.get(codename='view_customuser')
+    users = []
+    for name in ('first', 'second'):
+        company = Company.objects.create(name=name)
+        user = CustomUser.objects.create_user(name, '%s@example.com' % name, 'password', user_type='STF', company=company)
+        user.user_permissions.add(view_user)
+        UserProfile.available_objects.create(user=user, company=company)
+        users.append(user)
+    return users
+
+
+@pytest.mark.django_db
+def test_tenant_rows_of_other_tenants_are_invisible(tenants):
+    """
+    Test function that verifies the managers, the cached lookups and the unique checks of one
+    tenant do not see the rows of another.
+    :param tenants: Fixture with a user in each of two companies
+    """
+    first, second = tenants
+    with use_tenant(first.company_id):
+        assert list(CustomUser.objects.all()) == [first]
+        assert list(UserProfile.available_objects.values_list('user', flat=True)) == [first.pk]
+        assert CustomUser.get_cached(second.pk) is None
+        assert CustomUser.get_cached(first.pk) == first
+        with pytest.raises(CustomUser.DoesNotExist):
+            CustomUser.objects.get(username='second')
+        with pytest.raises(ValidationError) as error:
+            CustomUser(username='second', email='x@example.com', password='x', user_type='CLI').validate_unique()
+        assert 'username' in error.value.message_dict
+        assert CustomUser.all_objects.count() == 2
+    assert CustomUser.get_cached(second.pk) == second
+    assert CustomUser.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_tenant_api_lists_only_the_rows_of_the_tenant(tenants, client):
+    """
+    Test function that verifies the read API, sync and async, only serves the users of the
+    company of the authenticated user.
+    :param tenants: Fixture with a user in each of two companies
+    :param client: Pytest-django test client
+    """
+    first, second = tenants
+    client.force_login(first)
+    for prefix in ('/api/users/', '/api/async/users/'):
+        response = client.get(prefix, {'fields': 'username'})
+        assert response.status_code == 200
+        assert response.json()['results'] == [{'username': 'first'}]
+        assert client.get('%s%s/' % (prefix, second.pk)).status_code == 404
+        assert client.get('%s%s/' % (prefix, first.pk)).status_code == 200
+
+
+@pytest.mark.django_db
+def test_tenant_company_with_rows_is_not_deleted(tenants):
+    """
+    Test function that verifies a company can not be deleted, nor archived, while it owns rows.
+    :param tenants: Fixture with a user in each of two companies
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from apps.core.store.archive import archive_removed
+
+    company = tenants[0].company
+    with pytest.raises(ProtectedError):
+        company.delete(soft=False)
+    company.delete()
+    Company.all_objects.filter(pk=company.pk).update(removed_at=timezone.now() - timedelta(days=30))
+    assert archive_removed(Company, days=7) == 0
+    assert CustomUser.objects.filter(pk=tenants[0].pk).exists()
+
+
+@pytest.mark.django_db
+def test_tenant_bulk_inserts_get_the_active_tenant(settings):
+    """
+    Test function that verifies rows bulk inserted inside use_tenant() belong to the tenant
+    and are read back through its scoped managers.
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    """
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    company = Company.objects.create(name='bulk')
+    with use_tenant(company):
+        created, failures = CustomUser.objects.bulk_create_users([
+            {'username': 'bulk1', 'email': 'bulk1@example.com', 'password': 'password', 'user_type': 'CLI', 'profile': {}},
+        ], workers=0)
+        CustomUser.objects.bulk_create_coded([CustomUser(username='bulk2', email='bulk2@example.com', user_type='CLI')])
+        assert failures == []
+        assert sorted(CustomUser.objects.values_list('username', flat=True)) == ['bulk1', 'bulk2']
+        assert list(UserProfile.available_objects.values_list('user__username', flat=True)) == ['bulk1']
+    assert set(CustomUser.all_objects.values_list('company', flat=True)) == {company.store_code}
@@ -0,0 +1,136 @@
+"""
+Changelist performance mode for the admins of StoreModel subclasses.
+
+The stock changelist counts every row twice (COUNT(*) with and without filters), pages with
+OFFSET, loads every column and searches with icontains, so all four scan the whole table.
+StoreModelAdminMixin replaces them with estimated counts, keyset pages on the live_crt
+index, only() on the listed columns and a search the indexes can serve.
+"""
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from apps.core.store.cursors import encode_cursor, filter_after_cursor
+
+CURSOR_VAR = 'cursor'
+KEYSET_ORDERING = ('-created', '-store_code')
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting with StoreQuerySet.estimated_count(), for the sorted changelists that
+    still page with OFFSET.
+    """
+
+    @cached_property
+    def count(self):
+        return self.object_list.estimated_count()
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList that pages in the default (-created, -store_code) order with a cursor, like
+    the read API, so every page is an index range scan of list_per_page + 1 rows, the extra
+    one telling whether there is a next page.
+
+    Sorting by a column falls back to OFFSET pages, still with an estimated count.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.next_cursor = None
+        self.keyset = ORDER_VAR not in request.GET
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        only = self.model_admin.get_list_only(request)
+        return queryset.only(*only) if only else queryset
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+        queryset = self.queryset.order_by(*KEYSET_ORDERING)
+        if self.cursor:
+            try:
+                queryset = filter_after_cursor(queryset, self.cursor)
+            except ValueError:
+                raise IncorrectLookupParameters
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_cursor = encode_cursor(rows[-1].created, rows[-1].store_code)
+        result_list = rows
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        if not self.cursor and self.next_cursor is None:
+            # The first page holds every row
+            self.result_count = len(rows)
+        else:
+            self.result_count = self.queryset.estimated_count(exact_limit=0)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+
+class StoreModelAdminMixin(object):
+    """
+    ModelAdmin mixin for StoreModel subclasses with large tables, see the module docstring.
+
+    Keyset pages show the exact count when the first page holds every row and the planner
+    estimate otherwise, OFFSET pages use StoreQuerySet.estimated_count(), exact on small
+    tables. Searches match
+    a whole store code (primary key index) or the start of the other search_fields, which
+    need an index on Upper(field) such as PrefixIndex.
+
+    Attributes:
+        list_only: Fields loaded by the changelist. Defaults to the model fields of
+            list_display, or every field when list_display has other entries.
+    """
+    ordering = KEYSET_ORDERING
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/store/keyset_change_list.html'
+    search_help_text = 'Whole store code, or the start of the other searched fields.'
+    list_only = None
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_list_only(self, request):
+        if self.list_only is not None:
+            return self.list_only
+        field_names = {field.name for field in self.model._meta.concrete_fields}
+        list_display = [name for name in self.get_list_display(request) if name != 'action_checkbox']
+        if not all(name in field_names for name in list_display):
+            return ()
+        return ['store_code', 'created', *list_display]
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q()
+        for field in self.get_search_fields(request):
+            if field == 'store_code':
+                query |= Q(store_code=term)
+            else:
+                query |= Q(**{'%s__istartswith' % field.lstrip('^=@'): term})
+        return queryset.filter(query), False
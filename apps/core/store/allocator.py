@@ -0,0 +1,191 @@
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from apps.core.store.store_code_gen import StoreCodeGen
+
+# Number of store codes reserved per database round trip when no setting is provided
+DEFAULT_BLOCK_SIZE = 100
+
+
+def reserve_sequence_block(prefix, size, using):
+    """
+    Reserves `size` counter values for `prefix` from a Postgres sequence.
+
+    The sequence is created on demand, one per prefix. Values handed out by nextval()
+    are never reused, so concurrent processes can not receive the same counter.
+    """
+    sequence_name = 'store_code_seq_%s' % prefix.lower()
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE SEQUENCE IF NOT EXISTS %s MINVALUE 0 START 0' % sequence_name)
+        cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [sequence_name, size])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def reserve_table_block(prefix, size, using):
+    """
+    Reserves `size` consecutive counter values for `prefix` using the StoreCodeReservation table.
+
+    The reservation row is locked while it is advanced, so concurrent processes get
+    disjoint blocks. Used on backends without sequences (e.g. SQLite in development).
+    """
+    from apps.core.store.models import StoreCodeReservation
+
+    with transaction.atomic(using=using):
+        reservation, _ = StoreCodeReservation.objects.using(using) \
+            .select_for_update().get_or_create(prefix=prefix)
+        start = reservation.next_value
+        reservation.next_value = start + size
+        reservation.save(using=using, update_fields=['next_value'])
+    return range(start, start + size)
+
+
+def get_reservation_transaction():
+    """
+    Returns the database alias when a block reserved now would join an open transaction, or
+    None. Sequences are not transactional, so this only happens with the reservation table.
+    """
+    from apps.core.store.models import StoreCodeReservation
+
+    using = router.db_for_write(StoreCodeReservation)
+    connection = connections[using]
+    if connection.vendor != 'postgresql' and connection.in_atomic_block:
+        return using
+    return None
+
+
+def reserve_block_db(prefix, size):
+    """
+    Reserves a block of counter values for `prefix` on the database that receives writes.
+    """
+    from apps.core.store.models import StoreCodeReservation
+
+    using = router.db_for_write(StoreCodeReservation)
+    if connections[using].vendor == 'postgresql':
+        return reserve_sequence_block(prefix, size, using)
+    return reserve_table_block(prefix, size, using)
+
+
+class StoreCodeAllocator(object):
+    """
+    Hands out unique store codes from an in-process pool.
+
+    Counter values are reserved in blocks per STORE_CODE_PREFIX (one database round trip
+    per block) and encoded with StoreCodeGen.encode_counter. Distinct counters always produce
+    distinct codes, so no collision check against the table is needed.
+
+    A block reserved inside a transaction is undone when it rolls back, and reserved again
+    later. Its spare counters only join the pool once the transaction commits, so they can
+    not be handed out twice.
+    """
+
+    def __init__(self, block_size=None, reserve_block=None, codegen=None, get_transaction=None):
+        """
+        Args:
+            block_size (int): Number of counters reserved per round trip. Defaults to
+                settings.STORE_CODE_BLOCK_SIZE.
+            reserve_block (callable): Function (prefix, size) -> iterable of unique counters.
+                Defaults to the database backed reservation.
+            codegen (StoreCodeGen): Generator used to encode counters as store codes. Defaults
+                to the permutation mode keyed by settings.STORE_CODE_PERMUTATION_KEY.
+            get_transaction (callable): Function () -> alias of the database whose open
+                transaction a new block joins, or None. Defaults to the reservation table
+                check when `reserve_block` is not given.
+        """
+        self.block_size = block_size
+        self.reserve_block = reserve_block or reserve_block_db
+        if get_transaction is None:
+            get_transaction = get_reservation_transaction if reserve_block is None else lambda: None
+        self.get_transaction = get_transaction
+        self._codegen = codegen
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @property
+    def codegen(self):
+        if self._codegen is None:
+            self._codegen = StoreCodeGen(permutation_key=getattr(settings, 'STORE_CODE_PERMUTATION_KEY', None))
+        return self._codegen
+
+    def get_block_size(self):
+        return self.block_size or getattr(settings, 'STORE_CODE_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+
+    def allocate_numbers(self, prefix, n):
+        """
+        Returns `n` unique counter values for `prefix`, reserving new blocks when the pool runs dry.
+        """
+        with self._lock:
+            pool = self._pools.setdefault(prefix, deque())
+            if len(pool) >= n:
+                return [pool.popleft() for _ in range(n)]
+            using = self.get_transaction()
+            block = list(self.reserve_block(prefix, max(self.get_block_size(), n - len(pool))))
+            if using is None:
+                pool.extend(block)
+                return [pool.popleft() for _ in range(n)]
+            nums = [pool.popleft() for _ in range(len(pool))]
+            used = n - len(nums)
+            nums.extend(block[:used])
+        transaction.on_commit(lambda: self._add_to_pool(prefix, block[used:]), using=using)
+        return nums
+
+    def _add_to_pool(self, prefix, nums):
+        with self._lock:
+            self._pools.setdefault(prefix, deque()).extend(nums)
+
+    def allocate(self, prefix=''):
+        """
+        Returns a single unique store code for `prefix`.
+        """
+        return self.allocate_many(prefix, 1)[0]
+
+    def allocate_many(self, prefix, n):
+        """
+        Returns a list of `n` unique store codes for `prefix`.
+        """
+        return [self.codegen.encode_counter(num, prefix) for num in self.allocate_numbers(prefix, n)]
+
+    def _take_pooled(self, prefix, n):
+        """
+        Returns `n` pooled counters for `prefix` without waiting on the lock or the database,
+        or None when the pool is short or another thread is refilling it.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            pool = self._pools.get(prefix)
+            if pool is None or len(pool) < n:
+                return None
+            return [pool.popleft() for _ in range(n)]
+        finally:
+            self._lock.release()
+
+    async def aallocate_many(self, prefix, n):
+        """
+        Async version of allocate_many. Codes come straight from the pool when it holds enough,
+        otherwise the block reservation runs in the sync thread, off the event loop.
+        """
+        nums = self._take_pooled(prefix, n)
+        if nums is None:
+            return await sync_to_async(self.allocate_many)(prefix, n)
+        return [self.codegen.encode_counter(num, prefix) for num in nums]
+
+    async def aallocate(self, prefix=''):
+        """
+        Async version of allocate.
+        """
+        return (await self.aallocate_many(prefix, 1))[0]
+
+    def reset(self):
+        """
+        Drops every pooled counter. Reserved counters that were not handed out are lost.
+        """
+        with self._lock:
+            self._pools.clear()
+
+
+# Process wide allocator used by StoreModel
+store_code_allocator = StoreCodeAllocator()
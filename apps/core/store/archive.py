@@ -0,0 +1,131 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.deletion import Collector, ProtectedError, RestrictedError
+from django.utils import timezone
+
+from apps.core.store.models import ArchivedStoreRecord, StoreModel
+
+
+def serialize_row(obj):
+    """
+    Returns the column values of `obj`, without running any query.
+    """
+    return {field.attname: field.value_from_object(obj) for field in obj._meta.concrete_fields}
+
+
+def get_removed_at(obj):
+    """
+    Returns when `obj` was soft deleted. Rows removed with a plain update() have no
+    `removed_at`, their last modification is the closest there is.
+    """
+    return obj.removed_at or obj.modified
+
+
+def collect_row(obj, using):
+    """
+    Returns the archive records of `obj` and of the rows its deletion cascades to, with the
+    Collector that deletes them all.
+
+    Soft deleted StoreModel rows get a record of their own. Other cascaded rows (many to many
+    links, admin log entries) are kept in the record of `obj`, by model label under '_related'.
+    Returns (None, None) when `obj` can not be archived yet: a protected or restricted relation
+    points at it, or its deletion would delete or change rows that are not soft deleted.
+    """
+    collector = Collector(using=using)
+    try:
+        collector.collect([obj])
+    except (ProtectedError, RestrictedError):
+        return None, None
+    if collector.field_updates:
+        return None, None
+
+    instances = [instance for instances in collector.data.values() for instance in instances]
+    instances += [instance for queryset in collector.fast_deletes for instance in queryset]
+    records = {}
+    related = defaultdict(list)
+    for instance in instances:
+        if not isinstance(instance, StoreModel):
+            related[instance._meta.label].append(serialize_row(instance))
+        elif not instance.is_removed:
+            return None, None
+        else:
+            records[instance._meta.label, instance.store_code] = ArchivedStoreRecord(
+                model=instance._meta.label,
+                store_code=instance.store_code,
+                data=serialize_row(instance),
+                removed_at=get_removed_at(instance),
+            )
+    if related:
+        records[obj._meta.label, obj.store_code].data['_related'] = dict(related)
+    return list(records.values()), collector
+
+
+def archive_batch(model, removed_before, batch_size, after=None):
+    """
+    Moves one batch of rows of `model` soft deleted before `removed_before` into ArchivedStoreRecord.
+
+    The batch runs in its own short transaction: the rows are locked (skipping rows other
+    transactions hold), copied to the archive together with the rows that their deletion
+    cascades to, and deleted. Rows that can not be archived yet (see collect_row) are left
+    in place. Batches go in primary key order from `after`, so skipped rows are not read again.
+
+    Returns:
+        A tuple with the number of rows of `model` archived and the primary key of the last row
+        of the batch, which is None once nothing is left.
+    """
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        queryset = model.all_objects.using(using).filter(
+            Q(removed_at__lt=removed_before) | Q(removed_at=None, modified__lt=removed_before),
+            is_removed=True,
+        )
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        batch = list(queryset.order_by('pk').select_for_update(skip_locked=True)[:batch_size])
+        if not batch:
+            return 0, None
+        # Read before the delete, which clears the primary key of the instances
+        last = batch[-1].pk
+        records = []
+        collectors = []
+        for obj in batch:
+            row_records, collector = collect_row(obj, using)
+            if collector is not None:
+                records += row_records
+                collectors.append(collector)
+        ArchivedStoreRecord.objects.using(using).bulk_create(records, ignore_conflicts=True)
+        for collector in collectors:
+            collector.delete()
+    return len(collectors), last
+
+
+def archive_removed(model, days, batch_size=500, max_batches=None):
+    """
+    Archives the rows of `model` soft deleted more than `days` days ago, batch by batch.
+
+    Each batch commits on its own, so an interrupted run loses at most one batch of work and
+    running it again resumes with the rows that are left.
+
+    Args:
+        model: A StoreModel subclass.
+        days (int): Minimum days since the soft delete (`removed_at`).
+        batch_size (int): Rows per batch.
+        max_batches (int): Stops after this many batches. None runs until nothing is left.
+
+    Returns:
+        The number of rows of `model` archived.
+    """
+    removed_before = timezone.now() - timedelta(days=days)
+    archived = batches = 0
+    after = None
+    while max_batches is None or batches < max_batches:
+        count, after = archive_batch(model, removed_before, batch_size, after)
+        if after is None:
+            break
+        archived += count
+        # Batches of rows that can not go yet do not count, so they never hold the others back
+        batches += bool(count)
+    return archived
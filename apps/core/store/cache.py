@@ -0,0 +1,224 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+# Defaults used when the settings are not provided
+DEFAULT_CACHE_TIMEOUT = 300
+DEFAULT_LOCAL_CACHE_TIMEOUT = 5
+DEFAULT_LOCAL_CACHE_SIZE = 10000
+# Seconds a loader holds the lock of a key, and seconds other readers wait for it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.5
+LOCK_POLL_INTERVAL = 0.02
+
+
+class LocalTTLCache(object):
+    """
+    Thread safe in-process cache with a time to live and least recently used eviction.
+    """
+
+    def __init__(self, max_size, timeout, clock=time.monotonic):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.clock() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class StoreModelCache(object):
+    """
+    Read-through cache of StoreModel instances keyed by store code.
+
+    Lookups go through a short lived in-process tier first and the shared Django cache (Redis)
+    next; only the codes missing from both reach the database, in one query per call. When a
+    shared entry expires, a single reader per key takes a lock in the shared cache and reloads
+    it while the others wait briefly for the new value, so an expiry does not send every
+    process to the database at once (cache stampede).
+
+    Entries are invalidated when an instance is saved or deleted (see signals), and when rows
+    are changed with QuerySet.update() (bulk_update() and soft deletes through QuerySet.delete()
+    included) on a StoreModel manager. Writes that bypass both, such as raw SQL or the plain
+    querysets of migrations, and updates of more than STORE_INVALIDATE_LIMIT rows, are served
+    stale until the shared entry expires, up to STORE_CACHE_TIMEOUT seconds. The local tier of other processes is not reachable from
+    here, so it keeps entries only for a few seconds.
+    Callers get their own copy of each instance, so state set on one (like the permission
+    cache of a user) never leaks into another request.
+    """
+
+    def __init__(self, alias='default', cache=None, timeout=None, local_cache=None):
+        """
+        Args:
+            alias (str): Django cache used as shared tier.
+            cache: Cache object to use instead of `alias`.
+            timeout (int): Seconds entries live in the shared tier. Defaults to settings.STORE_CACHE_TIMEOUT.
+            local_cache (LocalTTLCache): In-process tier. Defaults to one sized by
+                settings.STORE_LOCAL_CACHE_SIZE and settings.STORE_LOCAL_CACHE_TIMEOUT.
+        """
+        self.alias = alias
+        self._cache = cache
+        self._timeout = timeout
+        self._local = local_cache
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = caches[self.alias]
+        return self._cache
+
+    @property
+    def timeout(self):
+        if self._timeout is None:
+            return getattr(settings, 'STORE_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+        return self._timeout
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalTTLCache(
+                getattr(settings, 'STORE_LOCAL_CACHE_SIZE', DEFAULT_LOCAL_CACHE_SIZE),
+                getattr(settings, 'STORE_LOCAL_CACHE_TIMEOUT', DEFAULT_LOCAL_CACHE_TIMEOUT),
+            )
+        return self._local
+
+    @staticmethod
+    def make_key(model, store_code):
+        return 'store:%s:%s' % (model._meta.label_lower, store_code)
+
+    def get(self, model, store_code):
+        """
+        Returns the live instance of `model` with `store_code`, or None.
+        """
+        return self.get_many(model, [store_code]).get(store_code)
+
+    def get_many(self, model, store_codes):
+        """
+        Returns a dict of store code -> live instance of `model`. Missing codes, and instances
+        that are not visible in the current context (the rows of another tenant), are left out.
+        """
+        keys = {self.make_key(model, code): code for code in store_codes}
+        found = {}
+        for key, code in keys.items():
+            instance = self.local.get(key)
+            if instance is not None:
+                found[code] = copy.copy(instance)
+        pending = [key for key, code in keys.items() if code not in found]
+        if not pending:
+            return {code: instance for code, instance in found.items() if instance.is_visible()}
+
+        remote = self.cache.get_many(pending)
+        pending = [key for key in pending if key not in remote]
+        if pending:
+            remote.update(self._load(model, {key: keys[key] for key in pending}))
+
+        for key, instance in remote.items():
+            self.local.set(key, instance)
+            found[keys[key]] = copy.copy(instance)
+        return {code: instance for code, instance in found.items() if instance.is_visible()}
+
+    def _load(self, model, pending):
+        """
+        Loads `pending` (key -> store code) from the database with stampede protection.
+        """
+        owned = [key for key in pending if self.cache.add(key + ':lock', 1, LOCK_TIMEOUT)]
+        waiting = [key for key in pending if key not in owned]
+        loaded = {}
+        try:
+            if owned:
+                loaded = self._fetch(model, {key: pending[key] for key in owned})
+                self.cache.set_many(loaded, self.timeout)
+        finally:
+            if owned:
+                self.cache.delete_many([key + ':lock' for key in owned])
+
+        # Other processes are loading these keys, wait a little for their result
+        deadline = time.monotonic() + LOCK_WAIT
+        while waiting and time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            ready = self.cache.get_many(waiting)
+            loaded.update(ready)
+            waiting = [key for key in waiting if key not in ready]
+        if waiting:
+            loaded.update(self._fetch(model, {key: pending[key] for key in waiting}))
+        return loaded
+
+    @staticmethod
+    def _fetch(model, pending):
+        # Read from the primary: a lagging replica could put back a value invalidated on commit
+        # Not scoped to the tenant, the cache is shared by all of them
+        manager = model.all_objects.db_manager(router.db_for_read(model, primary=True))
+        instances = manager.filter(is_removed=False).in_bulk(list(pending.values()), field_name='store_code')
+        return {key: instances[code] for key, code in pending.items() if code in instances}
+
+    def invalidate(self, model, store_code, using=None):
+        """
+        Drops the entries of `store_code` now and again when the transaction on `using` commits,
+        so a reader can not put back a value read before the commit.
+        """
+        key = self.make_key(model, store_code)
+        self._delete(key)
+        transaction.on_commit(lambda: self._delete(key), using=using)
+
+    def invalidate_many(self, model, store_codes, using=None):
+        """
+        Like invalidate, for many store codes with one round trip to the shared cache.
+        """
+        keys = [self.make_key(model, code) for code in store_codes]
+        if keys:
+            self._delete_many(keys)
+            transaction.on_commit(lambda: self._delete_many(keys), using=using)
+
+    def clear_local(self, using=None):
+        """
+        Drops the in-process tier now and again when the transaction on `using` commits, for
+        changes too large to invalidate key by key.
+        """
+        self.local.clear()
+        transaction.on_commit(self.local.clear, using=using)
+
+    def _delete_many(self, keys):
+        for key in keys:
+            self.local.delete(key)
+        self.cache.delete_many(keys)
+
+    def _delete(self, key):
+        self.local.delete(key)
+        self.cache.delete(key)
+
+
+# Process wide cache used by StoreModel.get_cached and StoreModel.get_many_cached
+store_model_cache = StoreModelCache()
@@ -0,0 +1,51 @@
+"""
+Opaque keyset cursors over (created, store_code), the newest first order served by the
+live_crt index of StoreModel. Used by the read API and the admin changelists.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(created, store_code):
+    """
+    Returns the opaque cursor of the position right after the row (created, store_code).
+    """
+    raw = json.dumps([created.isoformat(), store_code], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (created, store_code) pair of a cursor built by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created, store_code = json.loads(raw)
+        created = parse_datetime(created)
+    except (TypeError, ValueError):
+        created = None
+    if created is None or not isinstance(store_code, str):
+        raise ValueError('Invalid cursor')
+    return created, store_code
+
+
+def filter_after_cursor(queryset, cursor):
+    """
+    Returns the rows of `queryset` that come after `cursor` in (-created, -store_code) order.
+
+    The leading created <= cursor conjunct bounds the range scan of the index, which the OR of
+    the exact keyset condition alone does not do.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    created, store_code = decode_cursor(cursor)
+    return queryset.filter(
+        Q(created__lt=created) | Q(created=created, store_code__lt=store_code), created__lte=created
+    )
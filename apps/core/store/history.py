@@ -0,0 +1,110 @@
+from django.db import connections, router
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from apps.core.store.archive import serialize_row
+from apps.core.store.models import StoreHistory
+
+# Continuous aggregate with the daily number of changes per model and action
+HISTORY_DAILY_VIEW = 'store_history_daily'
+
+
+def get_history_action(instance, created):
+    """
+    Returns the StoreHistory action of a post_save of `instance`.
+
+    Soft deletes and restores are told apart from updates by comparing is_removed with the
+    value it had when the instance was loaded.
+    """
+    if created:
+        return StoreHistory.CREATE
+    was_removed = getattr(instance, '_loaded_is_removed', None)
+    if instance.is_removed and was_removed is False:
+        return StoreHistory.SOFT_DELETE
+    if not instance.is_removed and was_removed:
+        return StoreHistory.RESTORE
+    return StoreHistory.UPDATE
+
+
+def record_history(instances, action, using=None):
+    """
+    Appends one StoreHistory row per instance, with one INSERT.
+    """
+    now = timezone.now()
+    StoreHistory.objects.using(using).bulk_create([
+        StoreHistory(
+            time=now,
+            model=instance._meta.label,
+            store_code=instance.store_code,
+            action=action,
+            changes=serialize_row(instance),
+        )
+        for instance in instances
+    ])
+    for instance in instances:
+        instance._loaded_is_removed = instance.is_removed
+
+
+def has_daily_aggregate(using):
+    """
+    Whether the continuous aggregate created by setup_store_history exists on `using`.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        return HISTORY_DAILY_VIEW in connection.introspection.table_names(cursor, include_views=True)
+
+
+def refresh_daily_aggregate(days=3):
+    """
+    Refreshes the last `days` days of the daily continuous aggregate, on top of its own policy.
+
+    Returns:
+        False when the database has no aggregate (other backends, or setup_store_history
+        was not run), True otherwise.
+    """
+    using = router.db_for_write(StoreHistory)
+    if not has_daily_aggregate(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "CALL refresh_continuous_aggregate(%s, now() - %s * INTERVAL '1 day', now())",
+            [HISTORY_DAILY_VIEW, days],
+        )
+    return True
+
+
+def daily_counts(model, action=StoreHistory.CREATE, since=None):
+    """
+    Returns a list of (day, count) with the number of `action` changes of `model` per day.
+
+    Reads the TimescaleDB continuous aggregate when it exists, so growth reports never scan
+    the history hypertable or the model table. Other databases group the history rows.
+
+    Args:
+        model: A StoreModel subclass.
+        action (str): One of the StoreHistory actions.
+        since (datetime): Only days from this moment on.
+    """
+    using = router.db_for_read(StoreHistory)
+    if has_daily_aggregate(using):
+        sql = 'SELECT bucket, SUM(total) FROM %s WHERE model = %%s AND action = %%s' % HISTORY_DAILY_VIEW
+        params = [model._meta.label, action]
+        if since is not None:
+            sql += ' AND bucket >= %s'
+            params.append(since)
+        sql += ' GROUP BY bucket ORDER BY bucket'
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(day, int(total)) for day, total in cursor.fetchall()]
+
+    history = StoreHistory.objects.using(using).for_model(model).filter(action=action)
+    if since is not None:
+        history = history.filter(time__gte=since)
+    return [
+        (row['day'], row['total'])
+        for row in history.annotate(day=TruncDay('time')).values('day')
+        .annotate(total=Count('*')).order_by('day')
+    ]
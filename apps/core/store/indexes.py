@@ -0,0 +1,42 @@
+from django.db import models
+from django.db.models.functions import Collate
+
+# Collation that sorts by code point and lets a B-tree index serve LIKE 'abc%' on Postgres
+PREFIX_COLLATION = 'C'
+
+
+def prefix_order(expression, connection):
+    """
+    Returns `expression` in the order of its PrefixIndex on `connection`, for ORDER BY clauses
+    the index can serve.
+    """
+    if connection.vendor != 'postgresql':
+        return expression
+    return Collate(expression, PREFIX_COLLATION)
+
+
+class PrefixIndex(models.Index):
+    """
+    Index for prefix searches (LIKE 'abc%', startswith/istartswith lookups) read in order.
+
+    On Postgres the expressions are indexed under the C collation, without which a B-tree
+    index only serves LIKE through the text_pattern_ops operator class, which can not serve
+    ORDER BY. Order by prefix_order(expression) to read the index in order. Other databases
+    get a plain index. Index Upper('field') for the case insensitive lookups, which compare
+    UPPER(field::text). Takes expressions only, F('field') for a plain column.
+    """
+
+    def __init__(self, *expressions, **kwargs):
+        if not expressions or kwargs.get('fields'):
+            raise ValueError('PrefixIndex takes expressions, not fields.')
+        super().__init__(*expressions, **kwargs)
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        index = models.Index(
+            *[prefix_order(expression, schema_editor.connection) for expression in self.expressions],
+            name=self.name,
+            condition=self.condition,
+        )
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
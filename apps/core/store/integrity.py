@@ -0,0 +1,58 @@
+"""
+Classification of the database errors raised by concurrent writers.
+
+A unique violation on the store code of a new row means the generated code was taken and
+another one can be tried, while one on another column (such as Company.tax_document) is a
+real conflict for the caller. Deadlocks and serialization failures abort only the current
+statement or savepoint, so the write can be retried at once.
+"""
+import re
+
+# SQLSTATE codes of Postgres
+UNIQUE_VIOLATION = '23505'
+TRANSIENT_CODES = frozenset({
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+})
+
+# Seconds waited before retrying a transient error, doubled on each retry
+RETRY_BACKOFF = 0.01
+
+# Postgres: 'Key (store_code)=(COMP...) already exists.'
+_POSTGRES_KEY_RE = re.compile(r'Key \(([^)]*)\)=')
+# SQLite: 'UNIQUE constraint failed: company_company.store_code'
+_SQLITE_UNIQUE_RE = re.compile(r'UNIQUE constraint failed: ([\w., ]+)')
+
+
+def get_violated_columns(error):
+    """
+    Returns the columns of the unique constraint that `error` violated, or an empty tuple when
+    it is not a unique violation or the backend does not tell.
+    """
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) is not None:
+        if cause.pgcode != UNIQUE_VIOLATION:
+            return ()
+        match = _POSTGRES_KEY_RE.search(getattr(cause.diag, 'message_detail', None) or '')
+        return tuple(column.strip() for column in match.group(1).split(',')) if match else ()
+    match = _SQLITE_UNIQUE_RE.search(str(error))
+    if match:
+        return tuple(column.strip().rsplit('.', 1)[-1] for column in match.group(1).split(','))
+    return ()
+
+
+def is_store_code_collision(error, model):
+    """
+    Whether `error` is a unique violation of the store code of `model` alone.
+    """
+    return get_violated_columns(error) == (model._meta.get_field('store_code').column,)
+
+
+def is_transient(error):
+    """
+    Whether `error` is a deadlock or serialization failure, which a retry can get past.
+    """
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) is not None:
+        return cause.pgcode in TRANSIENT_CODES
+    return 'database is locked' in str(error)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.store.transfer import DEFAULT_CHUNK_SIZE, FORMATS, Checkpoint, export_rows, import_rows, read_rows
+
+
+class BaseExportCommand(BaseCommand):
+    """
+    Base of the export_* commands. Subclasses set `model`, `fields` and optionally `headers`.
+    """
+    model = None
+    fields = ()
+    headers = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, '-' for stdout.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the one of the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched per round trip.')
+        parser.add_argument('--checkpoint', help='File where progress is kept, to resume an interrupted export.')
+        parser.add_argument('--include-removed', action='store_true', help='Export soft deleted rows too.')
+
+    def get_queryset(self, options):
+        return self.model.all_objects.all() if options['include_removed'] else self.model.available_objects.all()
+
+    def handle(self, *args, **options):
+        written = export_rows(
+            self.get_queryset(options), list(self.fields), options['path'], options['format'],
+            options['chunk_size'], Checkpoint(options['checkpoint']), self.headers,
+        )
+        if options['path'] != '-':
+            self.stdout.write('%s: %d rows exported' % (self.model._meta.label, written))
+
+
+class BaseImportCommand(BaseCommand):
+    """
+    Base of the import_* commands. Subclasses set `model` and implement `build` and `insert`
+    (see apps.core.store.transfer.import_rows).
+    """
+    model = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the one of the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows inserted per transaction.')
+        parser.add_argument('--checkpoint', help='File where progress is kept, to resume an interrupted import.')
+
+    def build(self, chunk):
+        raise NotImplementedError
+
+    def insert(self, items):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        try:
+            imported, failures = import_rows(
+                read_rows(options['path'], options['format']), self.build, self.insert,
+                options['batch_size'], Checkpoint(options['checkpoint']),
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        for number, message in failures:
+            self.stderr.write('row %d: %s' % (number, message))
+        self.stdout.write('%s: %d rows imported, %d failed' % (self.model._meta.label, imported, len(failures)))
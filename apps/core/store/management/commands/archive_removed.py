@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.store.archive import archive_removed
+from apps.core.store.resolver import get_store_models
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves StoreModel rows soft deleted more than --days days ago into the archive table, '
+        'in batches. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Minimum days since the soft delete.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows moved per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Batches per model before stopping.')
+        parser.add_argument(
+            '--model', action='append', dest='models', default=[],
+            help='app_label.ModelName to archive, can be repeated. Defaults to every StoreModel.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            models = [apps.get_model(label) for label in options['models']] or get_store_models()
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        for model in models:
+            archived = archive_removed(
+                model, options['days'], options['batch_size'], options['max_batches']
+            )
+            self.stdout.write('%s: %d rows archived' % (model._meta.label, archived))
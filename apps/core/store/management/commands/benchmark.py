@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks import hot_paths  # noqa: F401, registers the cases
+from benchmarks.runner import (
+    DEFAULT_BASELINE_PATH, DEFAULT_MIN_TIME, DEFAULT_ROUNDS, DEFAULT_THRESHOLD, compare, get_cases,
+    is_test_database, load_baseline, run_case, save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the hot path benchmarks (benchmarks/hot_paths.py) and compares them with the stored '
+        'baseline. Fails when a case is slower than the baseline by more than its threshold, or has '
+        'no baseline. Runs against a test database only, the cases write to it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('patterns', nargs='*', help="Case names or patterns such as 'api.*', all by default.")
+        parser.add_argument('--list', action='store_true', help='List the cases and exit.')
+        parser.add_argument('--save', action='store_true', help='Store the results as the new baseline.')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline JSON file.')
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help='Slowdown reported as a regression, 0.25 is 25%%. Cases may set a larger one.',
+        )
+        parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='Timed rounds per case.')
+        parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME, help='Minimum seconds per round.')
+        parser.add_argument(
+            '--allow-any-database', action='store_true',
+            help='Run against a database that is not a test database. The cases create and delete rows.',
+        )
+
+    def handle(self, *args, **options):
+        cases = get_cases(options['patterns'])
+        if not cases:
+            raise CommandError('No benchmark matches %s' % ' '.join(options['patterns']))
+        if options['list']:
+            for case in cases:
+                self.stdout.write(case.name)
+            return
+
+        if not options['allow_any_database'] and not is_test_database():
+            raise CommandError(
+                'The benchmarks write to the database and "%s" is not a test database. Point DATABASES '
+                'at one (test_ prefix) or pass --allow-any-database.' % connection.settings_dict['NAME']
+            )
+        baseline = load_baseline(options['baseline'])
+        missing = [case.name for case in cases if case.name not in baseline]
+        if missing and not options['save']:
+            raise CommandError(
+                'No baseline for %s in %s. Record one on this machine with --save.'
+                % (', '.join(missing), options['baseline'])
+            )
+        results = []
+        regressions = []
+        self.stdout.write('%-28s %12s %12s %12s %10s' % ('case', 'median (ms)', 'ops/sec', 'baseline', 'change'))
+        for case in cases:
+            result = run_case(case, options['rounds'], options['min_time'])
+            results.append(result)
+            threshold = max(options['threshold'], case.threshold or 0)
+            change, regressed = compare(result, baseline.get(case.name), threshold)
+            line = '%-28s %12.4f %12.1f %12s %10s' % (
+                case.name, result.median * 1000, result.ops,
+                '%.4f' % baseline[case.name]['median_ms'] if case.name in baseline else '-',
+                '%+.1f%%' % (change * 100) if change is not None else '-',
+            )
+            if regressed:
+                regressions.append(case.name)
+                line = self.style.ERROR(line + '  slower than %+.0f%%' % (threshold * 100))
+            self.stdout.write(line)
+
+        if options['save']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write('Baseline of %d cases saved to %s' % (len(results), options['baseline']))
+        elif regressions:
+            raise CommandError('Regressions over the baseline: %s' % ', '.join(regressions))
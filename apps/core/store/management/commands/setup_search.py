@@ -0,0 +1,87 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from apps.core.store.resolver import get_store_models
+from apps.core.store.search import get_primary_fields, vector_sql
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the pg_trgm extension, the triggers that keep search_vector current, the GIN '
+        'indexes of the searchable StoreModels and fills search_vector on existing rows. '
+        'Safe to run more than once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Model labels, every model with SEARCH_FIELDS by default.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows filled per UPDATE.')
+
+    def handle(self, *args, **options):
+        if options['models']:
+            models = [apps.get_model(label) for label in options['models']]
+        else:
+            models = [model for model in get_store_models() if model.SEARCH_FIELDS]
+        for model in models:
+            if not model.SEARCH_FIELDS:
+                raise CommandError('%s has no SEARCH_FIELDS' % model._meta.label)
+            self.setup_model(model, options['batch_size'])
+
+    def setup_model(self, model, batch_size):
+        using = router.db_for_write(model)
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Search indexes need Postgres, database "%s" is %s' % (using, connection.vendor))
+
+        table = model._meta.db_table
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field, _ in model.SEARCH_FIELDS)
+        pk = quote(model._meta.pk.column)
+        statements = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            (
+                'CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ '
+                'BEGIN NEW.search_vector := {vector}; RETURN NEW; END '
+                '$$ LANGUAGE plpgsql'
+            ),
+            'DROP TRIGGER IF EXISTS {trigger} ON {table}',
+            (
+                'CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE OF {columns} ON {table} '
+                'FOR EACH ROW EXECUTE FUNCTION {function}()'
+            ),
+            # Built without locking writes, so it can run on a live table
+            (
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} '
+                'USING gin (search_vector) WHERE NOT is_removed'
+            ),
+        ]
+        for field in get_primary_fields(model):
+            statements.append(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_%s_trgm ON {table} '
+                'USING gin (%s gin_trgm_ops) WHERE NOT is_removed' % (field, quote(model._meta.get_field(field).column))
+            )
+        names = {
+            'table': table,
+            'function': '%s_search_vector' % table,
+            'trigger': '%s_search_vector' % table,
+            'index': '%s_search' % table,
+            'columns': columns,
+            'vector': vector_sql(model),
+        }
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql.format(**names))
+            # Existing rows are filled in batches, each one a short transaction
+            filled = 0
+            while True:
+                cursor.execute(
+                    'UPDATE {table} SET search_vector = {vector} WHERE {pk} IN '
+                    '(SELECT {pk} FROM {table} WHERE search_vector IS NULL LIMIT %s)'.format(
+                        table=table, pk=pk, vector=vector_sql(model, table),
+                    ),
+                    [batch_size],
+                )
+                if not cursor.rowcount:
+                    break
+                filled += cursor.rowcount
+        self.stdout.write('%s: search trigger and indexes in place, %d rows filled' % (model._meta.label, filled))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from apps.core.store.history import HISTORY_DAILY_VIEW
+from apps.core.store.models import StoreHistory
+
+
+class Command(BaseCommand):
+    help = (
+        'Adds the TimescaleDB compression policy, the optional retention policy and the daily '
+        'continuous aggregate of the StoreHistory hypertable. Safe to run more than once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compress-after', default='7 days', help='Age of the chunks that get compressed.')
+        parser.add_argument('--retention', default=None, help='Age of the chunks that get dropped, kept forever by default.')
+        parser.add_argument('--refresh-every', default='1 hour', help='Refresh interval of the daily aggregate.')
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(StoreHistory)
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            raise CommandError('StoreHistory policies need TimescaleDB, database "%s" is %s' % (using, connection.vendor))
+
+        table = StoreHistory._meta.db_table
+        statements = [
+            (
+                "ALTER TABLE {table} SET (timescaledb.compress, "
+                # Segmenting by store code leaves a few rows per segment, too few to compress;
+                # ordering by it keeps the history of a row together and range filterable
+                "timescaledb.compress_segmentby = 'model', "
+                "timescaledb.compress_orderby = 'store_code, time DESC')",
+                [],
+            ),
+            (
+                "SELECT add_compression_policy(%s, %s::interval, if_not_exists => true)",
+                [table, options['compress_after']],
+            ),
+            (
+                "CREATE MATERIALIZED VIEW IF NOT EXISTS {view} WITH (timescaledb.continuous) AS "
+                "SELECT time_bucket(INTERVAL '1 day', time) AS bucket, model, action, count(*) AS total "
+                "FROM {table} GROUP BY bucket, model, action WITH NO DATA",
+                [],
+            ),
+            (
+                "SELECT add_continuous_aggregate_policy(%s, start_offset => INTERVAL '3 days', "
+                "end_offset => INTERVAL '1 hour', schedule_interval => %s::interval, if_not_exists => true)",
+                [HISTORY_DAILY_VIEW, options['refresh_every']],
+            ),
+        ]
+        if options['retention']:
+            statements.append((
+                "SELECT add_retention_policy(%s, %s::interval, if_not_exists => true)",
+                [table, options['retention']],
+            ))
+
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql.format(table=table, view=HISTORY_DAILY_VIEW), params)
+        self.stdout.write('StoreHistory policies and the %s aggregate are in place' % HISTORY_DAILY_VIEW)
@@ -0,0 +1,293 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connections, models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from model_utils.managers import SoftDeletableManagerMixin, SoftDeletableQuerySet
+from timescale.db.models.querysets import TimescaleQuerySet
+
+from apps.core.store.allocator import store_code_allocator
+from apps.core.store.integrity import RETRY_BACKOFF, is_transient
+
+# Number of rows inserted per chunk when no setting is provided
+DEFAULT_BULK_BATCH_SIZE = 1000
+# Estimated counts below this number are replaced by an exact count
+DEFAULT_EXACT_COUNT_LIMIT = 10000
+# Rows an update() drops one by one from the caches, larger updates clear the local ones
+DEFAULT_INVALIDATE_LIMIT = 10000
+
+
+def find_conflicting_indexes(codes, existing_codes):
+    """
+    Returns the positions of `codes` that can not be inserted as they are.
+
+    A code conflicts when it is already in `existing_codes` or when it appeared earlier
+    in the same batch (the first occurrence is kept).
+
+    Args:
+        codes (list): Store codes of the batch, in insertion order.
+        existing_codes (set): Store codes already present in the table.
+
+    Returns:
+        A list of indexes into `codes`.
+    """
+    seen = set()
+    conflicts = []
+    for index, code in enumerate(codes):
+        if code in existing_codes or code in seen:
+            conflicts.append(index)
+        seen.add(code)
+    return conflicts
+
+
+class StoreQuerySetMixin(object):
+    """
+    QuerySet mixin with StoreModel aware bulk operations.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Inserts `objs` like QuerySet.bulk_create, after filling the values each one gets from
+        its context (StoreModel.prepare_insert), as save() does.
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj.prepare_insert()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_create_coded(self, objs, batch_size=None, max_retries=3):
+        """
+        Inserts StoreModel instances in chunks, assigning store codes to the ones without it.
+
+        Codes for the whole chunk come from the allocator in one pass. Each chunk is checked
+        for collisions (within the chunk and against the table) with a single query, and
+        only the generated codes that conflicted are replaced before inserting.
+
+        Args:
+            objs (iterable): Unsaved instances of the queryset model.
+            batch_size (int): Rows per chunk. Defaults to settings.STORE_BULK_BATCH_SIZE.
+            max_retries (int): Times the conflicting codes of a chunk are regenerated.
+
+        Returns:
+            The list of inserted instances.
+
+        Raises:
+            ValidationError: If a store code given by the caller is already taken, or if
+                generated codes keep colliding after `max_retries` attempts.
+        """
+        # Conflict checks and inserts must all run on the database rows are written to
+        self._for_write = True
+        objs = list(objs)
+        batch_size = batch_size or getattr(settings, 'STORE_BULK_BATCH_SIZE', DEFAULT_BULK_BATCH_SIZE)
+        for start in range(0, len(objs), batch_size):
+            chunk = objs[start:start + batch_size]
+            generated = self._assign_store_codes(chunk)
+            self._resolve_conflicts(chunk, generated, max_retries)
+            with transaction.atomic(using=self.db):
+                self.bulk_create(chunk)
+                if self.model.STORE_HISTORY:
+                    from apps.core.store.history import record_history
+                    record_history(chunk, 'create', using=self.db)
+        return objs
+
+    def get_or_create_unique(self, field, value, defaults=None, max_retries=3):
+        """
+        Returns the row whose unique `field` is `value`, inserting it when there is none, with
+        no race between the lookup and the insert.
+
+        The insert is a single INSERT ... ON CONFLICT DO NOTHING (INSERT OR IGNORE on SQLite),
+        so concurrent callers never get an IntegrityError and never abort the surrounding
+        transaction: the one that loses the race reads the row of the winner. When the row
+        is missing after the insert, it was the generated store code that conflicted, and it
+        is retried with a new one. Deadlocks are retried too.
+
+        Soft deleted rows are matched too, as the unique constraint covers them.
+
+        Args:
+            field (str): Name of a field with a unique constraint.
+            value: Value of `field` to look up.
+            defaults (dict): Other field values of the row when it is created.
+            max_retries (int): Times a store code collision or deadlock is retried.
+
+        Returns:
+            A tuple (instance, created).
+
+        Raises:
+            ValidationError: If generated codes keep colliding after `max_retries` attempts.
+            OperationalError: If the write keeps deadlocking after `max_retries` attempts.
+        """
+        self._for_write = True
+        lookup = {field: value}
+        for attempt in range(max_retries + 1):
+            obj = self.model(**dict(defaults or {}, **lookup))
+            obj.store_code = obj.allocate_strcode()
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create([obj], ignore_conflicts=True)
+                    existing = self.model._base_manager.using(self.db).filter(**lookup).first()
+                    if existing is None:
+                        continue
+                    created = existing.store_code == obj.store_code
+                    if created and self.model.STORE_HISTORY:
+                        from apps.core.store.history import record_history
+                        record_history([existing], 'create', using=self.db)
+            except OperationalError as e:
+                if attempt == max_retries or not is_transient(e):
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            return existing, created
+        raise ValidationError(
+            'Failed to assign a unique store code after {} tries'.format(max_retries), code='unique'
+        )
+
+    def update(self, **kwargs):
+        """
+        Updates the rows and drops them from the read-through cache and the resolver, which
+        the model signals never hear about. The store codes are read first, on the primary,
+        up to settings.STORE_INVALIDATE_LIMIT of them: larger updates clear the resolver and
+        the local tier of the cache instead, and leave the shared entries to expire.
+        """
+        from apps.core.store.cache import store_model_cache
+        from apps.core.store.resolver import store_code_resolver
+
+        self._for_write = True
+        limit = getattr(settings, 'STORE_INVALIDATE_LIMIT', DEFAULT_INVALIDATE_LIMIT)
+        codes = list(self.values_list('store_code', flat=True)[:limit + 1])
+        count = super().update(**kwargs)
+        if len(codes) > limit:
+            store_model_cache.clear_local(using=self.db)
+            store_code_resolver.clear()
+        else:
+            store_model_cache.invalidate_many(self.model, codes, using=self.db)
+            store_code_resolver.forget_many(codes)
+        return count
+
+    def estimated_count(self, exact_limit=None):
+        """
+        Returns the number of rows of the queryset as estimated by the Postgres statistics.
+
+        An unfiltered queryset reads the row count of the table from pg_class, a filtered one
+        the number of rows the planner expects (EXPLAIN), so no rows are scanned. Estimates
+        below `exact_limit` (settings.STORE_EXACT_COUNT_LIMIT by default), tables that were
+        never analyzed and other databases get an exact COUNT(*).
+        """
+        if exact_limit is None:
+            exact_limit = getattr(settings, 'STORE_EXACT_COUNT_LIMIT', DEFAULT_EXACT_COUNT_LIMIT)
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            return self.count()
+        with connection.cursor() as cursor:
+            if self.query.where:
+                sql, params = self.order_by().values('pk').query.sql_with_params()
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = plan[0]['Plan']['Plan Rows']
+            else:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(self.model._meta.db_table)],
+                )
+                estimate = cursor.fetchone()[0]
+        if estimate < exact_limit:
+            return self.count()
+        return int(estimate)
+
+    def search(self, text):
+        """
+        Live rows matching `text` in the SEARCH_FIELDS of the model, best first, annotated with
+        `rank`. See apps.core.store.search.
+        """
+        from apps.core.store.search import search
+        return search(self, text)
+
+    def autocomplete(self, text, limit=None):
+        """
+        Up to `limit` live rows whose weight 'A' SEARCH_FIELDS start with `text`.
+        """
+        from apps.core.store.search import DEFAULT_AUTOCOMPLETE_LIMIT, autocomplete
+        return autocomplete(self, text, limit or DEFAULT_AUTOCOMPLETE_LIMIT)
+
+    def _assign_store_codes(self, objs):
+        """
+        Gives a store code to every instance without one and returns their positions.
+        """
+        generated = [index for index, obj in enumerate(objs) if not obj.store_code]
+        codes = store_code_allocator.allocate_many(self.model.STORE_CODE_PREFIX, len(generated))
+        for index, code in zip(generated, codes):
+            objs[index].store_code = code
+        return set(generated)
+
+    def _resolve_conflicts(self, objs, generated, max_retries):
+        """
+        Replaces the generated store codes of `objs` that collide, until none does.
+        """
+        for _ in range(max_retries + 1):
+            codes = [obj.store_code for obj in objs]
+            existing = set(
+                self.model._base_manager.using(self.db)
+                .filter(store_code__in=codes).values_list('store_code', flat=True)
+            )
+            conflicts = find_conflicting_indexes(codes, existing)
+            if not conflicts:
+                return
+            given = [objs[index].store_code for index in conflicts if index not in generated]
+            if given:
+                raise ValidationError(
+                    {'store_code': 'Store codes already in use: %s' % ', '.join(given)}, code='unique'
+                )
+            new_codes = store_code_allocator.allocate_many(self.model.STORE_CODE_PREFIX, len(conflicts))
+            for index, code in zip(conflicts, new_codes):
+                objs[index].store_code = code
+        raise ValidationError(
+            'Failed to assign unique store codes after {} tries'.format(max_retries), code='unique'
+        )
+
+
+class StoreQuerySet(StoreQuerySetMixin, models.QuerySet):
+    pass
+
+
+class SoftDeletableStoreQuerySet(StoreQuerySetMixin, SoftDeletableQuerySet):
+
+    def delete(self):
+        """
+        Soft deletes the rows, recording when in `removed_at` (kept for rows already removed).
+        """
+        count = self.update(is_removed=True, removed_at=Coalesce('removed_at', Value(timezone.now())))
+        return count, {self.model._meta.label: count}
+
+
+class StoreManager(models.Manager.from_queryset(StoreQuerySet)):
+    """
+    Manager over every row of a StoreModel, including the soft deleted ones.
+    """
+    pass
+
+
+class SoftDeletableStoreManager(SoftDeletableManagerMixin, models.Manager.from_queryset(SoftDeletableStoreQuerySet)):
+    """
+    Manager over the rows of a StoreModel that are not soft deleted.
+    """
+    _queryset_class = SoftDeletableStoreQuerySet
+
+
+class StoreHistoryQuerySet(TimescaleQuerySet):
+    """
+    QuerySet over the StoreHistory hypertable.
+    """
+
+    def for_model(self, model):
+        return self.filter(model=model._meta.label)
+
+    def for_instance(self, instance):
+        """
+        Changes of one StoreModel instance, newest first.
+        """
+        return self.filter(model=instance._meta.label, store_code=instance.store_code).order_by('-time')
@@ -0,0 +1,101 @@
+"""
+Helpers to move an existing StoreModel table to SurrogateKeyStoreModel.
+
+The move takes four migrations, so every step is small and can be checked on its own:
+
+1. Add the surrogate key as a plain nullable column and number the existing rows. For each
+   foreign key that points at the model, add a nullable bigint column next to it::
+
+       operations = [
+           migrations.AddField('company', 'id', models.BigIntegerField(null=True)),
+           migrations.RunPython(populate_surrogate_ids('company', 'Company'), migrations.RunPython.noop),
+           migrations.AddField('userprofile', 'company_key', models.BigIntegerField(null=True)),
+       ]
+
+2. Detach the incoming foreign keys before the primary key changes. Postgres can not drop a
+   primary key that foreign key constraints depend on, and Django would cast the varchar
+   columns of the foreign keys to bigint while they still hold store codes. Fill the
+   bigint columns with `copy_foreign_keys` and remove the old foreign key fields in the
+   same migration, so no reference written in between is lost::
+
+       operations = [
+           migrations.RunPython(
+               copy_foreign_keys('users', 'UserProfile', 'company', 'company_key', 'company', 'Company'),
+               migrations.RunPython.noop,
+           ),
+           migrations.RemoveField('userprofile', 'company'),
+       ]
+
+3. Switch the model to SurrogateKeyStoreModel and run makemigrations. The generated
+   AlterField operations turn `store_code` into a unique column and `id` into the BigAutoField
+   primary key. Postgres starts the new identity at 1, so append a step that moves it past
+   the highest id, or the first insert collides with a numbered row::
+
+       migrations.RunPython(reset_surrogate_sequence('company', 'Company'), migrations.RunPython.noop),
+
+4. Point the foreign keys at the new primary key: rename each bigint column back to the
+   name of its foreign key and alter it into a ForeignKey, which creates the constraint.
+
+Steps 2 to 4 change the models the code uses, so they ship in one release.
+"""
+from django.core.management.color import no_style
+from django.db.models import Max, OuterRef, Subquery
+
+
+def populate_surrogate_ids(app_label, model_name, field_name='id', batch_size=1000):
+    """
+    Returns a RunPython function that numbers the rows of a model without surrogate key.
+
+    Rows are numbered in (created, store_code) order, starting after the highest id already
+    set, and updated in chunks of `batch_size` so no long lock is held on big tables.
+    """
+    def forward(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        manager = model._base_manager.using(schema_editor.connection.alias)
+        last_id = manager.aggregate(last_id=Max(field_name))['last_id'] or 0
+        while True:
+            batch = list(
+                manager.filter(**{field_name: None}).order_by('created', 'store_code')
+                .only('store_code')[:batch_size]
+            )
+            if not batch:
+                break
+            for obj in batch:
+                last_id += 1
+                setattr(obj, field_name, last_id)
+            manager.bulk_update(batch, [field_name])
+    return forward
+
+
+def reset_surrogate_sequence(app_label, model_name):
+    """
+    Returns a RunPython function that restarts the sequence (identity) of the primary key of a
+    model after its highest value. Nothing to do on SQLite, which keeps counting from the rows.
+    """
+    def forward(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+    return forward
+
+
+def copy_foreign_keys(app_label, model_name, old_field, new_field, target_app_label, target_model_name,
+                      target_field='id'):
+    """
+    Returns a RunPython function that fills `new_field` with the surrogate key of the row
+    that the store code in `old_field` references, with one UPDATE statement.
+    """
+    def forward(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        target = apps.get_model(target_app_label, target_model_name)
+        alias = schema_editor.connection.alias
+        old_column = model._meta.get_field(old_field).attname
+        model._base_manager.using(alias).update(**{
+            new_field: Subquery(
+                target._base_manager.using(alias)
+                .filter(store_code=OuterRef(old_column)).values(target_field)[:1]
+            )
+        })
+    return forward
@@ -1,19 +1,66 @@
-from django.db import models
-from django.db.models.manager import Manager
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from timescale.db.models.models import TimescaleModel
 from model_utils.models import (
     TimeStampedModel,
     SoftDeletableModel
 )
-import re
-from django.core.exceptions import ValidationError
 from apps.core.store.store_code_gen import StoreCodeGen
+from apps.core.store.allocator import store_code_allocator
+from apps.core.store.integrity import RETRY_BACKOFF, is_store_code_collision, is_transient
+from apps.core.store.managers import SoftDeletableStoreManager, StoreHistoryQuerySet, StoreManager
+from apps.core.store.validators import register_store_code_validator
+
+# Generator shared by every StoreModel, so it is not rebuilt (and reseeded) on each call
+store_code_gen = StoreCodeGen()
+
+# Times the insert of a new instance is retried when no setting is provided
+DEFAULT_SAVE_RETRIES = 3
 
 class StoreBaseModel(SoftDeletableModel, TimeStampedModel):    
     """
     Abstract base class that extends Django's SoftDeletableModel and TimeStampedModel
+
+    Default queries only read live rows (is_removed = false), so the common lookups are backed
+    by partial indexes on live rows only. Removed rows get their own partial index on
+    `removed_at`, the moment they were soft deleted, for the archival job.
+
+    `removed_at` is set by save() and by QuerySet.delete(). Rows soft deleted with a plain
+    QuerySet.update(is_removed=True) leave it empty.
     """
+    removed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     class Meta:
         abstract = True
+        indexes = [
+            models.Index(
+                fields=['-created'],
+                condition=Q(is_removed=False),
+                name='%(app_label)s_%(class)s_live_crt'
+            ),
+            models.Index(
+                fields=['-modified'],
+                condition=Q(is_removed=False),
+                name='%(app_label)s_%(class)s_live_mod'
+            ),
+            models.Index(
+                fields=['removed_at'],
+                condition=Q(is_removed=True),
+                name='%(app_label)s_%(class)s_rm_at'
+            ),
+        ]
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if self.is_removed != (self.removed_at is not None):
+            self.removed_at = timezone.now() if self.is_removed else None
+            if update_fields is not None and 'removed_at' not in update_fields:
+                update_fields = [*update_fields, 'removed_at']
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
 
 class StoreModel(StoreBaseModel):
@@ -24,6 +71,11 @@ class StoreModel(StoreBaseModel):
     """
 
     STORE_CODE_PREFIX = ''
+    # Set to True in a subclass to record every change in the StoreHistory hypertable
+    STORE_HISTORY = False
+    # (field, weight) pairs searched by objects.search(), weight 'A' ones also by autocomplete().
+    # Searchable models need a `search_vector` SearchVectorField, see apps.core.store.search
+    SEARCH_FIELDS = ()
 
     store_code = models.CharField(
         primary_key=True,
@@ -34,16 +86,92 @@ class StoreModel(StoreBaseModel):
         null=False
     )
 
-    all_objects = Manager()
+    objects = SoftDeletableStoreManager(_emit_deprecation_warnings=True)
+    available_objects = SoftDeletableStoreManager()
+    all_objects = StoreManager()
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Compiles the store code validator of each prefix once, when the subclass is defined.
+        """
+        super().__init_subclass__(**kwargs)
+        if cls.STORE_CODE_PREFIX:
+            register_store_code_validator(cls.STORE_CODE_PREFIX)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if cls.STORE_HISTORY:
+            # Kept to tell soft deletes and restores apart from plain updates
+            instance._loaded_is_removed = instance.__dict__.get('is_removed')
+        return instance
+
+    @classmethod
+    def created_per_day(cls, since=None):
+        """
+        Class method that returns a list of (day, count) of the instances created per day.
+        Requires STORE_HISTORY.
+        """
+        from apps.core.store.history import daily_counts
+        return daily_counts(cls, StoreHistory.CREATE, since)
+
+    def is_visible(self):
+        """
+        Method that tells whether the instance may be returned in the current context. The
+        shared caches skip the scoping of the managers and check it instead, see TenantModel.
+        """
+        return True
+
+    def prepare_insert(self):
+        """
+        Method that fills the values a new instance gets from its context, called before it is
+        inserted by save() and by the bulk inserts of StoreQuerySet. See TenantModel.
+        """
+
+    @classmethod
+    def get_cached(cls, store_code):
+        """
+        Class method that returns the live instance with `store_code` through the read-through cache, or None
+        """
+        from apps.core.store.cache import store_model_cache
+        return store_model_cache.get(cls, store_code)
+
+    @classmethod
+    def get_many_cached(cls, store_codes):
+        """
+        Class method that returns a dict of store code -> live instance through the read-through cache
+        """
+        from apps.core.store.cache import store_model_cache
+        return store_model_cache.get_many(cls, store_codes)
 
     @classmethod
     def gen_strcode(cls):
         """
         Class method that generates a new store code using the StoreCodeGen class
         """
-        storecode = StoreCodeGen()
-        return storecode.gen_storecode(cls.STORE_CODE_PREFIX)
+        return store_code_gen.gen_storecode(cls.STORE_CODE_PREFIX)
+
+    @classmethod
+    def gen_strcode_batch(cls, n):
+        """
+        Class method that generates `n` store codes, unique within the batch
+        """
+        return store_code_gen.gen_storecode_batch(n, cls.STORE_CODE_PREFIX)
+
+    @classmethod
+    def allocate_strcode(cls):
+        """
+        Class method that takes a unique store code from the process wide StoreCodeAllocator pool
+        """
+        return store_code_allocator.allocate(cls.STORE_CODE_PREFIX)
     
+    @classmethod
+    async def aallocate_strcode(cls):
+        """
+        Async version of allocate_strcode, only reaches the database when the pool runs dry
+        """
+        return await store_code_allocator.aallocate(cls.STORE_CODE_PREFIX)
+
     @classmethod
     def copy_instance(self, cls):
         """
@@ -55,17 +183,172 @@ class StoreModel(StoreBaseModel):
     
     def clean(self):
         """
-        Method that validates the store code. The code must follow the format <prefix><5 or 9 digits><1 letter>.
+        Method that validates the store code. The code must follow the format <prefix><5 or 9 digits><4 letter>.
         """
-        # Skip O in order to avoid confusing letters
         if self.store_code:
-            if not self.store_code or \
-                not re.match('^%s\d{9}([A-N]|[P-Z])[a-zA-Z]{4}$' % self.STORE_CODE_PREFIX, str(self.store_code)) and \
-                    not re.match('^%s\d{5}([A-N]|[P-Z])[a-zA-Z]{4}$' % self.STORE_CODE_PREFIX, str(self.store_code)):
-                        raise ValidationError(
-                            {'store_code': ('Enter a value with this format %s<5 or 9 digits><4 letter>'
-                                            % self.STORE_CODE_PREFIX)}, code='invalid'
-                        )
+            register_store_code_validator(self.STORE_CODE_PREFIX)(str(self.store_code))
+
+    @classmethod
+    def validate_store_codes(cls, codes):
+        """
+        Class method that checks many store codes at once, returning whether each one is valid
+        """
+        return register_store_code_validator(cls.STORE_CODE_PREFIX).validate_many(codes)
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Saves the instance, assigning a store code from the allocator pool when it has none.
+
+        A new instance with an allocated code is inserted (never updated, so a taken code can
+        not overwrite another row) inside a savepoint. When the code is taken it is retried
+        with a fresh one, and after a deadlock with the same one, up to STORE_SAVE_RETRIES
+        times. Other integrity errors, such as a duplicate unique field, are raised at once
+        and leave the surrounding transaction usable. Saves forced to update, or limited to
+        update_fields, are left to Django.
+        """
+        if self._state.adding:
+            self.prepare_insert()
+        if not self.store_code:
+            self.store_code = self.allocate_strcode()
+            self._allocated_store_code = True
+        if (
+            force_update or update_fields is not None
+            or not (self._state.adding and getattr(self, '_allocated_store_code', False))
+        ):
+            return super().save(
+                force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields,
+            )
+
+        using = using or router.db_for_write(type(self), instance=self)
+        retries = getattr(settings, 'STORE_SAVE_RETRIES', DEFAULT_SAVE_RETRIES)
+        for attempt in range(retries + 1):
+            try:
+                with transaction.atomic(using=using):
+                    super().save(force_insert=True, using=using)
+                break
+            except IntegrityError as e:
+                if attempt == retries or not is_store_code_collision(e, type(self)):
+                    raise
+                self.store_code = self.allocate_strcode()
+            except OperationalError as e:
+                if attempt == retries or not is_transient(e):
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+        self._allocated_store_code = False
+
+    async def asave(self, *args, **kwargs):
+        """
+        Async version of save. The store code is allocated on the event loop when the pool has
+        one, and the write runs in the sync thread like every async ORM call.
+        """
+        if not self.store_code:
+            self.store_code = await self.aallocate_strcode()
+            self._allocated_store_code = True
+        await super().asave(*args, **kwargs)
+
+    class Meta(StoreBaseModel.Meta):
+        abstract = True
+        # The live creation index gets the store code as tie breaker, the keyset of the read API
+        indexes = [
+            models.Index(
+                fields=['-created', '-store_code'],
+                condition=Q(is_removed=False),
+                name='%(app_label)s_%(class)s_live_crt'
+            ),
+        ] + StoreBaseModel.Meta.indexes[1:]
+
+
+class SurrogateKeyStoreModel(StoreModel):
+    """
+    StoreModel variant that keeps a compact bigint primary key next to the store code.
+
+    Joins, foreign keys and their indexes use the 8 byte `id`, while `store_code` stays unique
+    and is still the identifier exposed outside the database. Opt in by extending this class
+    instead of StoreModel; apps.core.store.migration_helpers moves existing tables over.
+    """
+    id = models.BigAutoField(primary_key=True)
+
+    store_code = models.CharField(
+        max_length=25,
+        verbose_name=('Store Code'),
+        unique=True,
+        blank=False,
+        null=False
+    )
+
+    class Meta(StoreModel.Meta):
+        abstract = True
+
+
+class StoreCodeReservation(models.Model):
+    """
+    Keeps, per store code prefix, the next counter value that has not been reserved yet.
+
+    Used by the StoreCodeAllocator on databases without sequences.
+    """
+    prefix = models.CharField(primary_key=True, max_length=25)
+    next_value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Store Code Reservation'
+        verbose_name_plural = 'Store Code Reservations'
+
+
+class ArchivedStoreRecord(models.Model):
+    """
+    Soft deleted StoreModel rows moved out of their table by the archive_removed command.
+
+    One table holds the archived rows of every StoreModel subclass; `data` keeps the column
+    values of the row as they were when it was archived.
+    """
+    model = models.CharField(max_length=100)
+    store_code = models.CharField(max_length=25)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    removed_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Archived Store Record'
+        verbose_name_plural = 'Archived Store Records'
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'store_code'], name='store_archived_model_code_uniq'),
+        ]
+
+
+class StoreHistory(TimescaleModel):
+    """
+    Audit trail of the StoreModel subclasses with STORE_HISTORY enabled.
+
+    Every save, soft delete, restore and delete appends one row with the values of the row
+    after the change. On TimescaleDB the table is a hypertable partitioned on `time`; the
+    setup_store_history command adds its compression policy and daily continuous aggregate.
+    Changes made with QuerySet.update() (including QuerySet.delete() soft deletes) are not
+    recorded, since they do not go through the model signals.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    SOFT_DELETE = 'soft_delete'
+    RESTORE = 'restore'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = (
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (SOFT_DELETE, 'Soft delete'),
+        (RESTORE, 'Restore'),
+        (DELETE, 'Delete'),
+    )
+
+    model = models.CharField(max_length=100)
+    store_code = models.CharField(max_length=25)
+    action = models.CharField(max_length=12, choices=ACTION_CHOICES)
+    changes = models.JSONField(encoder=DjangoJSONEncoder)
+
+    objects = StoreHistoryQuerySet.as_manager()
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        verbose_name = 'Store History'
+        verbose_name_plural = 'Store History'
+        indexes = [
+            models.Index(fields=['model', 'store_code', '-time'], name='store_history_code_time'),
+        ]
@@ -0,0 +1,78 @@
+from hashlib import blake2b
+
+# 64 bit mask used by the round function
+MASK_64 = (1 << 64) - 1
+
+
+class FeistelPermutation(object):
+    """
+    Keyed bijection of the integers in [0, domain_size).
+
+    A balanced Feistel network permutes the smallest even-bit domain that holds domain_size;
+    values that land outside [0, domain_size) are permuted again (cycle walking) until they
+    fall inside, which keeps the mapping a bijection of the requested domain. It spreads a
+    monotonically increasing counter over the whole domain without ever repeating a value.
+    It is not meant to be cryptographically strong.
+    """
+
+    def __init__(self, domain_size: int, key: str, rounds: int = 4):
+        """
+        Args:
+            domain_size (int): Number of values in the domain.
+            key (str): Secret that selects the permutation. Changing it changes every value.
+            rounds (int): Number of Feistel rounds.
+        """
+        if domain_size < 2:
+            raise ValueError("domain_size must be greater than 1")
+        if rounds < 1:
+            raise ValueError("rounds must be greater than 0")
+
+        self.domain_size = domain_size
+        # Bits of each half of the Feistel block
+        self.half_bits = ((domain_size - 1).bit_length() + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        # One 64 bit key per round, derived from the user key
+        digest = blake2b(key.encode(), digest_size=8 * rounds).digest()
+        self.round_keys = [int.from_bytes(digest[i:i + 8], 'big') for i in range(0, 8 * rounds, 8)]
+
+    # Mix one half of the block with a round key
+    def round_function(self, value: int, round_key: int):
+        x = ((value ^ round_key) * 0x9E3779B97F4A7C15) & MASK_64
+        x ^= x >> 31
+        x = (x * 0xBF58476D1CE4E5B9) & MASK_64
+        x ^= x >> 29
+        return x & self.half_mask
+
+    def encrypt_block(self, value: int):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self.round_function(right, round_key)
+        return (left << self.half_bits) | right
+
+    def decrypt_block(self, value: int):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_key in reversed(self.round_keys):
+            left, right = right ^ self.round_function(left, round_key), left
+        return (left << self.half_bits) | right
+
+    def permute(self, value: int):
+        """
+        Returns the image of `value`, also in [0, domain_size).
+        """
+        if not 0 <= value < self.domain_size:
+            raise ValueError("value must be in [0, %d)" % self.domain_size)
+        value = self.encrypt_block(value)
+        while value >= self.domain_size:
+            value = self.encrypt_block(value)
+        return value
+
+    def invert(self, value: int):
+        """
+        Returns the value whose image is `value`.
+        """
+        if not 0 <= value < self.domain_size:
+            raise ValueError("value must be in [0, %d)" % self.domain_size)
+        value = self.decrypt_block(value)
+        while value >= self.domain_size:
+            value = self.decrypt_block(value)
+        return value
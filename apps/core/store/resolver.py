@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def get_store_models():
+    """
+    Returns every concrete StoreModel subclass with a STORE_CODE_PREFIX.
+    """
+    from apps.core.store.models import StoreModel
+
+    return [
+        model for model in apps.get_models()
+        if issubclass(model, StoreModel) and model.STORE_CODE_PREFIX
+    ]
+
+
+class StoreCodeResolver(object):
+    """
+    Resolves bare store codes to their model and instance using the STORE_CODE_PREFIX.
+
+    Prefixes are matched longest first, since some prefixes start with others (USR and USRP).
+    A list of mixed codes is grouped by model and each group is fetched with one in_bulk query.
+    An optional per-process LRU cache keeps the most recent hits.
+    """
+
+    def __init__(self, cache_size=None, models=None):
+        """
+        Args:
+            cache_size (int): Instances kept in the LRU cache, 0 disables it. Defaults to
+                settings.STORE_CODE_RESOLVER_CACHE_SIZE.
+            models (iterable): Models to resolve to. Defaults to every StoreModel subclass.
+        """
+        self.cache_size = cache_size
+        self._models = models
+        self._prefixes = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cache_size(self):
+        if self.cache_size is None:
+            return getattr(settings, 'STORE_CODE_RESOLVER_CACHE_SIZE', 0)
+        return self.cache_size
+
+    def get_prefixes(self):
+        """
+        Returns a list of (prefix, model) pairs, longest prefix first.
+        """
+        if self._prefixes is None:
+            by_prefix = {}
+            for model in self._models if self._models is not None else get_store_models():
+                other = by_prefix.setdefault(model.STORE_CODE_PREFIX, model)
+                if other is not model:
+                    raise ImproperlyConfigured(
+                        "%s and %s share the store code prefix '%s'"
+                        % (other.__name__, model.__name__, model.STORE_CODE_PREFIX)
+                    )
+            self._prefixes = sorted(by_prefix.items(), key=lambda item: len(item[0]), reverse=True)
+        return self._prefixes
+
+    def resolve_model(self, code):
+        """
+        Returns the model whose prefix matches `code`, or None.
+        """
+        for prefix, model in self.get_prefixes():
+            if code.startswith(prefix):
+                return model
+        return None
+
+    def group_by_model(self, codes):
+        """
+        Returns a dict of model -> list of codes. Codes without a known prefix are left out.
+        """
+        groups = {}
+        for code in codes:
+            model = self.resolve_model(code)
+            if model is not None:
+                groups.setdefault(model, []).append(code)
+        return groups
+
+    def resolve_many(self, codes, include_removed=False):
+        """
+        Fetches the instances of a list of mixed store codes, one query per model.
+
+        Args:
+            codes (iterable): Store codes of any StoreModel subclass.
+            include_removed (bool): Whether soft deleted rows are returned.
+
+        Returns:
+            A dict of store code -> instance. Codes that were not found, and instances that are
+            not visible in the current context (see StoreModel.is_visible), are left out.
+        """
+        found = {}
+        cache_size = self.get_cache_size()
+        pending = []
+        with self._lock:
+            for code in dict.fromkeys(codes):
+                instance = self._cache.get((code, include_removed)) if cache_size else None
+                if instance is None:
+                    pending.append(code)
+                else:
+                    self._cache.move_to_end((code, include_removed))
+                    found[code] = instance
+
+        for model, model_codes in self.group_by_model(pending).items():
+            # Not scoped to the tenant, the cache is shared by all of them
+            queryset = model.all_objects.all() if include_removed else model.all_objects.filter(is_removed=False)
+            fetched = queryset.in_bulk(model_codes, field_name='store_code')
+            found.update(fetched)
+            if cache_size:
+                self._remember(fetched, include_removed, cache_size)
+        return {code: instance for code, instance in found.items() if instance.is_visible()}
+
+    def resolve(self, code, include_removed=False):
+        """
+        Returns the instance with store code `code`, or None.
+        """
+        return self.resolve_many([code], include_removed).get(code)
+
+    def _remember(self, instances, include_removed, cache_size):
+        with self._lock:
+            for code, instance in instances.items():
+                self._cache[(code, include_removed)] = instance
+                self._cache.move_to_end((code, include_removed))
+            while len(self._cache) > cache_size:
+                self._cache.popitem(last=False)
+
+    def forget(self, code):
+        """
+        Drops `code` from the LRU cache.
+        """
+        with self._lock:
+            self._cache.pop((code, False), None)
+            self._cache.pop((code, True), None)
+
+    def forget_many(self, codes):
+        """
+        Drops `codes` from the LRU cache.
+        """
+        with self._lock:
+            for code in codes:
+                self._cache.pop((code, False), None)
+                self._cache.pop((code, True), None)
+
+    def clear(self):
+        """
+        Drops the LRU cache and the prefix table.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._prefixes = None
+
+
+# Process wide resolver over every StoreModel subclass
+store_code_resolver = StoreCodeResolver()
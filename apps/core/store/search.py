@@ -0,0 +1,129 @@
+"""
+Ranked search and prefix autocomplete over the SEARCH_FIELDS of a StoreModel.
+
+On Postgres each searchable model has a `search_vector` tsvector column that a trigger
+keeps current, with a GIN index, and a pg_trgm GIN index on its weight 'A' fields; the
+setup_search command creates them. search() matches every word of the query as a prefix
+of a word of the row (tsquery 'word:*'), or a weight 'A' field similar to the whole query
+(pg_trgm `%`, for typos), ranked by ts_rank plus trigram similarity.
+
+autocomplete() matches the start of the weight 'A' fields with one LIMIT query per field
+on the Upper(field) PrefixIndex, so it stops after `limit` index entries whatever the
+size of the table.
+
+Other databases (SQLite in tests and development) search with icontains and rank the rows
+whose weight 'A' fields start with the query first.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Upper
+from apps.core.store.indexes import prefix_order
+
+SEARCH_CONFIG = 'simple'
+AUTOCOMPLETE_MIN_LENGTH = 2
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+
+_TERM_RE = re.compile(r'\w+')
+# Separators also indexed as spaces, so 'doe' matches 'john.doe@example.com'
+_SEPARATORS = '@.-_+'
+
+
+def search_terms(text):
+    """
+    Returns the lowercase words of a search query.
+    """
+    return _TERM_RE.findall(text.lower())
+
+
+def prefix_tsquery(terms):
+    """
+    Returns a raw tsquery matching rows with a word starting with each of `terms`.
+    """
+    return ' & '.join('%s:*' % term for term in terms)
+
+
+def get_primary_fields(model):
+    return [field for field, weight in model.SEARCH_FIELDS if weight == 'A']
+
+
+def vector_sql(model, row='NEW'):
+    """
+    Returns the SQL expression of the search vector of `row`, used by the trigger and the
+    backfill of setup_search.
+    """
+    parts = []
+    for field, weight in model.SEARCH_FIELDS:
+        column = '%s.%s' % (row, model._meta.get_field(field).column)
+        parts.append(
+            "setweight(to_tsvector('{config}', coalesce({column}, '') || ' ' || "
+            "translate(coalesce({column}, ''), '{separators}', '{spaces}')), '{weight}')".format(
+                config=SEARCH_CONFIG, column=column, separators=_SEPARATORS,
+                spaces=' ' * len(_SEPARATORS), weight=weight,
+            )
+        )
+    return ' || '.join(parts)
+
+
+def search(queryset, text):
+    """
+    Returns the live rows of `queryset` matching `text`, best first, annotated with `rank`.
+    """
+    model = queryset.model
+    terms = search_terms(text)
+    if not terms or not model.SEARCH_FIELDS:
+        return queryset.none()
+    queryset = queryset.filter(is_removed=False)
+    primary = get_primary_fields(model)
+    phrase = ' '.join(terms)
+
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(prefix_tsquery(terms), config=SEARCH_CONFIG, search_type='raw')
+        condition = Q(search_vector=query)
+        rank = SearchRank(F('search_vector'), query)
+        for field in primary:
+            condition |= Q(**{'%s__trigram_similar' % field: phrase})
+            rank = rank + TrigramSimilarity(field, phrase)
+        return queryset.filter(condition).annotate(rank=rank).order_by('-rank', 'store_code')
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(*[Q(**{'%s__icontains' % field: term}) for field, _ in model.SEARCH_FIELDS], _connector=Q.OR)
+    rank = Value(0.0)
+    for field in primary:
+        rank = rank + Case(When(**{'%s__istartswith' % field: terms[0]}, then=Value(1.0)), default=Value(0.0))
+    return queryset.filter(condition).annotate(rank=rank).order_by('-rank', 'store_code')
+
+
+def prefix_matches(queryset, field, prefix):
+    """
+    Returns the rows of `queryset` whose `field` starts with `prefix`, case insensitive, in
+    the order of the PrefixIndex on Upper(field): byte order on Postgres (C collation).
+    """
+    order = prefix_order(Upper(field), connections[queryset.db])
+    return queryset.filter(**{'%s__istartswith' % field: prefix}).order_by(order, 'store_code')
+
+
+def autocomplete(queryset, text, limit=DEFAULT_AUTOCOMPLETE_LIMIT):
+    """
+    Returns up to `limit` live rows of `queryset` whose weight 'A' fields start with `text`,
+    sorted by the matching value.
+
+    Each field reads its first `limit` matches in the order of its PrefixIndex (see
+    prefix_matches), and the lists are merged, so no match sorting before the ones returned
+    is left out.
+    """
+    prefix = text.strip()
+    if len(prefix) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+    queryset = queryset.filter(is_removed=False)
+    matches = {}
+    for field in get_primary_fields(queryset.model):
+        rows = prefix_matches(queryset, field, prefix)
+        for obj in rows[:limit]:
+            value = (str(getattr(obj, field)).upper(), obj.store_code)
+            if obj.pk not in matches or value < matches[obj.pk][0]:
+                matches[obj.pk] = (value, obj)
+    return [obj for _, obj in sorted(matches.values(), key=lambda match: match[0])][:limit]
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core.store.cache import store_model_cache
+from apps.core.store.history import get_history_action, record_history
+from apps.core.store.models import StoreHistory, StoreModel
+from apps.core.store.resolver import store_code_resolver
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def forget_resolved_instance(sender, instance, **kwargs):
+    """
+    Drops saved or deleted StoreModel instances from the resolver LRU cache.
+    """
+    if isinstance(instance, StoreModel):
+        store_code_resolver.forget(instance.store_code)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_instance(sender, instance, using=None, **kwargs):
+    """
+    Drops saved, soft deleted or deleted StoreModel instances from the read-through cache.
+    """
+    if isinstance(instance, StoreModel) and instance.store_code:
+        store_model_cache.invalidate(type(instance), instance.store_code, using=using)
+
+
+@receiver(post_save)
+def record_saved_instance(sender, instance, created, raw=False, using=None, **kwargs):
+    """
+    Records creations, updates, soft deletes and restores of models with STORE_HISTORY.
+    """
+    if isinstance(instance, StoreModel) and instance.STORE_HISTORY and not raw:
+        record_history([instance], get_history_action(instance, created), using=using)
+
+
+@receiver(post_delete)
+def record_deleted_instance(sender, instance, using=None, **kwargs):
+    """
+    Records hard deletes of models with STORE_HISTORY.
+    """
+    if isinstance(instance, StoreModel) and instance.STORE_HISTORY:
+        record_history([instance], StoreHistory.DELETE, using=using)
@@ -1,5 +1,14 @@
-from random import random, seed
+from random import Random
 import string
+from apps.core.store.permutation import FeistelPermutation
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, batches fall back to pure Python
+    numpy = None
+
+# Maximum number of draws gen_storecode_batch makes to fill a batch with unique codes
+MAX_BATCH_DRAWS = 10
 
 class StoreCodeGen(object):
     
@@ -11,10 +20,12 @@ class StoreCodeGen(object):
         len_second_charset=4,  # Length of the second charset
         base=36,  # Base used for encoding
         first_charset=string.digits,  # First charset used for encoding
-        second_charset="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNPQRSTUVWXYZ"  # Second charset used for encoding
+        second_charset="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNPQRSTUVWXYZ",  # Second charset used for encoding
+        permutation_key=None  # Key of the counter permutation, enables the permutation mode when set
     ):
-        # Seed the random number generator
-        seed(a=user_seed)
+        # Private random number generators, so the global random module is left untouched
+        self.random = Random(user_seed)
+        self.np_random = numpy.random.default_rng(user_seed) if numpy is not None else None
         # Prime number used for generating random numbers
         self.prime_num = 1679979167
         # Set the first and second charset
@@ -31,9 +42,21 @@ class StoreCodeGen(object):
         # Set the base used for encoding
         self.base = base
 
+        # Number of distinct codes: every first section combined with every second section
+        self.second_space = len(second_charset) ** len_second_charset
+        self.space_size = len(first_charset) ** len_first_charset * self.second_space
+        # In permutation mode counters are spread over the whole code space by a keyed bijection
+        self.permutation = FeistelPermutation(self.space_size, permutation_key) if permutation_key else None
+
     # Generate a random number using the random number generator
     def get_random_number(self):
-        return int((random() * self.prime_num) % (36 ** 6))
+        return int((self.random.random() * self.prime_num) % (36 ** 6))
+
+    # Generate `n` random numbers at once, the same way get_random_number does
+    def get_random_numbers(self, n: int):
+        if self.np_random is not None:
+            return ((self.np_random.random(n) * self.prime_num) % (36 ** 6)).astype(numpy.int64)
+        return [self.get_random_number() for _ in range(n)]
 
     # Encode a number using the provided base and charset
     def encode_section(
@@ -55,10 +78,44 @@ class StoreCodeGen(object):
         result.reverse()
         return ''.join(result)
 
-    # Generate a store code with an optional prefix
-    def gen_storecode(self, prefix=''):
-        # Generate a random number
-        num = self.get_random_number()
+    # Encode an array of numbers at once, digit by digit, with NumPy array arithmetic
+    def encode_section_batch(
+        self,
+        values,  # The numbers to encode
+        base: int,  # The base to use for encoding
+        charset: str,  # The charset to use for encoding
+        section_len: int  # The length of the encoding
+    ):
+        values = numpy.asarray(values, dtype=numpy.int64)
+        chars = numpy.array(list(charset))
+        result = numpy.empty((len(values), section_len), dtype='<U1')
+        # Fill the columns from the least significant digit, as encode_section does
+        for c in range(section_len - 1, -1, -1):
+            values, remainder = numpy.divmod(values, base)
+            result[:, c] = chars[remainder]
+        # View each row of single characters as one string
+        return result.view('<U%d' % section_len).ravel()
+
+    # Encode a list of numbers as store codes with an optional prefix
+    def encode_storecode_batch(self, nums, prefix=''):
+        if numpy is None:
+            return [self.encode_storecode(int(num), prefix) for num in nums]
+        first_sections = self.encode_section_batch(
+            nums,
+            len(self.first_charset),
+            self.first_charset,
+            self.len_first_charset
+        )
+        second_sections = self.encode_section_batch(
+            nums,
+            len(self.second_charset),
+            self.second_charset,
+            self.len_second_charset
+        )
+        return (prefix + numpy.char.add(first_sections, second_sections).astype(object)).tolist()
+
+    # Encode a given number as a store code with an optional prefix
+    def encode_storecode(self, num: int, prefix=''):
         # Encode the first section using the first charset and length
         first_section = self.encode_section(
             num,
@@ -79,3 +136,50 @@ class StoreCodeGen(object):
         # Otherwise, concatenate only the first and second sections
         else:
             return '%s%s' % (first_section, second_section)
+
+    # Encode an index of the code space, so that every index in [0, space_size) gives a distinct code
+    def encode_index(self, index: int, prefix=''):
+        first, second = divmod(index, self.second_space)
+        first_section = self.encode_section(
+            first,
+            len(self.first_charset),
+            self.first_charset,
+            self.len_first_charset
+        )
+        second_section = self.encode_section(
+            second,
+            len(self.second_charset),
+            self.second_charset,
+            self.len_second_charset
+        )
+        return '%s%s%s' % (prefix, first_section, second_section)
+
+    # Encode a counter value as a store code. Distinct counters always give distinct codes:
+    # in permutation mode the counter goes through the keyed bijection first, otherwise
+    # it is encoded as it is
+    def encode_counter(self, counter: int, prefix=''):
+        if self.permutation is not None:
+            return self.encode_index(self.permutation.permute(counter), prefix)
+        return self.encode_storecode(counter, prefix)
+
+    # Generate a store code with an optional prefix
+    def gen_storecode(self, prefix=''):
+        # Generate a random number and encode it
+        return self.encode_storecode(self.get_random_number(), prefix)
+
+    # Generate `n` store codes, unique within the batch, with an optional prefix
+    def gen_storecode_batch(self, n: int, prefix=''):
+        codes = []
+        seen = set()
+        # Draw again only for the codes lost to repetitions
+        for _ in range(MAX_BATCH_DRAWS):
+            missing = n - len(codes)
+            if missing <= 0:
+                return codes
+            for code in self.encode_storecode_batch(self.get_random_numbers(missing), prefix):
+                if code not in seen:
+                    seen.add(code)
+                    codes.append(code)
+        if len(codes) < n:
+            raise ValueError("Could not generate %d unique store codes" % n)
+        return codes
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.apps import apps
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.core.store.archive import archive_removed
+from apps.core.store.cache import store_model_cache
+from apps.core.store.history import refresh_daily_aggregate
+from apps.core.store.resolver import get_store_models
+
+# Import commands runnable by import_file, by model label
+IMPORT_COMMANDS = {
+    'company.Company': 'import_companies',
+    'users.CustomUser': 'import_users',
+}
+
+
+def get_models(labels=None):
+    return [apps.get_model(label) for label in labels] if labels else get_store_models()
+
+
+@shared_task(rate_limit='6/m')
+def archive_removed_rows(model_label, days=90, batch_size=500, max_batches=20):
+    """
+    Archives up to `max_batches` batches of soft deleted rows of one model, and queues itself
+    again while rows are left, so no single task holds a worker for long.
+    """
+    archived = archive_removed(apps.get_model(model_label), days, batch_size, max_batches)
+    if archived >= batch_size * max_batches:
+        archive_removed_rows.apply_async((model_label, days, batch_size, max_batches))
+    return archived
+
+
+@shared_task
+def archive_all_removed(days=90, batch_size=500, max_batches=20):
+    """
+    Queues the archival of every StoreModel, one task per model.
+    """
+    for model in get_store_models():
+        archive_removed_rows.delay(model._meta.label, days, batch_size, max_batches)
+
+
+@shared_task
+def warm_store_cache(model_labels=None, hours=24, limit=5000, chunk_size=500):
+    """
+    Loads the live rows modified in the last `hours` hours into the read-through cache, newest
+    first, so the first requests after a deploy or a cache flush do not all miss.
+
+    Returns:
+        The number of rows loaded or already cached.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    warmed = 0
+    for model in get_models(model_labels):
+        codes = list(
+            model.available_objects.filter(modified__gte=since).order_by('-modified')
+            .values_list('store_code', flat=True)[:limit]
+        )
+        for start in range(0, len(codes), chunk_size):
+            warmed += len(store_model_cache.get_many(model, codes[start:start + chunk_size]))
+    return warmed
+
+
+@shared_task
+def refresh_history_aggregate(days=3):
+    """
+    Refreshes the recent days of the StoreHistory daily aggregate, skipped when there is none.
+    """
+    return refresh_daily_aggregate(days)
+
+
+@shared_task(bind=True, rate_limit='2/m', max_retries=5, acks_late=True)
+def import_file(self, model_label, path, format=None, batch_size=2000, checkpoint=None):
+    """
+    Runs the import command of `model_label` on a file the workers can read.
+
+    With a checkpoint file a retried or restarted task resumes where the last one stopped.
+    """
+    options = {'batch_size': batch_size}
+    if format:
+        options['format'] = format
+    if checkpoint:
+        options['checkpoint'] = checkpoint
+    try:
+        call_command(IMPORT_COMMANDS[model_label], path, **options)
+    except OSError as e:
+        raise self.retry(exc=e, countdown=60)
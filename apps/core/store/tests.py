@@ -1,5 +1,16 @@
 import pytest
+import random
+from types import SimpleNamespace
+from . import store_code_gen
 from .store_code_gen import StoreCodeGen
+from .allocator import StoreCodeAllocator
+from .managers import find_conflicting_indexes
+from .permutation import FeistelPermutation
+from .validators import StoreCodeValidator
+from .resolver import StoreCodeResolver
+from .cache import LocalTTLCache, StoreModelCache
+from .transfer import Checkpoint, RowWriter, chunked, import_rows, read_rows
+from django.core.exceptions import ValidationError
 
 user_seed = 1234
 
@@ -122,3 +133,1371 @@ def test_uni_varying_prefix_returns_prefix(prefix):
     storecode = StoreCodeGen(user_seed=user_seed)
     assert prefix == storecode.gen_storecode(prefix)[:len(prefix)]
     assert_store_code(storecode.gen_storecode(prefix)[len(prefix):])
+
+
+#
+# ALLOCATOR
+#
+
+
+class FakeReservation(object):
+    """
+    Helper that hands out consecutive counter blocks and records every reservation.
+    """
+
+    def __init__(self):
+        self.next_value = 0
+        self.calls = []
+
+    def __call__(self, prefix, size):
+        self.calls.append((prefix, size))
+        start = self.next_value
+        self.next_value += size
+        return range(start, start + size)
+
+
+def test_uni_allocator_reserves_one_block_per_block_size_codes():
+    """
+    Test function that verifies the allocator only reserves a new block when the pool runs dry.
+    """
+    reservation = FakeReservation()
+    allocator = StoreCodeAllocator(block_size=10, reserve_block=reservation)
+    codes = [allocator.allocate('COMP') for _ in range(25)]
+    assert len(reservation.calls) == 3
+    assert len(set(codes)) == 25
+    for code in codes:
+        assert code.startswith('COMP')
+        assert_store_code(code[len('COMP'):])
+
+
+def test_uni_allocator_keeps_one_pool_per_prefix():
+    """
+    Test function that verifies each prefix is served from its own pool.
+    """
+    reservation = FakeReservation()
+    allocator = StoreCodeAllocator(block_size=5, reserve_block=reservation)
+    allocator.allocate('USR')
+    allocator.allocate('USRP')
+    assert [prefix for prefix, _ in reservation.calls] == ['USR', 'USRP']
+
+
+def test_uni_allocator_allocate_many_reserves_whole_batch_at_once():
+    """
+    Test function that verifies a batch larger than the block size is reserved in one call.
+    """
+    reservation = FakeReservation()
+    allocator = StoreCodeAllocator(block_size=10, reserve_block=reservation)
+    codes = allocator.allocate_many('COMP', 42)
+    assert reservation.calls == [('COMP', 42)]
+    assert len(set(codes)) == 42
+
+
+def test_uni_allocator_async_matches_sync_codes():
+    """
+    Test function that verifies aallocate hands out the same sequence as allocate, serving pooled
+    counters on the event loop and reserving through the sync thread only when the pool runs dry.
+    """
+    import asyncio
+
+    async def allocate_all(allocator):
+        return [await allocator.aallocate('COMP') for _ in range(12)]
+
+    reservation = FakeReservation()
+    codes = asyncio.run(allocate_all(StoreCodeAllocator(block_size=5, reserve_block=reservation)))
+    sync_allocator = StoreCodeAllocator(block_size=5, reserve_block=FakeReservation())
+    assert codes == [sync_allocator.allocate('COMP') for _ in range(12)]
+    assert len(reservation.calls) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_uni_allocator_drops_blocks_reserved_in_rolled_back_transactions():
+    """
+    Test function that verifies the spare counters of a block reserved inside a transaction
+    that rolls back are not pooled, as the reservation table hands them out again.
+    """
+    from django.db import transaction
+
+    allocator = StoreCodeAllocator(block_size=5)
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            allocator.allocate_numbers('COMP', 1)
+            raise RuntimeError
+    assert allocator.allocate_numbers('COMP', 10) == list(range(10))
+
+    with transaction.atomic():
+        assert allocator.allocate_numbers('COMP', 1) == [10]
+    assert allocator.allocate_numbers('COMP', 4) == [11, 12, 13, 14]
+
+
+#
+# BULK CREATE
+#
+
+
+@pytest.mark.parametrize("codes, existing, answer", [
+    (['A', 'B', 'C'], set(), []),  # No conflicts
+    (['A', 'B', 'C'], {'B'}, [1]),  # Code already in the table
+    (['A', 'B', 'A', 'A'], set(), [2, 3]),  # Repeated codes keep their first occurrence
+    (['A', 'B', 'A'], {'A'}, [0, 2]),  # Repeated code that is also in the table
+])
+def test_uni_find_conflicting_indexes(codes, existing, answer):
+    """
+    Test function that verifies which positions of a batch must get a new store code.
+    :param codes: The store codes of the batch
+    :param existing: The store codes already in the table
+    :param answer: The expected conflicting positions
+    """
+    assert find_conflicting_indexes(codes, existing) == answer
+
+
+@pytest.mark.django_db
+def test_uni_bulk_create_coded_regenerates_taken_codes(monkeypatch):
+    """
+    Test function that verifies generated codes already in the table are replaced before the
+    insert, while a taken code given by the caller raises.
+    :param monkeypatch: Pytest fixture that makes the allocator hand out a taken code
+    """
+    from apps.core.company.models import Company
+    from . import managers
+
+    taken = Company.objects.create(name='taken')
+    codes = iter([[taken.store_code, 'COMP000000001abcd'], ['COMP000000002abcd']])
+    monkeypatch.setattr(managers.store_code_allocator, 'allocate_many', lambda prefix, n: next(codes) if n else [])
+
+    created = Company.objects.bulk_create_coded([Company(name='first'), Company(name='second')])
+    assert [company.store_code for company in created] == ['COMP000000002abcd', 'COMP000000001abcd']
+    assert Company.all_objects.get(store_code=taken.store_code).name == 'taken'
+    assert Company.all_objects.count() == 3
+
+    with pytest.raises(ValidationError):
+        Company.objects.bulk_create_coded([Company(store_code=taken.store_code, name='given')])
+    assert Company.all_objects.count() == 3
+
+
+#
+# BATCH GENERATION
+#
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+@pytest.mark.parametrize("prefix", ['COMP', ''])
+def test_uni_batch_returns_unique_codes_with_prefix(monkeypatch, use_numpy, prefix):
+    """
+    Test function that verifies the batch API returns the requested number of unique,
+    well formed store codes, with and without NumPy.
+    :param use_numpy: Whether the NumPy path is used
+    :param prefix: The prefix to add to the store codes
+    """
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(store_code_gen, "numpy", None)
+    codes = StoreCodeGen(user_seed=user_seed).gen_storecode_batch(500, prefix)
+    assert len(codes) == len(set(codes)) == 500
+    for code in codes:
+        assert code.startswith(prefix)
+        assert_store_code(code[len(prefix):])
+
+
+def test_uni_batch_encoding_matches_single_encoding():
+    """
+    Test function that verifies the vectorized encoding gives the same codes as encode_storecode.
+    """
+    pytest.importorskip("numpy")
+    storecode = StoreCodeGen(user_seed=user_seed)
+    nums = [0, 1, 50, 51, 999999999, 1000000000, 36 ** 6 - 1]
+    assert storecode.encode_storecode_batch(nums, 'USR') == [storecode.encode_storecode(n, 'USR') for n in nums]
+
+
+def test_uni_generator_does_not_reseed_global_random():
+    """
+    Test function that verifies building a seeded generator leaves the global random module alone.
+    """
+    random.seed(42)
+    expected = random.random()
+    random.seed(42)
+    StoreCodeGen(user_seed=user_seed).gen_storecode_batch(10)
+    assert random.random() == expected
+
+
+#
+# PERMUTATION MODE
+#
+
+
+@pytest.mark.parametrize("domain_size", [2, 7, 1000, 4096])
+def test_uni_feistel_permutation_is_a_bijection(domain_size):
+    """
+    Test function that verifies the permutation maps the domain onto itself without repetitions
+    and that invert undoes it.
+    :param domain_size: The number of values in the domain
+    """
+    permutation = FeistelPermutation(domain_size, key='test-key')
+    images = [permutation.permute(x) for x in range(domain_size)]
+    assert sorted(images) == list(range(domain_size))
+    assert [permutation.invert(y) for y in images] == list(range(domain_size))
+
+
+def test_uni_feistel_permutation_depends_on_key():
+    """
+    Test function that verifies different keys select different permutations.
+    """
+    first = FeistelPermutation(10 ** 6, key='first')
+    second = FeistelPermutation(10 ** 6, key='second')
+    assert [first.permute(x) for x in range(20)] != [second.permute(x) for x in range(20)]
+
+
+def test_uni_feistel_permutation_rejects_values_outside_domain():
+    """
+    Test function that verifies values outside the domain raise a ValueError.
+    """
+    with pytest.raises(ValueError):
+        FeistelPermutation(100, key='test-key').permute(100)
+
+
+def test_uni_permutation_mode_counters_give_distinct_codes():
+    """
+    Test function that verifies consecutive counters give distinct, well formed and
+    non consecutive store codes in permutation mode.
+    """
+    storecode = StoreCodeGen(permutation_key='test-key')
+    codes = [storecode.encode_counter(counter, 'COMP') for counter in range(2000)]
+    assert len(set(codes)) == 2000
+    assert codes != sorted(codes)
+    for code in codes:
+        assert len(code) == len('COMP') + 9 + 4
+        assert_store_code(code[len('COMP'):])
+
+
+def test_uni_permutation_mode_covers_small_code_space():
+    """
+    Test function that verifies every code of a small code space is reached exactly once.
+    """
+    storecode = StoreCodeGen(len_first_charset=2, len_second_charset=1, permutation_key='test-key')
+    codes = {storecode.encode_counter(counter) for counter in range(storecode.space_size)}
+    assert len(codes) == storecode.space_size == 100 * 51
+
+
+#
+# VALIDATION
+#
+
+
+@pytest.mark.parametrize("prefix, code, answer", [
+    ('COMP', 'COMP123456789abcd', True),  # Generator layout with 9 digits
+    ('COMP', 'COMP12345PQxz', True),  # Generator layout with 5 digits
+    ('COMP', 'COMP123456789Aabcd', True),  # Legacy layout
+    ('COMP', 'COMP123456789Oabcd', False),  # Legacy layout can not start with O
+    ('COMP', 'COMP123456789abOd', False),  # O is not in the generator charset
+    ('COMP', 'COMP1234567abcd', False),  # 7 digits
+    ('COMP', 'COMP123456789abc', False),  # 3 letters
+    ('COMP', 'COMP123456789abc1', False),  # Digit in the letter section
+    ('COMP', 'USR123456789abcd', False),  # Another prefix
+    ('USR', 'USRP123456789abcd', False),  # Longer prefix that starts with this one
+    ('USRP', 'USRP123456789abcd', True),
+    ('USR', 'USR123456789abcd\n', False),  # Trailing new line
+    ('USR', 'USR12345678\u0662abcd', False),  # Non ASCII digit
+    ('USR', None, False),
+])
+def test_uni_store_code_validator(prefix, code, answer):
+    """
+    Test function that verifies the structural check, the regular expression and the callable
+    agree on which store codes are valid.
+    :param prefix: The prefix of the validator
+    :param code: The store code to validate
+    :param answer: Whether the code is valid
+    """
+    validator = StoreCodeValidator(prefix)
+    assert validator.is_valid(code) == answer
+    assert validator.matches(code) == answer
+    if answer:
+        validator(code)
+    else:
+        with pytest.raises(ValidationError):
+            validator(code)
+
+
+def test_uni_store_code_validator_accepts_generated_codes():
+    """
+    Test function that verifies codes from both generator modes pass validation in a batch.
+    """
+    validator = StoreCodeValidator('COMP')
+    codes = StoreCodeGen(user_seed=user_seed).gen_storecode_batch(200, 'COMP')
+    codes += [StoreCodeGen(permutation_key='test-key').encode_counter(n, 'COMP') for n in range(200)]
+    assert all(validator.validate_many(codes))
+
+
+#
+# PREFIX RESOLVER
+#
+
+
+class FakeManager(object):
+    """
+    Helper manager that serves in_bulk from a dict and counts the queries.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def db_manager(self, using):
+        return self
+
+    def all(self):
+        return self
+
+    def filter(self, **lookups):
+        return self
+
+    def in_bulk(self, codes, field_name='pk'):
+        self.queries += 1
+        return {code: self.rows[code] for code in codes if code in self.rows}
+
+
+class FakeRow(tuple):
+    """
+    Helper row, a (prefix, code) pair visible in every context.
+    """
+
+    def is_visible(self):
+        return True
+
+
+def fake_store_model(prefix, codes):
+    """
+    Helper function that builds a class with the attributes the resolver uses.
+    """
+    rows = {code: FakeRow((prefix, code)) for code in codes}
+    manager = FakeManager(rows)
+    return type('Model%s' % prefix, (object,), {
+        'STORE_CODE_PREFIX': prefix,
+        '_meta': SimpleNamespace(app_label='store', label_lower='store.model%s' % prefix.lower()),
+        'available_objects': manager,
+        'all_objects': manager,
+    })
+
+
+user_model = fake_store_model('USR', ['USR000000001abcd', 'USR000000002abcd'])
+profile_model = fake_store_model('USRP', ['USRP000000001abcd'])
+company_model = fake_store_model('COMP', ['COMP000000001abcd'])
+
+
+@pytest.mark.parametrize("code, model", [
+    ('USR000000001abcd', user_model),
+    ('USRP000000001abcd', profile_model),  # Longest prefix wins
+    ('COMP000000001abcd', company_model),
+    ('SHOP000000001abcd', None),
+])
+def test_uni_resolver_matches_longest_prefix(code, model):
+    """
+    Test function that verifies each store code resolves to the model with the longest matching prefix.
+    :param code: The store code to resolve
+    :param model: The expected model
+    """
+    resolver = StoreCodeResolver(cache_size=0, models=[user_model, company_model, profile_model])
+    assert resolver.resolve_model(code) is model
+
+
+def test_uni_resolver_fetches_one_query_per_model():
+    """
+    Test function that verifies mixed codes are grouped and fetched with one query per model,
+    and that the LRU cache answers repeated codes.
+    """
+    for model in (user_model, profile_model, company_model):
+        model.available_objects.queries = 0
+    resolver = StoreCodeResolver(cache_size=10, models=[user_model, company_model, profile_model])
+    codes = ['USR000000001abcd', 'USRP000000001abcd', 'USR000000002abcd', 'COMP000000001abcd', 'SHOP1']
+    found = resolver.resolve_many(codes)
+    assert set(found) == set(codes[:4])
+    assert found['USRP000000001abcd'] == ('USRP', 'USRP000000001abcd')
+    assert [m.available_objects.queries for m in (user_model, profile_model, company_model)] == [1, 1, 1]
+    resolver.resolve_many(codes[:4])
+    assert [m.available_objects.queries for m in (user_model, profile_model, company_model)] == [1, 1, 1]
+    resolver.forget('USR000000001abcd')
+    resolver.resolve('USR000000001abcd')
+    assert user_model.available_objects.queries == 2
+
+
+#
+# CACHE
+#
+
+
+class FakeClock(object):
+    """
+    Helper clock that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_uni_local_cache_expires_entries():
+    """
+    Test function that verifies local cache entries are dropped once their time to live passes.
+    """
+    clock = FakeClock()
+    local = LocalTTLCache(max_size=10, timeout=5, clock=clock)
+    local.set('a', 1)
+    clock.now = 4.9
+    assert local.get('a') == 1
+    clock.now = 5
+    assert local.get('a') is None
+    assert len(local) == 0
+
+
+def test_uni_local_cache_evicts_least_recently_used():
+    """
+    Test function that verifies the local cache evicts the least recently used entry when full.
+    """
+    local = LocalTTLCache(max_size=2, timeout=60)
+    local.set('a', 1)
+    local.set('b', 2)
+    local.get('a')
+    local.set('c', 3)
+    assert local.get('b') is None
+    assert (local.get('a'), local.get('c')) == (1, 3)
+
+
+def test_uni_store_cache_reads_through_both_tiers():
+    """
+    Test function that verifies missing codes are fetched with one query and then answered
+    by the shared and local tiers, and that invalidated codes are fetched again.
+    """
+    from django.core.cache.backends.locmem import LocMemCache
+
+    model = fake_store_model('CCH', ['CCH000000001abcd', 'CCH000000002abcd'])
+    shared = LocMemCache('store-cache-test', {})
+    store_cache = StoreModelCache(cache=shared, timeout=60, local_cache=LocalTTLCache(10, 60))
+    codes = ['CCH000000001abcd', 'CCH000000002abcd', 'CCH000000003abcd']
+    found = store_cache.get_many(model, codes)
+    assert found == {code: ('CCH', code) for code in codes[:2]}
+    assert model.available_objects.queries == 1
+
+    assert store_cache.get(model, 'CCH000000001abcd') == ('CCH', 'CCH000000001abcd')
+    store_cache.local.clear()
+    assert store_cache.get_many(model, codes[:2]) == found
+    assert model.available_objects.queries == 1
+
+    store_cache._delete(store_cache.make_key(model, 'CCH000000002abcd'))
+    assert store_cache.get(model, 'CCH000000002abcd') == ('CCH', 'CCH000000002abcd')
+    assert model.available_objects.queries == 2
+    assert shared.get(store_cache.make_key(model, 'CCH000000002abcd') + ':lock') is None
+
+
+@pytest.mark.django_db
+def test_uni_store_cache_forgets_rows_changed_by_queryset_update():
+    """
+    Test function that verifies rows changed with QuerySet.update() or soft deleted with
+    QuerySet.delete(), which send no model signals, are not served stale from the cache.
+    """
+    from apps.core.company.models import Company
+
+    company = Company.objects.create(name='before')
+    assert Company.get_cached(company.store_code).name == 'before'
+    Company.objects.filter(pk=company.pk).update(name='after')
+    assert Company.get_cached(company.store_code).name == 'after'
+    Company.objects.filter(pk=company.pk).delete()
+    assert Company.get_cached(company.store_code) is None
+
+
+@pytest.mark.django_db
+def test_uni_large_queryset_update_clears_the_local_caches(settings, monkeypatch):
+    """
+    Test function that verifies an update of more than STORE_INVALIDATE_LIMIT rows reads no more
+    codes than the limit and clears the in-process caches instead of dropping each key.
+    :param settings: Pytest-django fixture used to lower the limit
+    :param monkeypatch: Pytest fixture used to record the invalidations
+    """
+    from apps.core.company.models import Company
+    from apps.core.store.cache import store_model_cache
+    from apps.core.store.resolver import store_code_resolver
+
+    calls = []
+    monkeypatch.setattr(store_model_cache, 'invalidate_many', lambda *args, **kwargs: calls.append('keys'))
+    monkeypatch.setattr(store_model_cache, 'clear_local', lambda **kwargs: calls.append('local'))
+    monkeypatch.setattr(store_code_resolver, 'clear', lambda: calls.append('resolver'))
+    for i in range(3):
+        Company.available_objects.create(name='company%d' % i)
+
+    settings.STORE_INVALIDATE_LIMIT = 3
+    assert Company.available_objects.update(name='renamed') == 3
+    settings.STORE_INVALIDATE_LIMIT = 2
+    assert Company.available_objects.update(name='again') == 3
+    assert calls == ['keys', 'local', 'resolver']
+
+
+#
+# IMPORT / EXPORT
+#
+
+
+@pytest.mark.parametrize("format", ['csv', 'jsonl'])
+def test_uni_row_writer_round_trip(tmp_path, format):
+    """
+    Test function that verifies rows written as CSV or JSONL read back as dicts, empty CSV cells left out.
+    :param tmp_path: Pytest fixture with a temporary directory
+    :param format: The file format
+    """
+    path = str(tmp_path / ('rows.' + format))
+    with open(path, 'w', newline='') as stream:
+        writer = RowWriter(stream, ['store_code', 'name'], format)
+        writer.write(('COMP000000001abcd', 'Acme'))
+        writer.write(('COMP000000002abcd', None))
+    rows = list(read_rows(path))
+    assert rows[0] == {'store_code': 'COMP000000001abcd', 'name': 'Acme'}
+    assert rows[1]['store_code'] == 'COMP000000002abcd'
+    assert rows[1].get('name') is None
+
+
+def test_uni_import_rows_resumes_from_checkpoint(tmp_path):
+    """
+    Test function that verifies an interrupted import resumes after the last finished chunk.
+    :param tmp_path: Pytest fixture with a temporary directory
+    """
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.json'))
+    inserted = []
+
+    def build(chunk):
+        return [(number, row) for number, row in chunk if row % 7], [(number, 'bad') for number, row in chunk if not row % 7]
+
+    def insert(items):
+        if any(row == 12 for _, row in items) and not inserted[-1:] == ['retry']:
+            inserted.append('retry')
+            raise KeyboardInterrupt
+        inserted.extend(row for _, row in items)
+        return []
+
+    with pytest.raises(KeyboardInterrupt):
+        import_rows(iter(range(1, 21)), build, insert, batch_size=5, checkpoint=checkpoint)
+    assert checkpoint.load() == {'position': 10}
+
+    imported, failures = import_rows(iter(range(1, 21)), build, insert, batch_size=5, checkpoint=checkpoint)
+    assert imported == 9
+    assert failures == [(14, 'bad')]
+    assert [row for row in inserted if row != 'retry'] == [n for n in range(1, 21) if n % 7]
+    assert checkpoint.load() == {}
+
+
+def test_uni_chunked_splits_lazily():
+    """
+    Test function that verifies chunked yields lists of at most the given size without reading ahead.
+    """
+    consumed = []
+    source = (consumed.append(n) or n for n in range(7))
+    chunks = chunked(source, 3)
+    assert next(chunks) == [0, 1, 2]
+    assert consumed == [0, 1, 2]
+    assert list(chunks) == [[3, 4, 5], [6]]
+
+
+#
+# REPLICA ROUTING
+#
+
+
+def test_uni_router_reads_replica_until_a_write(settings):
+    """
+    Test function that verifies reads go to a replica until the request writes, and stay on the
+    primary afterwards or inside use_primary.
+    :param settings: Pytest-django fixture used to declare a replica
+    """
+    from ecommerce.routers import ReplicaRouter, RoutingState, _routing_state, use_primary
+
+    settings.DATABASE_REPLICAS = ['replica1']
+    router = ReplicaRouter()
+    model = fake_store_model('RTR', [])
+    other = type('Other', (object,), {'_meta': SimpleNamespace(app_label='auth')})
+
+    token = _routing_state.set(RoutingState())
+    try:
+        assert router.db_for_read(model) == 'replica1'
+        assert router.db_for_read(other) is None
+        assert router.db_for_write(model) == 'default'
+        assert router.db_for_read(model) == 'default'
+        assert _routing_state.get().wrote
+    finally:
+        _routing_state.reset(token)
+    assert router.db_for_read(model) == 'replica1'
+    with use_primary():
+        assert router.db_for_read(model) == 'default'
+    assert router.allow_migrate('replica1', 'store') is False
+    settings.DATABASE_REPLICAS = []
+    assert router.db_for_read(model) == 'default'
+
+
+def test_uni_router_primary_hint_reads_the_primary_without_pinning(settings):
+    """
+    Test function that verifies a read with the primary hint goes to the primary, and leaves the
+    following reads of the request on the replicas.
+    :param settings: Pytest-django fixture used to declare a replica
+    """
+    from ecommerce.routers import ReplicaRouter, RoutingState, _routing_state
+
+    settings.DATABASE_REPLICAS = ['replica1']
+    router = ReplicaRouter()
+    model = fake_store_model('RTP', [])
+
+    token = _routing_state.set(RoutingState())
+    try:
+        assert router.db_for_read(model, primary=True) == 'default'
+        assert router.db_for_read(model) == 'replica1'
+        state = _routing_state.get()
+        assert not state.pinned and not state.wrote
+    finally:
+        _routing_state.reset(token)
+
+
+#
+# ARCHIVAL
+#
+
+
+@pytest.mark.django_db
+def test_uni_archive_moves_removed_rows_with_their_cascade():
+    """
+    Test function that verifies removed rows are archived with the rows their deletion cascades
+    to, while rows with live dependants or removed too recently are left in place.
+    """
+    from datetime import timedelta
+    from django.contrib.auth.models import Group
+    from django.utils import timezone
+    from apps.core.users.models import CustomUser, UserProfile
+    from .archive import archive_removed
+    from .models import ArchivedStoreRecord
+
+    users = [CustomUser.objects.create_user('u%d' % i, 'u%d@example.com' % i, 'p', user_type='CLI') for i in range(4)]
+    profiles = [UserProfile.objects.create(user=user) for user in users]
+    group = Group.objects.create(name='archived')
+    users[0].groups.add(group)
+
+    # u0 goes with its removed profile and group link, u1 has a live profile, u2 was just removed
+    profiles[0].delete()
+    CustomUser.available_objects.filter(username__in=['u0', 'u1', 'u2']).delete()
+    assert all(CustomUser.all_objects.filter(username__in=['u0', 'u1', 'u2']).values_list('removed_at', flat=True))
+    long_ago = timezone.now() - timedelta(days=100)
+    CustomUser.all_objects.filter(username__in=['u0', 'u1']).update(removed_at=long_ago)
+    UserProfile.all_objects.filter(pk=profiles[0].pk).update(removed_at=long_ago)
+
+    assert archive_removed(CustomUser, 90, batch_size=1) == 1
+    assert set(CustomUser.all_objects.values_list('username', flat=True)) == {'u1', 'u2', 'u3'}
+    records = {record.model: record for record in ArchivedStoreRecord.objects.all()}
+    assert set(records) == {'users.CustomUser', 'users.UserProfile'}
+    assert records['users.CustomUser'].removed_at == long_ago
+    assert records['users.CustomUser'].data['_related']['users.CustomUser_groups'][0]['group_id'] == group.pk
+    assert records['users.UserProfile'].data['user_id'] == users[0].store_code
+
+    restored = CustomUser.all_objects.get(username='u2')
+    restored.is_removed = False
+    restored.save(update_fields=['is_removed'])
+    assert CustomUser.all_objects.get(username='u2').removed_at is None
+
+
+@pytest.mark.django_db
+def test_uni_archive_skips_protected_rows(monkeypatch):
+    """
+    Test function that verifies a row behind a protected relation is skipped without stopping
+    the archival of the others.
+    :param monkeypatch: Pytest fixture that protects one of the rows
+    """
+    from datetime import timedelta
+    from django.db.models import ProtectedError
+    from django.utils import timezone
+    from apps.core.company.models import Company
+    from . import archive
+
+    class ProtectingCollector(archive.Collector):
+        def collect(self, objs, **kwargs):
+            if objs[0].name == 'protected':
+                raise ProtectedError('Protected', set(objs))
+            return super().collect(objs, **kwargs)
+
+    monkeypatch.setattr(archive, 'Collector', ProtectingCollector)
+    for name in ('protected', 'archived'):
+        Company.objects.create(name=name).delete()
+    Company.all_objects.update(removed_at=timezone.now() - timedelta(days=100))
+
+    assert archive.archive_removed(Company, 90) == 1
+    assert list(Company.all_objects.values_list('name', flat=True)) == ['protected']
+
+
+#
+# HISTORY
+#
+
+
+@pytest.mark.django_db
+def test_uni_history_records_each_kind_of_change():
+    """
+    Test function that verifies creations, updates, soft deletes, restores and hard deletes of a
+    model with STORE_HISTORY are recorded with the values of the row after the change.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from apps.core.company.models import Company
+    from .history import daily_counts
+    from .models import StoreHistory
+
+    company = Company.objects.create(name='first')
+    company.name = 'second'
+    company.save()
+    company.delete()
+    restored = Company.all_objects.get(pk=company.pk)
+    restored.is_removed = False
+    restored.save()
+    restored.delete(soft=False)
+
+    history = list(StoreHistory.objects.for_instance(company).order_by('time', 'id'))
+    assert [row.action for row in history] == [
+        StoreHistory.CREATE, StoreHistory.UPDATE, StoreHistory.SOFT_DELETE, StoreHistory.RESTORE, StoreHistory.DELETE,
+    ]
+    assert [row.changes['name'] for row in history] == ['first', 'second', 'second', 'second', 'second']
+    assert [row.changes['is_removed'] for row in history] == [False, False, True, False, False]
+
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    assert daily_counts(Company) == [(today, 1)]
+    assert daily_counts(Company, StoreHistory.UPDATE, since=today + timedelta(days=1)) == []
+
+
+@pytest.mark.parametrize("created, loaded, removed, answer", [
+    (True, None, False, 'create'),
+    (False, False, False, 'update'),
+    (False, False, True, 'soft_delete'),
+    (False, True, False, 'restore'),
+    (False, True, True, 'update'),  # Changes to a row that stays removed
+    (False, None, True, 'update'),  # Instance not loaded from the database
+])
+def test_uni_history_action_of_a_save(created, loaded, removed, answer):
+    """
+    Test function that verifies the action recorded for a save from is_removed before and after.
+    :param created: Whether the save inserted the row
+    :param loaded: The is_removed the instance was loaded with, None when it was not loaded
+    :param removed: The is_removed of the instance when saved
+    :param answer: The expected action
+    """
+    from .history import get_history_action
+
+    instance = SimpleNamespace(is_removed=removed)
+    if loaded is not None:
+        instance._loaded_is_removed = loaded
+    assert get_history_action(instance, created) == answer
+
+
+#
+# BACKGROUND TASKS
+#
+
+
+def test_uni_archive_task_requeues_itself_while_rows_are_left(monkeypatch):
+    """
+    Test function that verifies the archive task queues itself again after a full run, and stops
+    after a partial one.
+    :param monkeypatch: Pytest fixture used to run the tasks eagerly and replace archive_removed
+    """
+    from apps.core.store import tasks
+
+    monkeypatch.setattr(tasks.archive_removed_rows.app.conf, 'task_always_eager', True)
+    results = [4, 1]
+    calls = []
+
+    def archive_removed(model, days, batch_size, max_batches):
+        calls.append(model)
+        return results[len(calls) - 1]
+
+    monkeypatch.setattr(tasks, 'archive_removed', archive_removed)
+    monkeypatch.setattr(tasks.apps, 'get_model', lambda label: label)
+    tasks.archive_removed_rows.delay('store.Fake', 90, 2, 2)
+    assert calls == ['store.Fake', 'store.Fake']
+
+
+#
+# QUERY PROFILING
+#
+
+
+@pytest.mark.parametrize("sql, answer", [
+    ('SELECT "a"."id" FROM "a" WHERE "a"."id" = %s', 'SELECT "a"."id" FROM "a" WHERE "a"."id" = ?'),
+    ("SELECT * FROM t1 WHERE code = 'X''Y' LIMIT 21", 'SELECT * FROM t1 WHERE code = ? LIMIT ?'),
+    ('SELECT * FROM t WHERE id IN (%s, %s, %s)', 'SELECT * FROM t WHERE id IN (...)'),
+])
+def test_uni_query_fingerprint(sql, answer):
+    """
+    Test function that verifies fingerprints drop the values of a query.
+    :param sql: Query to fingerprint
+    :param answer: Expected fingerprint
+    """
+    from ecommerce.profiling import fingerprint
+
+    assert fingerprint(sql) == answer
+    assert fingerprint(sql.replace('%s', '42')) == answer
+
+
+def test_uni_query_profile_flags_repeated_queries():
+    """
+    Test function that verifies a query run once per row of a loop is flagged as N+1 along with
+    the line that ran it, and a query run twice is only reported as a duplicate.
+    """
+    from ecommerce.profiling import _current_profile, profile_execute, profile_queries
+
+    def execute(sql, params, many, context):
+        return sql
+
+    with profile_queries(n_plus_one=3) as profile:
+        for user_id in range(4):
+            profile_execute(execute, 'SELECT * FROM "users_customuser" WHERE "id" = %s', (user_id,), False, {})
+        for _ in range(2):
+            profile_execute(execute, 'SELECT * FROM "company_company"', (), False, {})
+    profile_execute(execute, 'SELECT 1', (), False, {})
+    assert _current_profile.get() is None
+
+    data = profile.as_dict()
+    assert (data['queries'], data['unique_queries'], data['n_plus_one']) == (6, 2, 1)
+    n_plus_one, duplicate = data['duplicates']
+    assert (n_plus_one['table'], n_plus_one['count'], n_plus_one['n_plus_one']) == ('users_customuser', 4, True)
+    assert n_plus_one['caller'].startswith('apps/core/store/tests.py:')
+    assert (duplicate['table'], duplicate['count'], duplicate['n_plus_one']) == ('company_company', 2, False)
+
+
+@pytest.mark.parametrize("sample_rate", [0, 1])
+def test_uni_profiling_middleware_samples_requests(settings, sample_rate):
+    """
+    Test function that verifies sampled requests get a Server-Timing header and per view totals,
+    and the others are left alone.
+    :param settings: Pytest-django fixture used to set the sample rate
+    :param sample_rate: Share of the requests profiled
+    """
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from ecommerce.profiling import ProfileStats, QueryProfilingMiddleware, profile_execute
+
+    def view(request):
+        for user_id in range(5):
+            profile_execute(lambda *args: None, 'SELECT * FROM "users_customuser" WHERE "id" = %s', (user_id,), False, {})
+        return HttpResponse()
+
+    settings.QUERY_PROFILING_SAMPLE_RATE = sample_rate
+    settings.QUERY_PROFILING_N_PLUS_ONE = 5
+    stats = ProfileStats()
+    response = QueryProfilingMiddleware(view, stats=stats)(RequestFactory().get('/api/users/'))
+    if sample_rate:
+        assert response['Server-Timing'].startswith('db;dur=')
+        assert 'desc="5 queries"' in response['Server-Timing']
+        assert 'n-plus-one' in response['Server-Timing']
+        # The request factory resolves no URL, like a 404
+        assert stats.snapshot()['<unresolved>']['avg_queries'] == 5
+    else:
+        assert not response.has_header('Server-Timing')
+        assert stats.snapshot() == {}
+
+
+@pytest.mark.parametrize("state, checkouts, connects", [
+    ('closed', 0, 0),  # A request that never queries does not open a connection
+    ('connected', 0, 1),
+    ('open', 1, 0),
+])
+def test_uni_connection_metrics_middleware(monkeypatch, state, checkouts, connects):
+    """
+    Test function that verifies the connection metrics count reused and new connections
+    without opening one for requests that do not query.
+    :param monkeypatch: Pytest fixture used to replace the database connection
+    :param state: Whether the connection is open, or opened by the view, or neither
+    :param checkouts: Expected requests that reused the connection
+    :param connects: Expected requests that opened it
+    """
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from ecommerce import db
+
+    class FakeConnection(object):
+        connection = object() if state == 'open' else None
+
+        def connect(self):
+            self.connection = object()
+
+    connection = FakeConnection()
+    monkeypatch.setattr(db, 'connections', {'default': connection})
+
+    def view(request):
+        if state == 'connected':
+            connection.connect()
+        return HttpResponse()
+
+    metrics = db.ConnectionMetrics()
+    response = db.ConnectionMetricsMiddleware(view, metrics=metrics)(RequestFactory().get('/static/app.css'))
+    snapshot = metrics.snapshot()
+    assert (snapshot['checkouts'], snapshot['connects']) == (checkouts, connects)
+    assert response.has_header('Server-Timing') is bool(connects)
+    assert 'connect' not in vars(connection)
+
+
+#
+# ADMIN
+#
+
+
+def test_uni_store_admin_searches_with_indexable_lookups(rf):
+    """
+    Test function that verifies the admin search matches a whole store code or the start of the
+    name, and loads only the listed columns.
+    :param rf: Pytest-django RequestFactory fixture
+    """
+    from django.contrib import admin
+    from apps.core.company.models import Company
+
+    model_admin = admin.site._registry[Company]
+    request = rf.get('/admin/company/company/')
+    queryset, may_have_duplicates = model_admin.get_search_results(request, Company.all_objects.all(), ' acme ')
+    sql = str(queryset.query)
+    assert '"company_company"."store_code" = acme' in sql
+    assert 'LIKE' in sql and 'acme%' in sql
+    assert not may_have_duplicates
+    assert model_admin.get_search_results(request, Company.all_objects.all(), '')[0].query.where.children == []
+    assert model_admin.get_list_only(request)[:2] == ['store_code', 'created']
+    assert 'tax_document' in model_admin.get_list_only(request)
+
+
+@pytest.mark.django_db
+def test_store_admin_keyset_pages(rf, monkeypatch, django_assert_num_queries):
+    """
+    Test function that verifies the changelist pages with a cursor, fetching one extra row to
+    find the next page, and counts the rows itself when they fit in the first page.
+    :param rf: Pytest-django RequestFactory fixture
+    :param monkeypatch: Pytest fixture used to shorten the pages
+    :param django_assert_num_queries: Pytest-django fixture counting the queries
+    """
+    from django.contrib import admin
+    from apps.core.company.models import Company
+    from apps.core.users.models import CustomUser
+
+    model_admin = admin.site._registry[Company]
+    user = CustomUser(username='admin', is_superuser=True, is_staff=True)
+    for i in range(3):
+        Company.objects.create(name='company%d' % i)
+    expected = list(Company.available_objects.order_by('-created', '-store_code').values_list('store_code', flat=True))
+
+    def changelist(per_page, **params):
+        monkeypatch.setattr(model_admin, 'list_per_page', per_page)
+        request = rf.get('/admin/company/company/', params)
+        request.user = user
+        return model_admin.get_changelist_instance(request)
+
+    with django_assert_num_queries(1):
+        first = changelist(3)
+    assert [obj.store_code for obj in first.result_list] == expected
+    assert (first.next_cursor, first.result_count, first.multi_page) == (None, 3, False)
+
+    first = changelist(2)
+    assert [obj.store_code for obj in first.result_list] == expected[:2]
+    second = changelist(2, cursor=first.next_cursor)
+    assert [obj.store_code for obj in second.result_list] == expected[2:]
+    assert second.next_cursor is None and second.multi_page
+
+
+def test_uni_prefix_index_uses_the_c_collation_on_postgres():
+    """
+    Test function that verifies PrefixIndex indexes its expressions under the C collation, with
+    the default operator class, on Postgres only.
+    """
+    from django.db import connection
+    from django.db.backends.postgresql.base import DatabaseWrapper
+    from apps.core.company.models import Company
+    from apps.core.store.indexes import PrefixIndex
+
+    index = next(index for index in Company._meta.indexes if isinstance(index, PrefixIndex))
+    postgres = DatabaseWrapper(dict(connection.settings_dict, ENGINE='django.db.backends.postgresql'), 'postgres')
+    sql = str(index.create_sql(Company, postgres.schema_editor()))
+    assert '((UPPER("name")) COLLATE "C")' in sql and 'pattern_ops' not in sql
+    assert 'COLLATE' not in str(index.create_sql(Company, connection.schema_editor()))
+    with pytest.raises(ValueError):
+        PrefixIndex(fields=['name'], name='company_name')
+
+
+@pytest.mark.django_db
+def test_prefix_matches_read_the_prefix_index_in_order():
+    """
+    Test function that verifies the autocomplete query of a field is served by its PrefixIndex,
+    filter and ORDER BY, without sorting the matches.
+    """
+    from django.db import connection
+    from apps.core.company.models import Company
+    from apps.core.store.search import prefix_matches
+
+    queryset = prefix_matches(Company.all_objects.filter(is_removed=False), 'name', 'ac')[:10]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        assert 'company_company_live_name' in plan
+        assert 'Sort Key: (upper' not in plan
+    else:
+        plan = queryset.explain()
+        assert 'company_company_live_name' in plan
+        assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+
+
+#
+# SEARCH
+#
+
+
+def test_uni_search_terms_build_a_prefix_tsquery():
+    """
+    Test function that verifies search queries are split into words matched as prefixes.
+    """
+    from apps.core.store.search import prefix_tsquery, search_terms
+
+    assert search_terms("  John O'Doe & co!") == ['john', 'o', 'doe', 'co']
+    assert prefix_tsquery(['john', 'do']) == 'john:* & do:*'
+    assert search_terms('&|!') == []
+
+
+def test_uni_search_uses_tsvector_and_trigrams_on_postgres(monkeypatch):
+    """
+    Test function that verifies the Postgres search matches the search vector or a trigram of
+    the weight 'A' fields, and other databases fall back to icontains.
+    :param monkeypatch: Pytest fixture used to make the queryset database look like Postgres
+    """
+    from django.db import connection
+    from django.db.backends.postgresql.base import DatabaseWrapper
+    from apps.core.store import search
+    from apps.core.users.models import CustomUser
+
+    monkeypatch.setattr(search, 'connections', {'default': SimpleNamespace(vendor='sqlite')})
+    fallback = str(CustomUser.objects.search('john').query)
+    assert 'LIKE' in fallback and 'search_vector' not in fallback.split('FROM')[1]
+    assert CustomUser.objects.search(' !? ').query.is_empty()
+
+    postgres = DatabaseWrapper(dict(connection.settings_dict, ENGINE='django.db.backends.postgresql'), 'default')
+    monkeypatch.setattr(search, 'connections', {'default': postgres})
+    sql, params = CustomUser.objects.search('John do').query.get_compiler(connection=postgres).as_sql()
+    assert '"users_customuser"."search_vector" @@ (to_tsquery(' in sql
+    assert '"users_customuser"."username" %% %s' in sql and '"users_customuser"."email" %% %s' in sql
+    assert 'NOT "users_customuser"."is_removed"' in sql
+    assert 'john:* & do:*' in params and 'john do' in params
+    assert "'A')" in search.vector_sql(CustomUser) and "'B')" in search.vector_sql(CustomUser)
+
+
+
+@pytest.mark.django_db
+def test_search_and_autocomplete_results():
+    """
+    Test function that verifies search ranks the rows whose weight 'A' fields start with the query
+    first and skips removed rows, and autocomplete returns the first matches by value across fields.
+    """
+    from apps.core.users.models import CustomUser
+
+    def make(username, email, first_name=''):
+        return CustomUser.objects.create(username=username, email=email, first_name=first_name, user_type='CLI')
+
+    johnny = make('johnny', 'u1@example.com')
+    john = make('john', 'u2@example.com')
+    alice = make('alice', 'john.alice@example.com')
+    bob = make('bob', 'u3@example.com', first_name='John')
+    CustomUser.available_objects.filter(pk=make('johnathan', 'u4@example.com').pk).delete()
+
+    results = list(CustomUser.objects.search('john'))
+    assert {user.pk for user in results[:3]} == {john.pk, johnny.pk, alice.pk}
+    assert results[3:] == [bob]
+    assert list(CustomUser.objects.search('john u3')) == [bob]
+
+    assert CustomUser.objects.autocomplete(' jo ', limit=2) == [john, alice]
+    assert CustomUser.objects.autocomplete('JO') == [john, alice, johnny]
+    assert CustomUser.objects.autocomplete('j') == []
+
+
+#
+# BENCHMARK RUNNER
+#
+
+
+def test_uni_benchmark_runner_flags_regressions_against_baseline(tmp_path):
+    """
+    Test function that verifies a case is timed, cleaned up, stored as baseline and reported as
+    a regression once it gets slower than the threshold.
+    :param tmp_path: Pytest fixture with the directory of the baseline file
+    """
+    from benchmarks.runner import Case, Result, compare, load_baseline, run_case, save_baseline
+
+    calls = []
+
+    def case(bench):
+        bench.cleanup(calls.append, 'first')
+        bench.cleanup(calls.append, 'second')
+        bench(sum, [1, 2, 3])
+
+    result = run_case(Case('test.sum', case), rounds=3, min_time=0.001)
+    assert calls == ['second', 'first']
+    assert len(result.times) == 3 and result.number >= 1 and result.ops > 0
+
+    path = str(tmp_path / 'baselines.json')
+    assert load_baseline(path) == {}
+    save_baseline([Result('test.sum', [0.002, 0.001, 0.003], 10)], path)
+    baseline = load_baseline(path)['test.sum']
+    assert baseline['median_ms'] == pytest.approx(2)
+    assert compare(Result('test.sum', [0.0021], 1), baseline, 0.25) == (pytest.approx(0.05), False)
+    assert compare(Result('test.sum', [0.003], 1), baseline, 0.25) == (pytest.approx(0.5), True)
+    assert compare(result, None) == (None, False)
+
+
+@pytest.mark.django_db
+def test_uni_benchmark_command_needs_a_test_database_and_a_baseline(tmp_path, monkeypatch):
+    """
+    Test function that verifies the benchmark command refuses to run against a database that is
+    not a test database, and without a baseline for its cases unless it records one.
+    :param tmp_path: Pytest fixture with the directory of the baseline file
+    :param monkeypatch: Pytest fixture used to rename the database
+    """
+    from django.core.management import CommandError, call_command
+    from django.db import connection
+    from benchmarks.runner import is_test_database
+
+    path = str(tmp_path / 'baselines.json')
+    assert is_test_database()
+    with pytest.raises(CommandError, match='No baseline for store.gen_storecode'):
+        call_command('benchmark', 'store.gen_storecode', baseline=path)
+
+    monkeypatch.setitem(connection.settings_dict, 'NAME', 'ecommerce')
+    assert not is_test_database()
+    with pytest.raises(CommandError, match='not a test database'):
+        call_command('benchmark', 'store.gen_storecode', baseline=path, save=True)
+
+
+
+#
+# CONCURRENT WRITES
+#
+
+
+def test_uni_integrity_errors_are_classified_by_column():
+    """
+    Test function that verifies store code collisions are told apart from other unique
+    violations and from deadlocks, with the messages of SQLite and the diagnostics of Postgres.
+    """
+    from django.db import IntegrityError, OperationalError
+    from apps.core.company.models import Company
+    from .integrity import get_violated_columns, is_store_code_collision, is_transient
+
+    def error(cls, message, pgcode=None, detail=None):
+        e = cls(message)
+        if pgcode:
+            # psycopg2 errors carry the SQLSTATE and the diagnostics of the server
+            e.__cause__ = Exception(message)
+            e.__cause__.pgcode = pgcode
+            e.__cause__.diag = SimpleNamespace(message_detail=detail)
+        return e
+
+    sqlite = error(IntegrityError, 'UNIQUE constraint failed: company_company.store_code')
+    assert get_violated_columns(sqlite) == ('store_code',)
+    assert is_store_code_collision(sqlite, Company)
+    assert not is_store_code_collision(
+        error(IntegrityError, 'UNIQUE constraint failed: company_company.tax_document'), Company
+    )
+
+    postgres = error(IntegrityError, 'duplicate key', '23505', 'Key (store_code)=(COMP1) already exists.')
+    assert is_store_code_collision(postgres, Company)
+    assert get_violated_columns(error(IntegrityError, 'null value', '23502')) == ()
+    assert not is_store_code_collision(
+        error(IntegrityError, 'duplicate key', '23505', 'Key (tax_document)=(1234) already exists.'), Company
+    )
+
+    assert is_transient(error(OperationalError, 'deadlock detected', '40P01'))
+    assert is_transient(error(OperationalError, 'database is locked'))
+    assert not is_transient(error(OperationalError, 'server closed the connection', '08006'))
+
+
+def test_uni_save_retries_store_code_collisions_only(monkeypatch):
+    """
+    Test function that verifies a new instance is inserted (never updated) and retried with a
+    new store code when its generated one is taken, while other integrity errors are raised.
+    :param monkeypatch: Pytest fixture that replaces the database calls
+    """
+    from contextlib import nullcontext
+    from django.db import IntegrityError, models as db_models
+    from apps.core.company.models import Company
+    from . import models as store_models
+
+    codes = iter(['COMP1', 'COMP2', 'COMP3'])
+    saves = []
+    errors = [IntegrityError('UNIQUE constraint failed: company_company.store_code')]
+
+    def save(self, *args, **kwargs):
+        saves.append((self.store_code, kwargs.get('force_insert')))
+        if errors:
+            raise errors.pop(0)
+
+    monkeypatch.setattr(db_models.Model, 'save', save)
+    monkeypatch.setattr(store_models.transaction, 'atomic', lambda using: nullcontext())
+    monkeypatch.setattr(Company, 'allocate_strcode', classmethod(lambda cls: next(codes)))
+
+    company = Company(name='retried')
+    company.save()
+    assert saves == [('COMP1', True), ('COMP2', True)]
+    assert company.store_code == 'COMP2'
+
+    errors.append(IntegrityError('UNIQUE constraint failed: company_company.tax_document'))
+    with pytest.raises(IntegrityError):
+        Company(name='duplicated', tax_document='1234').save()
+    assert saves[-1] == ('COMP3', True)
+
+    # Rows with a store code from the caller are saved as Django would
+    Company(store_code='COMP9', name='given').save()
+    assert saves[-1] == ('COMP9', False)
+
+
+@pytest.mark.django_db
+def test_save_retries_a_taken_store_code(monkeypatch):
+    """
+    Test function that verifies a new row whose allocated store code is taken gets the next one,
+    with force_insert given positionally, and that a None or blank tax document is rejected.
+    :param monkeypatch: Pytest fixture that hands out a taken store code first
+    """
+    from apps.core.company.models import Company
+
+    taken = Company.objects.create(name='taken')
+    fresh = Company.allocate_strcode()
+    codes = iter([taken.store_code, fresh])
+    monkeypatch.setattr(Company, 'allocate_strcode', classmethod(lambda cls: next(codes)))
+
+    company = Company(name='retried')
+    company.save(True)
+    assert company.store_code == fresh
+    assert Company.objects.get(store_code=taken.store_code).name == 'taken'
+    assert Company.objects.get(store_code=fresh).name == 'retried'
+
+    company.name = 'updated'
+    company.save(force_update=True)
+    assert Company.objects.get(store_code=fresh).name == 'updated'
+
+    for tax_document in (None, '', '  '):
+        with pytest.raises(ValueError):
+            Company.get_or_create_by_tax_document(tax_document)
+
+
+
+#
+# SURROGATE KEYS
+#
+
+
+@pytest.mark.django_db(transaction=True)
+def test_uni_surrogate_key_migration_numbers_rows_and_keeps_inserting():
+    """
+    Test function that verifies the migration helpers number the existing rows after the
+    highest id, and that a row inserted once `id` is the primary key does not collide.
+    """
+    from django.db import connection, models
+    from django.test.utils import isolate_apps
+    from django.utils import timezone
+    from .migration_helpers import populate_surrogate_ids, reset_surrogate_sequence
+
+    def build(code_field, id_field):
+        with isolate_apps('apps.core.store'):
+            class Row(models.Model):
+                store_code = code_field
+                created = models.DateTimeField(default=timezone.now)
+                id = id_field
+
+                class Meta:
+                    app_label = 'store'
+                    db_table = 'store_surrogate_key_test'
+        return Row
+
+    old = build(models.CharField(primary_key=True, max_length=25), models.BigIntegerField(null=True))
+    middle = build(models.CharField(max_length=25), models.BigAutoField(primary_key=True))
+    new = build(models.CharField(unique=True, max_length=25), models.BigAutoField(primary_key=True))
+    migration_apps = SimpleNamespace(get_model=lambda app_label, model_name: old)
+
+    with connection.schema_editor() as editor:
+        editor.create_model(old)
+    try:
+        old.objects.bulk_create([old(store_code='B'), old(store_code='A', id=5), old(store_code='C')])
+        with connection.schema_editor() as editor:
+            populate_surrogate_ids('store', 'Row', batch_size=1)(migration_apps, editor)
+        assert dict(old.objects.values_list('store_code', 'id')) == {'A': 5, 'B': 6, 'C': 7}
+
+        with connection.schema_editor() as editor:
+            # The new primary key replaces the old one before store_code becomes unique
+            editor.alter_field(old, old._meta.get_field('id'), middle._meta.get_field('id'))
+            editor.alter_field(middle, middle._meta.get_field('store_code'), new._meta.get_field('store_code'))
+            migration_apps.get_model = lambda app_label, model_name: new
+            reset_surrogate_sequence('store', 'Row')(migration_apps, editor)
+        assert new.objects.create(store_code='D').id == 8
+    finally:
+        with connection.schema_editor() as editor:
+            editor.delete_model(new)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_uni_surrogate_key_migration_repoints_incoming_foreign_keys():
+    """
+    Test function that verifies a referenced model moves to a surrogate key when its incoming
+    foreign keys are copied and detached before the primary key switch, and pointed at the new
+    primary key afterwards.
+    """
+    from django.db import connection, models
+    from django.test.utils import isolate_apps
+    from django.utils import timezone
+    from .migration_helpers import copy_foreign_keys, populate_surrogate_ids
+
+    def build(code_field, id_field, ref_fields):
+        with isolate_apps('apps.core.store'):
+            class Row(models.Model):
+                store_code = code_field.clone()
+                created = models.DateTimeField(default=timezone.now)
+                id = id_field.clone()
+
+                class Meta:
+                    app_label = 'store'
+                    db_table = 'store_surrogate_row_test'
+
+            Ref = type('Ref', (models.Model,), dict(
+                {name: build_field(Row) for name, build_field in ref_fields.items()},
+                __module__=__name__,
+                Meta=type('Meta', (), {'app_label': 'store', 'db_table': 'store_surrogate_ref_test'}),
+            ))
+        return {'Row': Row, 'Ref': Ref}
+
+    key = lambda row: models.BigIntegerField(null=True)
+    foreign_key = lambda row: models.ForeignKey(row, models.CASCADE, null=True)
+    old = build(models.CharField(primary_key=True, max_length=25), models.BigIntegerField(null=True),
+                {'row': foreign_key, 'row_key': key})
+    detached = build(models.CharField(primary_key=True, max_length=25), models.BigIntegerField(null=True),
+                     {'row_key': key})
+    middle = build(models.CharField(max_length=25), models.BigAutoField(primary_key=True), {'row_key': key})
+    swapped = build(models.CharField(unique=True, max_length=25), models.BigAutoField(primary_key=True),
+                    {'row_key': key})
+    new = build(models.CharField(unique=True, max_length=25), models.BigAutoField(primary_key=True),
+                {'row': foreign_key})
+    migration_apps = SimpleNamespace(get_model=lambda app_label, model_name: old[model_name])
+
+    with connection.schema_editor() as editor:
+        editor.create_model(old['Row'])
+        editor.create_model(old['Ref'])
+    try:
+        rows = old['Row'].objects.bulk_create([old['Row'](store_code=code) for code in 'AB'])
+        old['Ref'].objects.bulk_create([old['Ref'](row=rows[1]), old['Ref'](row=rows[0])])
+        with connection.schema_editor() as editor:
+            populate_surrogate_ids('store', 'Row')(migration_apps, editor)
+            copy_foreign_keys('store', 'Ref', 'row', 'row_key', 'store', 'Row')(migration_apps, editor)
+            editor.remove_field(old['Ref'], old['Ref']._meta.get_field('row'))
+
+            # No constraint depends on the old primary key any more
+            editor.alter_field(detached['Row'], detached['Row']._meta.get_field('id'), middle['Row']._meta.get_field('id'))
+            editor.alter_field(
+                middle['Row'], middle['Row']._meta.get_field('store_code'), swapped['Row']._meta.get_field('store_code')
+            )
+            editor.alter_field(swapped['Ref'], swapped['Ref']._meta.get_field('row_key'), new['Ref']._meta.get_field('row'))
+
+        assert sorted(new['Ref'].objects.values_list('row__store_code', flat=True)) == ['A', 'B']
+        constraints = connection.introspection.get_constraints(connection.cursor(), 'store_surrogate_ref_test')
+        assert [info['foreign_key'] for info in constraints.values() if info['foreign_key']] == [
+            ('store_surrogate_row_test', 'id')
+        ]
+    finally:
+        with connection.schema_editor() as editor:
+            editor.delete_model(new['Ref'])
+            editor.delete_model(new['Row'])
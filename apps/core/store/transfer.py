@@ -0,0 +1,244 @@
+"""
+Streaming CSV/JSONL import and export of StoreModel rows, used by the import_* and
+export_* management commands.
+
+Rows are read and written one at a time and handled in chunks, so memory stays flat
+whatever the size of the file or table. Exports read tuples through values_list() and a
+server side cursor (iterator(chunk_size=...)) in store code order. Both directions save
+a checkpoint after each chunk, and a run that was interrupted resumes from it.
+"""
+import csv
+import json
+import os
+import sys
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DataError, IntegrityError, router, transaction
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def detect_format(path, format=None):
+    """
+    Returns `format`, or the one matching the extension of `path` (csv by default).
+    """
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of up to `size` items of `iterable`.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_rows(path, format=None):
+    """
+    Yields each row of a CSV or JSONL file as a dict. Empty CSV cells are left out.
+    """
+    format = detect_format(path, format)
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if format == 'csv':
+            for row in csv.DictReader(stream):
+                yield {key: value for key, value in row.items() if value != ''}
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+class RowWriter(object):
+    """
+    Writes tuples of `fields` values as CSV or JSONL rows.
+    """
+
+    def __init__(self, stream, fields, format, header=True):
+        self.stream = stream
+        self.fields = fields
+        self.format = format
+        if format == 'csv':
+            self.writer = csv.writer(stream)
+            if header:
+                self.writer.writerow(fields)
+
+    def write(self, values):
+        if self.format == 'csv':
+            self.writer.writerow(['' if value is None else value for value in values])
+        else:
+            self.stream.write(json.dumps(dict(zip(self.fields, values)), cls=DjangoJSONEncoder) + '\n')
+
+
+class Checkpoint(object):
+    """
+    Progress of an import or export kept in a small JSON file, so a run can resume.
+
+    A Checkpoint without path keeps nothing and always starts from the beginning.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, **state):
+        if self.path:
+            # Written aside and renamed, so an interruption never leaves a half written file
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def export_rows(queryset, fields, path, format=None, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=None,
+                headers=None):
+    """
+    Streams `fields` of every row of `queryset` into a CSV or JSONL file, in store code order.
+
+    Args:
+        queryset: QuerySet of a StoreModel.
+        fields (list): Lookups passed to values_list(), related ones included.
+        path (str): Output file, '-' for stdout.
+        format (str): 'csv' or 'jsonl'. Defaults to the one of the file extension.
+        chunk_size (int): Rows fetched per round trip and written between checkpoints.
+        checkpoint (Checkpoint): Where the last exported store code is kept. When it has one,
+            rows after it are appended to the file instead of starting over.
+        headers (list): Column names, defaults to `fields`.
+
+    Returns:
+        The number of rows written by this run.
+    """
+    format = detect_format(path, format)
+    checkpoint = checkpoint or Checkpoint()
+    after = checkpoint.load().get('after')
+    queryset = queryset.order_by('store_code')
+    if after:
+        queryset = queryset.filter(store_code__gt=after)
+    if 'store_code' not in fields:
+        fields = ['store_code'] + list(fields)
+    code_index = list(fields).index('store_code')
+
+    stream = sys.stdout if path == '-' else open(path, 'a' if after else 'w', newline='', encoding='utf-8')
+    written = 0
+    try:
+        writer = RowWriter(stream, headers or list(fields), format, header=not after)
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        for chunk in chunked(rows, chunk_size):
+            for values in chunk:
+                writer.write(values)
+            stream.flush()
+            written += len(chunk)
+            checkpoint.save(after=chunk[-1][code_index])
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    checkpoint.clear()
+    return written
+
+
+def import_rows(rows, build, insert, batch_size=DEFAULT_CHUNK_SIZE, checkpoint=None):
+    """
+    Imports an iterable of row dicts in chunks, resuming after the last finished chunk.
+
+    Args:
+        rows (iterable): Row dicts, read lazily.
+        build (callable): Takes a list of (row number, row) pairs and returns a tuple of
+            (items to insert as (row number, item) pairs, failures as (row number, message) pairs).
+        insert (callable): Takes the (row number, item) pairs of a chunk, inserts them and
+            returns the failures.
+        batch_size (int): Rows per chunk.
+        checkpoint (Checkpoint): Where the number of rows already handled is kept.
+
+    Returns:
+        A tuple (imported, failures): the number of rows inserted by this run, and a list of
+        (row number, message) pairs. Row numbers count from 1.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    start = checkpoint.load().get('position', 0)
+    imported = 0
+    failures = []
+    for chunk in chunked(enumerate(islice(rows, start, None), start + 1), batch_size):
+        items, invalid = build(chunk)
+        failed = insert(items) if items else []
+        failures.extend(invalid)
+        failures.extend(failed)
+        imported += len(items) - len(failed)
+        checkpoint.save(position=chunk[-1][0])
+    checkpoint.clear()
+    return imported, failures
+
+
+def validate_instances(model, numbered, exclude=()):
+    """
+    Checks unsaved instances without queries: store codes with the compiled validator of the
+    model, other fields with clean_fields().
+
+    Args:
+        model: StoreModel subclass of the instances.
+        numbered (list): (row number, instance) pairs.
+        exclude (iterable): Fields left out of clean_fields().
+
+    Returns:
+        A tuple (valid pairs, failures as (row number, message) pairs).
+    """
+    given = [(number, obj) for number, obj in numbered if obj.store_code]
+    bad_codes = {
+        number for (number, obj), ok in zip(given, model.validate_store_codes([obj.store_code for _, obj in given]))
+        if not ok
+    }
+    valid = []
+    failures = []
+    for number, obj in numbered:
+        if number in bad_codes:
+            failures.append((number, 'Invalid store code: %s' % obj.store_code))
+            continue
+        try:
+            obj.clean_fields(exclude=['store_code', *exclude])
+        except ValidationError as e:
+            failures.append((number, '; '.join(e.messages)))
+            continue
+        valid.append((number, obj))
+    return valid, failures
+
+
+def insert_instances(model, numbered):
+    """
+    Inserts (row number, instance) pairs with one bulk_create_coded in a transaction, falling
+    back to one savepoint per row when the chunk fails, and returns the failed rows.
+    """
+    manager = model._default_manager
+    using = router.db_for_write(model)
+    try:
+        with transaction.atomic(using=using):
+            manager.bulk_create_coded([obj for _, obj in numbered])
+        return []
+    except (DataError, IntegrityError, ValidationError):
+        pass
+    failures = []
+    for number, obj in numbered:
+        try:
+            with transaction.atomic(using=using):
+                manager.bulk_create_coded([obj])
+        except (DataError, IntegrityError, ValidationError) as e:
+            failures.append((number, str(e)))
+    return failures
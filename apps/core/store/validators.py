@@ -0,0 +1,79 @@
+import re
+
+from django.core.exceptions import ValidationError
+
+# Layouts of the part after the prefix, by length: (digits, letters). The generator uses
+# 4 letters, the legacy layout 5 letters starting with a capital letter other than O
+LAYOUTS = {
+    9 + 4: (9, 4),
+    9 + 5: (9, 5),
+    5 + 4: (5, 4),
+    5 + 5: (5, 5),
+}
+
+
+class StoreCodeValidator(object):
+    """
+    Validates store codes of one prefix: <prefix><5 or 9 digits><4 letters>.
+
+    The letters follow the StoreCodeGen charset. The legacy layout checked by StoreModel.clean,
+    <prefix><5 or 9 digits><capital letter other than O><4 letters>, is still accepted.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.message = 'Enter a value with this format %s<5 or 9 digits><4 letter>' % prefix
+        self.pattern = re.compile(
+            r'%s(?:\d{9}|\d{5})(?:[a-zA-NP-Z]{4}|[A-NP-Z][a-zA-Z]{4})' % re.escape(prefix), re.ASCII
+        )
+
+    def matches(self, code):
+        """
+        Regular expression check, equivalent to is_valid. It is the fastest check in CPython,
+        so it backs __call__ and validate_many.
+        """
+        return isinstance(code, str) and self.pattern.fullmatch(code) is not None
+
+    def is_valid(self, code):
+        """
+        Structural check (prefix, length, digit span and letter span) without regular expressions.
+        """
+        if not isinstance(code, str) or not code.startswith(self.prefix) or not code.isascii():
+            return False
+        body = code[len(self.prefix):]
+        layout = LAYOUTS.get(len(body))
+        if layout is None:
+            return False
+        digit_len, letter_len = layout
+        letters = body[digit_len:]
+        if not body[:digit_len].isdigit() or not letters.isalpha():
+            return False
+        # O is skipped in order to avoid confusing letters
+        if letter_len == 4:
+            return 'O' not in letters
+        return letters[0] != 'O' and letters[0].isupper()
+
+    def validate_many(self, codes):
+        """
+        Returns, in order, whether each code of `codes` is valid.
+        """
+        fullmatch = self.pattern.fullmatch
+        return [isinstance(code, str) and fullmatch(code) is not None for code in codes]
+
+    def __call__(self, code):
+        if not self.matches(code):
+            raise ValidationError({'store_code': self.message}, code='invalid')
+
+
+# Validators by STORE_CODE_PREFIX, filled when StoreModel subclasses are defined
+store_code_validators = {}
+
+
+def register_store_code_validator(prefix):
+    """
+    Returns the validator of `prefix`, building and registering it the first time.
+    """
+    validator = store_code_validators.get(prefix)
+    if validator is None:
+        validator = store_code_validators[prefix] = StoreCodeValidator(prefix)
+    return validator
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core.users'
+
+    def ready(self):
+        from apps.core.users import signals  # noqa: F401
+        from apps.core.users.permissions import role_permissions
+        role_permissions.compile()
@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from apps.core.company.tenancy import ALL_TENANTS, use_tenant
+from apps.core.users.permissions import role_permissions
+
+# Seconds the permission set of a user stays cached when no setting is provided
+DEFAULT_PERMISSION_CACHE_TIMEOUT = 300
+# Bumped whenever a group changes, so every cached permission set built from it goes stale
+PERMISSION_VERSION_KEY = 'users:perms:version'
+
+
+def get_permission_cache_key(store_code):
+    """
+    Returns the shared cache key of the permission set of the user with `store_code`.
+    """
+    return 'users:perms:%s' % store_code
+
+
+def get_cached_permissions(store_code):
+    """
+    Returns the cached permission entry of the user with `store_code`, None when it is missing
+    or was built before the last group change, and the version to store a new one under.
+
+    Entries are stored next to the version they were built under, so the version and the
+    entry are read together in one round trip.
+    """
+    key = get_permission_cache_key(store_code)
+    values = cache.get_many([PERMISSION_VERSION_KEY, key])
+    version = values.get(PERMISSION_VERSION_KEY, 1)
+    cached = values.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], version
+    return None, version
+
+
+def set_cached_permissions(store_code, entry, version):
+    """
+    Caches the permission entry of the user with `store_code`, built under `version`.
+    """
+    cache.set(get_permission_cache_key(store_code), (version, entry), getattr(
+        settings, 'USER_PERMISSION_CACHE_TIMEOUT', DEFAULT_PERMISSION_CACHE_TIMEOUT
+    ))
+
+
+def invalidate_user_permissions(store_code):
+    """
+    Drops the cached permission set of one user.
+    """
+    cache.delete(get_permission_cache_key(store_code))
+
+
+def invalidate_all_permissions():
+    """
+    Makes every cached permission set stale, used when a group or its permissions change.
+    """
+    try:
+        cache.incr(PERMISSION_VERSION_KEY)
+    except ValueError:
+        cache.set(PERMISSION_VERSION_KEY, 2, None)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that serves the session user and its permissions from the cache.
+
+    The user comes from CustomUser.get_cached, so soft deleted users are not returned and a
+    save or a QuerySet.update() (password change, deactivation, soft delete) invalidates it,
+    which also expires the sessions checked against the old password hash. The permission set is
+    kept in the shared cache under a key that is dropped when the user, its groups or its
+    permissions change. Together with a cache session engine an authenticated request does
+    not reach the database in the steady state.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # The user is looked up before its tenant is known
+        with use_tenant(ALL_TENANTS):
+            return super().authenticate(request, username, password, **kwargs)
+
+    def get_user(self, user_id):
+        with use_tenant(ALL_TENANTS):
+            user = get_user_model().get_cached(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            perms, version = get_cached_permissions(user_obj.pk)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                set_cached_permissions(user_obj.pk, perms, version)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+
+class RolePermissionBackend(CachedModelBackend):
+    """
+    CachedModelBackend that resolves permissions from the user_type instead of M2M joins.
+
+    Each user type maps to a frozen permission set compiled at startup (see permissions).
+    Permissions a user holds through user_permissions or groups are kept as overrides in a
+    cached bitset, so once warm has_perm is a set lookup plus a bit test.
+    Superusers hold every permission.
+    """
+
+    def get_override_bits(self, user_obj):
+        """
+        Returns the bitset of the permissions `user_obj` holds through user_permissions and groups.
+
+        The bitset is read from the shared cache once and kept on `user_obj`, like the permission
+        set of ModelBackend, so further checks of the same request need no round trip.
+        """
+        if not hasattr(user_obj, '_perm_override_bits'):
+            cached, version = get_cached_permissions(user_obj.pk)
+            if cached is not None and cached[0] == role_permissions.digest:
+                bits = cached[1]
+            else:
+                bits = role_permissions.encode(
+                    self.get_user_permissions(user_obj) | self.get_group_permissions(user_obj)
+                )
+                set_cached_permissions(user_obj.pk, (role_permissions.digest, bits), version)
+            user_obj._perm_override_bits = bits
+        return user_obj._perm_override_bits
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            if user_obj.is_superuser:
+                user_obj._perm_cache = role_permissions.all
+            else:
+                user_obj._perm_cache = (
+                    role_permissions.for_role(user_obj.user_type)
+                    | role_permissions.decode(self.get_override_bits(user_obj))
+                )
+        return user_obj._perm_cache
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return False
+        if user_obj.is_superuser or perm in role_permissions.for_role(user_obj.user_type):
+            return True
+        return role_permissions.has_bit(self.get_override_bits(user_obj), perm)
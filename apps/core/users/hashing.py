@@ -0,0 +1,63 @@
+"""
+Password hashing on a process pool, for bulk user imports.
+
+The workers are started with `spawn`, which is safe in threaded processes and the same on
+every platform, and set Django up before hashing. This module imports no models, so the
+workers can load it before the app registry is ready.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+logger = logging.getLogger(__name__)
+
+# Passwords sent to a worker process at a time
+HASH_CHUNK_SIZE = 64
+
+
+def setup_worker(password_hashers):
+    """
+    Sets Django up in a worker process, hashing with the hashers of the parent.
+    """
+    django.setup()
+    settings.PASSWORD_HASHERS = password_hashers
+
+
+def hash_passwords(passwords):
+    """
+    Hashes a list of raw passwords, runs in the worker processes of hash_passwords_parallel.
+    """
+    return [make_password(password) for password in passwords]
+
+
+def hash_passwords_parallel(passwords, workers=None):
+    """
+    Hashes `passwords` across `workers` processes, keeping their order. Falls back to hashing
+    in process when the pool breaks.
+
+    Args:
+        passwords (list): Raw passwords, None for unusable ones.
+        workers (int): Worker processes. Defaults to the number of cores; 0 or 1 hashes in process.
+
+    Returns:
+        A list of encoded passwords.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(passwords) <= HASH_CHUNK_SIZE:
+        return hash_passwords(passwords)
+    chunks = [passwords[start:start + HASH_CHUNK_SIZE] for start in range(0, len(passwords), HASH_CHUNK_SIZE)]
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context('spawn'),
+            initializer=setup_worker, initargs=(list(settings.PASSWORD_HASHERS),),
+        ) as executor:
+            return [encoded for chunk in executor.map(hash_passwords, chunks) for encoded in chunk]
+    except BrokenProcessPool:
+        logger.warning('Password hashing pool broke, hashing %d passwords in process', len(passwords))
+        return hash_passwords(passwords)
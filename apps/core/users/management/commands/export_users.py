@@ -0,0 +1,23 @@
+from apps.core.company.tenancy import ALL_TENANTS, use_tenant
+from apps.core.store.management.base import BaseExportCommand
+from apps.core.users.models import CustomUser
+
+PROFILE_FIELDS = ('address', 'city', 'country', 'zip_code', 'phone')
+
+
+class Command(BaseExportCommand):
+    help = (
+        'Streams users and their profile fields into a CSV or JSONL file in store code order. '
+        'Password hashes are not exported. Resumable with --checkpoint.'
+    )
+    model = CustomUser
+    fields = (
+        'store_code', 'username', 'email', 'first_name', 'last_name', 'user_type', 'is_active', 'date_joined',
+        'company',
+    ) + tuple('userprofile__%s' % field for field in PROFILE_FIELDS)
+    headers = [field.replace('userprofile__', '') for field in fields]
+
+    def handle(self, *args, **options):
+        # Rows of every company, also under row level security
+        with use_tenant(ALL_TENANTS):
+            super().handle(*args, **options)
@@ -0,0 +1,63 @@
+from apps.core.company.tenancy import ALL_TENANTS, use_tenant
+from apps.core.store.management.base import BaseImportCommand
+from apps.core.store.transfer import validate_instances
+from apps.core.users.management.commands.export_users import PROFILE_FIELDS
+from apps.core.users.models import CustomUser, UserProfile
+
+USER_FIELDS = (
+    'store_code', 'username', 'email', 'password', 'first_name', 'last_name', 'user_type', 'is_active',
+    'date_joined',
+)
+
+
+class Command(BaseImportCommand):
+    help = (
+        'Imports users and their profiles from a CSV or JSONL file with bulk_create_users. Passwords '
+        'are raw and hashed on import; rows without one get an unusable password. The company column '
+        'holds the store code of the owning Company. Invalid rows are reported and skipped. '
+        'Resumable with --checkpoint.'
+    )
+    model = CustomUser
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes.')
+
+    def handle(self, *args, **options):
+        self.workers = options['workers']
+        # Rows of every company, also under row level security
+        with use_tenant(ALL_TENANTS):
+            super().handle(*args, **options)
+
+    def build(self, chunk):
+        user_types = dict(CustomUser.USER_TYPE_CHOICES)
+        items = {}
+        failures = []
+        for number, row in chunk:
+            if row.get('user_type') not in user_types:
+                failures.append((number, 'Invalid user type: %s' % row.get('user_type')))
+                continue
+            item = {field: row[field] for field in USER_FIELDS if row.get(field) is not None}
+            if row.get('company'):
+                item['company_id'] = row['company']
+            item['profile'] = {field: row[field] for field in PROFILE_FIELDS if row.get(field) is not None}
+            items[number] = item
+
+        # Fields are checked without queries, the company and uniqueness are left to the insert
+        users, user_failures = validate_instances(CustomUser, [
+            (number, CustomUser(**{field: value for field, value in item.items() if field not in ('password', 'profile')}))
+            for number, item in items.items()
+        ], exclude=['password', 'company'])
+        profiles, profile_failures = validate_instances(UserProfile, [
+            (number, UserProfile(**items[number]['profile'])) for number, _ in users
+        ], exclude=['user', 'company'])
+        failures.extend(user_failures + profile_failures)
+        failures.sort()
+        return [(number, items[number]) for number, _ in profiles], failures
+
+    def insert(self, items):
+        numbers = [number for number, _ in items]
+        _, failures = CustomUser.objects.bulk_create_users(
+            [item for _, item in items], batch_size=len(items), workers=self.workers
+        )
+        return [(numbers[index], message) for index, message in failures]
@@ -1,9 +1,17 @@
+from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, router, transaction
+from django.utils.translation import gettext_lazy as _
+from apps.core.company.tenancy import TenantManagerMixin
+from apps.core.store.managers import DEFAULT_BULK_BATCH_SIZE, StoreQuerySet
+from apps.core.users.hashing import hash_passwords_parallel
 
-class CustomUserManager(BaseUserManager):
+
+class CustomUserManager(TenantManagerMixin, BaseUserManager.from_queryset(StoreQuerySet)):
     """
     CustomUserManager extends Django's BaseUserManager, adding some functions
-    to create users and superusers.
+    to create users and superusers. Queries are scoped to the active tenant, if any.
     """
 
     def create_user(self, username, email, password, **extra_fields):
@@ -48,3 +56,113 @@ class CustomUserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True) # Ensures the user is marked as a superuser.
 
         return self.create_user(username, email, password, **extra_fields) # Creates a Superuser instance.
+
+    def bulk_create_users(self, rows, batch_size=None, workers=None):
+        """
+        Creates many users and their profiles at once, for account imports.
+
+        Each row is built and its fields validated first, so unknown fields and invalid values
+        are reported for that row alone. Passwords are hashed on a process pool and store codes
+        are assigned per chunk by bulk_create_coded. Each chunk of users and profiles is inserted in one transaction.
+        If a chunk fails, its rows are inserted one at a time, each in a savepoint, so a bad
+        row does not abort the rest.
+
+        Args:
+            rows (iterable): Dicts with username, email and password (None for an unusable
+                password), any other CustomUser field, and an optional "profile" dict of
+                UserProfile fields.
+            batch_size (int): Users per chunk. Defaults to settings.STORE_BULK_BATCH_SIZE.
+            workers (int): Processes used to hash passwords. Defaults to the number of cores.
+
+        Returns:
+            A tuple (created, failures): the list of created users, and a list of
+            (row index, error message) pairs for the rows that were not created.
+        """
+        rows = [dict(row) for row in rows]
+        failures = []
+        valid = []
+        seen = set()
+        for index, row in enumerate(rows):
+            if not row.get('username'):
+                failures.append((index, str(_('The Username must be set'))))
+            elif not row.get('email'):
+                failures.append((index, str(_('The Email must be set'))))
+            elif row['username'] in seen:
+                failures.append((index, 'Duplicated username in batch: %s' % row['username']))
+            else:
+                seen.add(row['username'])
+                valid.append(index)
+
+        # Checked on the primary, a replica may not have the latest users yet, and in every tenant
+        taken = set(
+            self.model.all_objects.db_manager(router.db_for_read(self.model, primary=True))
+            .filter(username__in=[rows[index]['username'] for index in valid])
+            .values_list('username', flat=True)
+        )
+        failures.extend(
+            (index, 'Username already in use: %s' % rows[index]['username'])
+            for index in valid if rows[index]['username'] in taken
+        )
+        valid = [index for index in valid if rows[index]['username'] not in taken]
+
+        passwords = {index: rows[index].pop('password', None) for index in valid}
+        users = {}
+        profiles = {}
+        for index in valid:
+            try:
+                users[index], profiles[index] = self._build_user(rows[index])
+            except (TypeError, ValueError, ValidationError) as error:
+                failures.append((index, str(error)))
+        valid = [index for index in valid if index in users]
+
+        encoded = hash_passwords_parallel([passwords[index] for index in valid], workers)
+        for index, password in zip(valid, encoded):
+            users[index].password = password
+
+        created = []
+        batch_size = batch_size or getattr(settings, 'STORE_BULK_BATCH_SIZE', DEFAULT_BULK_BATCH_SIZE)
+        for start in range(0, len(valid), batch_size):
+            chunk = valid[start:start + batch_size]
+            try:
+                self._insert_users(chunk, users, profiles)
+                created.extend(users[index] for index in chunk)
+                continue
+            except (DataError, IntegrityError, ValidationError):
+                pass
+            for index in chunk:
+                try:
+                    self._insert_users([index], users, profiles)
+                    created.append(users[index])
+                except (DataError, IntegrityError, ValidationError) as error:
+                    failures.append((index, str(error)))
+        failures.sort()
+        return created, failures
+
+    def _build_user(self, row):
+        """
+        Returns the unsaved user and profile of `row`, with their fields validated so a value
+        the database would reject (an overlong username, a bad email) fails this row alone.
+        Relations are left to the database, checking them here would take a query per row.
+        """
+        from apps.core.users.models import UserProfile
+
+        row = dict(row)
+        profile_fields = row.pop('profile', None) or {}
+        row['email'] = self.normalize_email(row['email'])
+        user = self.model(**row)
+        user.clean_fields(exclude=['store_code', 'password', 'company'])
+        profile = UserProfile(user=user, **profile_fields)
+        profile.clean_fields(exclude=['store_code', 'user', 'company'])
+        return user, profile
+
+    def _insert_users(self, indexes, users, profiles):
+        """
+        Inserts the users and profiles at `indexes` in one transaction.
+        """
+        from apps.core.users.models import UserProfile
+
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            self.bulk_create_coded([users[index] for index in indexes])
+            for index in indexes:
+                profiles[index].user = users[index]
+            UserProfile.objects.bulk_create_coded([profiles[index] for index in indexes])
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import AbstractUser
-from apps.core.store.models import StoreModel
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Q
+from django.db.models.functions import Upper
+from apps.core.company.tenancy import TenantModel
+from apps.core.store.indexes import PrefixIndex
 from apps.core.users.managers import CustomUserManager
 from django.db import models
 
-class CustomUser(AbstractUser, StoreModel):    
+class CustomUser(AbstractUser, TenantModel):    
     """
     CustomUser extends the AbstractUser and StoreModel provided by Django.
     
@@ -24,8 +28,10 @@ class CustomUser(AbstractUser, StoreModel):
         last_login: A datetime of the users last login.
         date_joined: A datetime designating when the account was created. Is set to the current date/time by default.
     
-    Attributes inherited from StoreModel:
+    Attributes inherited from TenantModel:
         store_code: A CharField that stores the unique store code.
+        company: ForeignKey to the Company (tenant) the user belongs to.
+        all_objects: Manager over the users of every tenant, `objects` is scoped to the active one.
     
     Attributes:
         USER_TYPE_CHOICES: A tuple defining the different types of users.
@@ -33,9 +39,10 @@ class CustomUser(AbstractUser, StoreModel):
     
     Inherits from:
         AbstractUser: A fully-featured User model with admin-compliant permissions.
-        StoreModel: An abstract base model representing a store, with a unique store code.
+        TenantModel: An abstract StoreModel owned by a Company, see apps.core.company.tenancy.
     """
     STORE_CODE_PREFIX = "USR"
+    SEARCH_FIELDS = (('username', 'A'), ('email', 'A'), ('first_name', 'B'), ('last_name', 'B'))
 
     USER_TYPE_CHOICES = (
         ('ADM', 'Admin'),
@@ -45,7 +52,10 @@ class CustomUser(AbstractUser, StoreModel):
         ('PRV', 'Provider'),
     )
 
-    user_type = models.CharField(max_length=3, choices=USER_TYPE_CHOICES)
+    user_type = models.CharField(max_length=4, choices=USER_TYPE_CHOICES)
+
+    # Kept current by a trigger, see the setup_search command
+    search_vector = SearchVectorField(null=True, editable=False)
 
     # Specifies the field used as the username.
     USERNAME_FIELD = 'username'
@@ -55,22 +65,29 @@ class CustomUser(AbstractUser, StoreModel):
     # Assigns the custom user manager to the CustomUser model.
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta, TenantModel.Meta):
+        # Back the username and email prefix searches of autocomplete()
+        indexes = TenantModel.Meta.indexes + [
+            PrefixIndex(Upper('username'), condition=Q(is_removed=False), name='users_customuser_live_uname'),
+            PrefixIndex(Upper('email'), condition=Q(is_removed=False), name='users_customuser_live_email'),
+        ]
 
     def __str__(self):
         return self.email
 
 
-class UserProfile(StoreModel):
+class UserProfile(TenantModel):
     """
-    UserProfile extends the StoreModel to provide additional information about a CustomUser.
+    UserProfile extends the TenantModel to provide additional information about a CustomUser.
     
     This model is designed to store additional user details that are not covered by the CustomUser model,
     such as address, city, country, postal code, and phone number. It is linked to the CustomUser model via a 
     OneToOne relationship, meaning that each user can only have one profile, and each profile can only be 
     associated with one user.
     
-    Attributes inherited from StoreModel:
+    Attributes inherited from TenantModel:
         store_code: A CharField that stores the unique store code.
+        company: ForeignKey to the Company (tenant) the profile belongs to.
     
     Attributes:
         STORE_CODE_PREFIX: A constant string used as prefix when generating the store_code.
@@ -82,7 +99,7 @@ class UserProfile(StoreModel):
         phone: CharField to store the user's phone number. Can be blank.
     
     Inherits from:
-        StoreModel: An abstract base model representing a store, with a unique store code.
+        TenantModel: An abstract StoreModel owned by a Company, see apps.core.company.tenancy.
     """
         
     STORE_CODE_PREFIX = "USRP"
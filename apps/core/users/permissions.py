@@ -0,0 +1,112 @@
+import hashlib
+from fnmatch import fnmatchcase
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_permission_codename
+
+# Permission patterns granted to each user type when USER_TYPE_PERMISSIONS is not set.
+# Patterns are "app_label.codename" names and may use shell wildcards, for example
+# {'STF': ['company.view_*', 'users.view_*']}. No user type grants anything by default, so
+# users keep exactly the permissions of their user_permissions and groups (and superusers all).
+DEFAULT_USER_TYPE_PERMISSIONS = {}
+
+
+def get_model_permissions(models=None):
+    """
+    Returns the sorted "app_label.codename" names of the permissions of `models`.
+
+    Names come from the model options (default permissions and Meta.permissions), the same
+    source the auth app uses to create the Permission rows, so no query is needed.
+    """
+    names = set()
+    for model in models if models is not None else apps.get_models():
+        opts = model._meta
+        for action in opts.default_permissions:
+            names.add('%s.%s' % (opts.app_label, get_permission_codename(action, opts)))
+        for codename, _ in opts.permissions:
+            names.add('%s.%s' % (opts.app_label, codename))
+    return sorted(names)
+
+
+class RolePermissions(object):
+    """
+    Permission sets of each user type, compiled once per process.
+
+    Every known permission gets a bit, so the permissions a user holds on top of its role
+    (its user_permissions and groups) fit in a single integer that is cheap to cache.
+    Since bit positions depend on the installed models, encoded sets carry a digest of the
+    permission list and are only decoded by processes with the same one.
+    """
+
+    def __init__(self, roles=None, models=None):
+        """
+        Args:
+            roles (dict): user_type -> permission patterns. Defaults to settings.USER_TYPE_PERMISSIONS.
+            models (iterable): Models whose permissions are known. Defaults to every installed model.
+        """
+        self._roles = roles
+        self._models = models
+        self.names = None
+
+    def compile(self):
+        """
+        Builds the bit index and the frozen permission set of every user type.
+        """
+        roles = self._roles
+        if roles is None:
+            roles = getattr(settings, 'USER_TYPE_PERMISSIONS', DEFAULT_USER_TYPE_PERMISSIONS)
+        self.names = tuple(get_model_permissions(self._models))
+        self.index = {name: bit for bit, name in enumerate(self.names)}
+        self.all = frozenset(self.names)
+        self.roles = {
+            user_type: frozenset(
+                name for name in self.names
+                if any(fnmatchcase(name, pattern) for pattern in patterns)
+            )
+            for user_type, patterns in roles.items()
+        }
+        self.digest = hashlib.blake2b('\n'.join(self.names).encode(), digest_size=8).hexdigest()
+        return self
+
+    def _ensure_compiled(self):
+        if self.names is None:
+            self.compile()
+
+    def for_role(self, user_type):
+        """
+        Returns the frozen permission set of `user_type`, empty for unknown types.
+        """
+        self._ensure_compiled()
+        return self.roles.get(user_type, frozenset())
+
+    def encode(self, perms):
+        """
+        Returns the bitset of `perms`. Names that are not known are left out.
+        """
+        self._ensure_compiled()
+        bits = 0
+        for name in perms:
+            bit = self.index.get(name)
+            if bit is not None:
+                bits |= 1 << bit
+        return bits
+
+    def decode(self, bits):
+        """
+        Returns the frozen set of permission names in `bits`.
+        """
+        self._ensure_compiled()
+        return frozenset(name for bit, name in enumerate(self.names) if bits >> bit & 1)
+
+    def has_bit(self, bits, perm):
+        """
+        Returns whether `perm` is set in `bits`.
+        """
+        self._ensure_compiled()
+        bit = self.index.get(perm)
+        return bit is not None and bool(bits >> bit & 1)
+
+
+# Process wide role table, compiled when the users app is ready
+role_permissions = RolePermissions()
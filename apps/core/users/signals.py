@@ -0,0 +1,43 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core.users.backends import invalidate_all_permissions, invalidate_user_permissions
+from apps.core.users.models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_saved_user_permissions(sender, instance, **kwargs):
+    """
+    Drops the cached permissions of a saved or deleted user (superuser or active flag changes).
+    """
+    invalidate_user_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def invalidate_related_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached permissions of the users whose groups or permissions changed.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user_permissions(instance.pk)
+    elif pk_set:
+        for pk in pk_set:
+            invalidate_user_permissions(pk)
+    else:
+        # A group or permission was cleared of all its users
+        invalidate_all_permissions()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def invalidate_group_permissions(sender, **kwargs):
+    """
+    Makes every cached permission set stale when a group changes.
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_all_permissions()
@@ -35,3 +35,280 @@ def test_custom_user_model(username, email, password, user_type):
     with pytest.raises(ValidationError):
         user.email = ""
         user.full_clean()
+
+
+def test_cached_backend_reuses_permission_set(monkeypatch):
+    """
+    Test that the cached backend computes the permission set of a user once and invalidates it on request.
+
+    :param monkeypatch: Pytest fixture used to count the permission queries
+    """
+    from types import SimpleNamespace
+    from django.contrib.auth.backends import ModelBackend
+    from apps.core.users.backends import CachedModelBackend, invalidate_user_permissions
+
+    calls = []
+    monkeypatch.setattr(ModelBackend, 'get_all_permissions', lambda self, user, obj=None: calls.append(user) or {'store.view'})
+    backend = CachedModelBackend()
+    make_user = lambda: SimpleNamespace(pk='USR000000001test', is_active=True, is_anonymous=False)
+
+    assert backend.get_all_permissions(make_user()) == {'store.view'}
+    assert backend.get_all_permissions(make_user()) == {'store.view'}
+    assert len(calls) == 1
+    invalidate_user_permissions('USR000000001test')
+    backend.get_all_permissions(make_user())
+    assert len(calls) == 2
+
+
+def test_role_permissions_compile_user_types():
+    """
+    Test that each user type is compiled into a frozen permission set and that overrides round trip through a bitset.
+    """
+    from apps.core.company.models import Company
+    from apps.core.users.models import UserProfile
+    from apps.core.users.permissions import RolePermissions
+
+    roles = RolePermissions(
+        roles={'ADM': ['*'], 'STF': ['company.view_*'], 'CLI': ['users.*_userprofile']},
+        models=[Company, CustomUser, UserProfile],
+    ).compile()
+
+    assert len(roles.for_role('ADM')) == 12
+    assert roles.for_role('STF') == frozenset({'company.view_company'})
+    assert 'users.change_userprofile' in roles.for_role('CLI')
+    assert 'users.change_customuser' not in roles.for_role('CLI')
+    assert roles.for_role('XXX') == frozenset()
+
+    bits = roles.encode({'company.add_company', 'users.view_customuser', 'unknown.perm'})
+    assert roles.decode(bits) == frozenset({'company.add_company', 'users.view_customuser'})
+    assert roles.has_bit(bits, 'company.add_company')
+    assert not roles.has_bit(bits, 'company.delete_company')
+
+
+@pytest.mark.parametrize(
+    "user_type, is_superuser, perm, expected",
+    [
+        ("CLI", False, "users.change_userprofile", True),  # Granted by the role
+        ("CLI", False, "company.add_company", True),  # Granted by an override
+        ("CLI", False, "company.delete_company", False),
+        ("STF", False, "company.view_company", True),
+        ("CLI", True, "company.delete_company", True),  # Superusers hold every permission
+    ]
+)
+def test_role_backend_has_perm(monkeypatch, user_type, is_superuser, perm, expected):
+    """
+    Test that the role backend merges the user_type permissions with the cached overrides.
+
+    :param monkeypatch: Pytest fixture used to replace the role table and the override lookup
+    :param user_type: Type of user
+    :param is_superuser: Whether the user is a superuser
+    :param perm: Permission checked
+    :param expected: Expected has_perm result
+    """
+    from types import SimpleNamespace
+    from apps.core.users.backends import RolePermissionBackend
+    from apps.core.users.permissions import role_permissions
+
+    role_permissions.for_role(user_type)
+    monkeypatch.setitem(role_permissions.roles, 'CLI', frozenset({'users.change_userprofile'}))
+    monkeypatch.setitem(role_permissions.roles, 'STF', frozenset({'company.view_company'}))
+    overrides = role_permissions.encode({'company.add_company'})
+    monkeypatch.setattr(RolePermissionBackend, 'get_override_bits', lambda self, user: overrides)
+    user = SimpleNamespace(
+        pk='USR000000001test', is_active=True, is_anonymous=False, is_superuser=is_superuser, user_type=user_type
+    )
+    assert RolePermissionBackend().has_perm(user, perm) is expected
+    assert (perm in RolePermissionBackend().get_all_permissions(user)) is expected
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_hash_passwords_parallel_keeps_order(settings, workers):
+    """
+    Test that passwords hashed in process or on a spawned process pool come back in input order.
+
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    :param workers: Number of hashing processes
+    """
+    from django.contrib.auth.hashers import check_password
+    from apps.core.users.hashing import hash_passwords_parallel
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    passwords = ['password%d' % i for i in range(150)]
+    encoded = hash_passwords_parallel(passwords, workers=workers)
+    assert len(encoded) == len(passwords)
+    assert all(check_password(password, hashed) for password, hashed in zip(passwords, encoded))
+
+
+def test_hash_passwords_parallel_falls_back_when_the_pool_breaks(settings, monkeypatch):
+    """
+    Test that passwords are hashed in process when the process pool breaks.
+
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    :param monkeypatch: Pytest fixture used to break the pool
+    """
+    from concurrent.futures.process import BrokenProcessPool
+    from django.contrib.auth.hashers import check_password
+    from apps.core.users import hashing
+
+    class BrokenExecutor(object):
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def map(self, fn, chunks):
+            raise BrokenProcessPool('A child process terminated abruptly')
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    monkeypatch.setattr(hashing, 'ProcessPoolExecutor', BrokenExecutor)
+    passwords = ['password%d' % i for i in range(150)]
+    encoded = hashing.hash_passwords_parallel(passwords, workers=2)
+    assert all(check_password(password, hashed) for password, hashed in zip(passwords, encoded))
+
+
+def test_permission_cache_goes_stale_on_group_change(monkeypatch):
+    """
+    Test that bumping the permission version makes every cached permission set stale.
+
+    :param monkeypatch: Pytest fixture used to count the permission queries
+    """
+    from types import SimpleNamespace
+    from django.contrib.auth.backends import ModelBackend
+    from apps.core.users.backends import CachedModelBackend, invalidate_all_permissions
+
+    calls = []
+    monkeypatch.setattr(ModelBackend, 'get_all_permissions', lambda self, user, obj=None: calls.append(user) or {'store.view'})
+    backend = CachedModelBackend()
+    make_user = lambda: SimpleNamespace(pk='USR000000002test', is_active=True, is_anonymous=False)
+
+    backend.get_all_permissions(make_user())
+    backend.get_all_permissions(make_user())
+    assert len(calls) == 1
+    invalidate_all_permissions()
+    backend.get_all_permissions(make_user())
+    backend.get_all_permissions(make_user())
+    assert len(calls) == 2
+
+
+@pytest.mark.django_db
+def test_cached_backend_sees_queryset_updates(settings):
+    """
+    Test that a session user deactivated or given a new password through QuerySet.update() is not served from the cache.
+
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    """
+    from django.contrib.auth.hashers import make_password
+    from apps.core.users.backends import CachedModelBackend
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    user = CustomUser.objects.create_user(username='cached', email='cached@example.com', password='password1', user_type='CLI')
+    backend = CachedModelBackend()
+    session_hash = backend.get_user(user.pk).get_session_auth_hash()
+
+    CustomUser.objects.filter(pk=user.pk).update(password=make_password('password2'))
+    assert backend.get_user(user.pk).get_session_auth_hash() != session_hash
+
+    CustomUser.objects.filter(pk=user.pk).update(is_active=False)
+    assert backend.get_user(user.pk) is None
+
+
+def test_role_backend_reads_overrides_once_per_user(monkeypatch):
+    """
+    Test that the override bitset is read from the shared cache once per user object, and that no user type grants anything by default.
+
+    :param monkeypatch: Pytest fixture used to count the cache reads
+    """
+    from types import SimpleNamespace
+    from apps.core.users import backends
+    from apps.core.users.permissions import DEFAULT_USER_TYPE_PERMISSIONS, role_permissions
+
+    reads = []
+    bits = role_permissions.encode({'company.add_company'})
+    monkeypatch.setattr(backends, 'get_cached_permissions', lambda pk: reads.append(pk) or ((role_permissions.digest, bits), 1))
+    backend = backends.RolePermissionBackend()
+    user = SimpleNamespace(pk='USR000000003test', is_active=True, is_anonymous=False, is_superuser=False, user_type='ADM')
+
+    assert backend.has_perm(user, 'company.add_company')
+    assert not backend.has_perm(user, 'company.delete_company')
+    assert not backend.has_perm(user, 'users.change_customuser')
+    assert len(reads) == 1
+    assert DEFAULT_USER_TYPE_PERMISSIONS == {}
+
+
+@pytest.mark.django_db
+def test_bulk_create_users_reports_bad_rows(settings):
+    """
+    Test that bulk_create_users creates the valid users and profiles and reports every bad row without aborting the batch.
+
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    """
+    from apps.core.users.models import UserProfile
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    CustomUser.objects.create_user(username='taken', email='taken@example.com', password='password1', user_type='CLI')
+    rows = [
+        {'username': 'bulk1', 'email': 'bulk1@EXAMPLE.com', 'password': 'password1', 'user_type': 'CLI',
+         'profile': {'city': 'Lima'}},
+        {'username': 'bulk2', 'email': 'bulk2@example.com', 'password': 'password2', 'user_type': 'CLI', 'shoe_size': 42},
+        {'username': 'x' * 151, 'email': 'bulk3@example.com', 'password': 'password3', 'user_type': 'CLI'},
+        {'username': 'bulk4', 'email': 'not an email', 'password': 'password4', 'user_type': 'CLI'},
+        {'username': 'taken', 'email': 'bulk5@example.com', 'password': 'password5', 'user_type': 'CLI'},
+        {'username': 'bulk6', 'email': 'bulk6@example.com', 'password': None, 'user_type': 'STF',
+         'profile': {'planet': 'Mars'}},
+        {'username': 'bulk7', 'email': 'bulk7@example.com', 'password': 'password7', 'user_type': 'STF'},
+    ]
+
+    created, failures = CustomUser.objects.bulk_create_users(rows, batch_size=2, workers=0)
+
+    assert [user.username for user in created] == ['bulk1', 'bulk7']
+    assert [index for index, _ in failures] == [1, 2, 3, 4, 5]
+    user = CustomUser.objects.get(username='bulk1')
+    assert user.email == 'bulk1@example.com'
+    assert user.check_password('password1')
+    assert UserProfile.objects.get(user=user).city == 'Lima'
+    assert UserProfile.objects.filter(user__username='bulk7').exists()
+
+
+@pytest.mark.django_db
+def test_user_transfer_commands_keep_company(settings, tmp_path):
+    """
+    Test that users are exported with their company, and imported with it while invalid rows are reported and skipped.
+
+    :param settings: Pytest-django fixture used to pick a fast hasher
+    :param tmp_path: Pytest fixture with a directory for the files
+    """
+    import csv
+    import io
+    from django.core.management import call_command
+    from apps.core.company.models import Company
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    company = Company.objects.create(name='tenant')
+    CustomUser.objects.create_user(username='owned', email='owned@example.com', password='password1', user_type='CLI', company=company)
+    exported = tmp_path / 'users.csv'
+    call_command('export_users', str(exported))
+    with open(exported, newline='') as stream:
+        assert [row['company'] for row in csv.DictReader(stream)] == [company.store_code]
+
+    imported = tmp_path / 'import.csv'
+    with open(imported, 'w', newline='') as stream:
+        writer = csv.DictWriter(stream, ['username', 'email', 'password', 'user_type', 'company', 'city'])
+        writer.writeheader()
+        writer.writerow({'username': 'new', 'email': 'new@example.com', 'password': 'password2', 'user_type': 'STF',
+                         'company': company.store_code, 'city': 'Lima'})
+        writer.writerow({'username': 'x' * 151, 'email': 'long@example.com', 'user_type': 'CLI'})
+        writer.writerow({'username': 'bademail', 'email': 'not an email', 'user_type': 'CLI'})
+        writer.writerow({'username': 'badcity', 'email': 'city@example.com', 'user_type': 'CLI', 'city': 'x' * 51})
+    errors = io.StringIO()
+    call_command('import_users', str(imported), stdout=io.StringIO(), stderr=errors)
+
+    assert [line.split(':')[0] for line in errors.getvalue().splitlines()] == ['row 2', 'row 3', 'row 4']
+
+    user = CustomUser.objects.get(username='new')
+    assert user.company_id == company.store_code
+    assert user.userprofile.city == 'Lima'
+    assert not CustomUser.objects.filter(email__in=['long@example.com', 'not an email', 'city@example.com']).exists()
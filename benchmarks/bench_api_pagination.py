@@ -0,0 +1,80 @@
+"""
+Load test of the Company list endpoint at deep pages, keyset cursors against OFFSET.
+
+Inserts `rows` companies inside a transaction that is rolled back at the end, then requests
+pages of the /api/companies/ endpoint at growing depths through the test client, and runs
+the keyset query it issues next to the LIMIT/OFFSET query the same page would need.
+Reports the median latency of each over REPEAT runs.
+
+Run it from the project root against the configured database (Postgres for meaningful
+numbers) with:
+    DJANGO_SETTINGS_MODULE=ecommerce.settings.develop python -m benchmarks.bench_api_pagination [rows]
+"""
+import statistics
+import sys
+import time
+
+import django
+
+ROWS = 200000
+PAGE_SIZE = 50
+DEPTHS = (1, 10, 100, 1000, 3000)
+REPEAT = 20
+
+
+class Rollback(Exception):
+    pass
+
+
+def median_ms(func, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(rows):
+    from django.conf import settings
+    from django.db import transaction
+    from rest_framework.test import APIClient
+
+    from apps.api.pagination import encode_cursor
+    from apps.core.store.cursors import filter_after_cursor
+    from apps.core.company.models import Company
+    from apps.core.users.models import CustomUser
+
+    settings.ALLOWED_HOSTS = ['*']
+    client = APIClient()
+    client.force_authenticate(CustomUser(username='bench', is_superuser=True, is_active=True))
+    try:
+        with transaction.atomic():
+            Company.objects.bulk_create_coded(
+                Company(name='Company %d' % i, tax_document='B%d' % i) for i in range(rows)
+            )
+            ordered = Company.available_objects.order_by('-created', '-store_code')
+            print('%8s %16s %16s %16s' % ('page', 'endpoint (ms)', 'keyset query', 'offset query'))
+            for depth in DEPTHS:
+                offset = (depth - 1) * PAGE_SIZE
+                if offset >= rows:
+                    break
+                page = ordered.values()
+                url = '/api/companies/?page_size=%d' % PAGE_SIZE
+                if offset:
+                    last = ordered.values('created', 'store_code')[offset - 1]
+                    cursor = encode_cursor(last['created'], last['store_code'])
+                    page = filter_after_cursor(page, cursor)
+                    url += '&cursor=' + cursor
+                endpoint = median_ms(lambda: client.get(url))
+                keyset = median_ms(lambda: list(page[:PAGE_SIZE]))
+                offset_query = median_ms(lambda: list(ordered.values()[offset:offset + PAGE_SIZE]))
+                print('%8d %16.2f %16.2f %16.2f' % (depth, endpoint, keyset, offset_query))
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    django.setup()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
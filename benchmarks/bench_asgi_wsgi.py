@@ -0,0 +1,88 @@
+"""
+Load test of the WSGI and ASGI deployment modes with many slow concurrent clients.
+
+Opens `clients` concurrent keep-alive connections that each request an endpoint in a loop,
+pausing `think` seconds between requests (slow clients), and reports requests per second
+and latency percentiles. Only the standard library is used on the client side.
+
+Start the server in each mode with run_web_service.sh and point the benchmark at it, with
+the same session cookie of a user holding company.view_company:
+    ./run_web_service.sh                       # WSGI, sync workers
+    python -m benchmarks.bench_asgi_wsgi http://localhost:8000/api/companies/ SESSIONID
+    WEB_MODE=asgi ./run_web_service.sh         # ASGI, uvicorn workers
+    python -m benchmarks.bench_asgi_wsgi http://localhost:8000/api/async/companies/ SESSIONID
+"""
+import asyncio
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+CLIENTS = 200
+DURATION = 20
+THINK = 0.5
+
+
+async def client(url, cookie, deadline, latencies, errors, think):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    request = (
+        'GET %s HTTP/1.1\r\nHost: %s\r\nCookie: sessionid=%s\r\nConnection: keep-alive\r\n\r\n'
+        % (path, parts.netloc, cookie)
+    ).encode()
+    reader = writer = None
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            writer.write(request)
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            if b' 200 ' not in status:
+                errors.append(status)
+            latencies.append(time.perf_counter() - start)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(e)
+            writer = None
+        await asyncio.sleep(think)
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, cookie, clients, duration, think):
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*[client(url, cookie, deadline, latencies, errors, think) for _ in range(clients)])
+    return latencies, errors
+
+
+def main(url, cookie, clients=CLIENTS, duration=DURATION, think=THINK):
+    latencies, errors = asyncio.run(run(url, cookie, clients, duration, think))
+    if not latencies:
+        print('no successful requests, %d errors' % len(errors))
+        return
+    latencies.sort()
+    print('%-10s %10s %10s %10s %10s %8s' % ('clients', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'errors'))
+    print('%-10d %10.1f %10.1f %10.1f %10.1f %8d' % (
+        clients,
+        len(latencies) / duration,
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        len(errors),
+    ))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2], *(int(arg) for arg in sys.argv[3:4]))
@@ -0,0 +1,107 @@
+"""
+Stress test of Company creation by many processes writing at once.
+
+Each process saves new companies and calls Company.get_or_create_by_tax_document on a small
+set of tax documents shared by all of them, so most of those calls race for the same rows.
+Reports the writes per second and the errors for each number of processes, then checks that
+every tax document has exactly one company and removes the rows it created.
+
+Throughput should grow with the processes (up to the cores of the database) and no process
+should see an error: store code collisions are retried and the tax document races are
+resolved by ON CONFLICT DO NOTHING.
+
+Run it from the project root against the configured Postgres database with:
+    DJANGO_SETTINGS_MODULE=ecommerce.settings.develop python -m benchmarks.bench_concurrent_writes [seconds]
+"""
+import multiprocessing
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+
+import django
+
+PROCESSES = (1, 2, 4, 8)
+SECONDS = 5
+TAX_DOCUMENTS = 20
+
+
+def worker(prefix, seconds, start, results):
+    django.setup()
+    from apps.core.company.models import Company
+
+    writes = 0
+    errors = Counter()
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if writes % 2:
+                Company(name='%s%d' % (prefix, writes), doctype='EIN').save()
+            else:
+                Company.get_or_create_by_tax_document(
+                    '%s%d' % (prefix, random.randrange(TAX_DOCUMENTS)), {'name': prefix + 'tax', 'doctype': 'EIN'},
+                )
+            writes += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+    results.put((writes, errors))
+
+
+def run(processes, seconds):
+    context = multiprocessing.get_context('spawn')
+    prefix = 'bench-%s-' % uuid.uuid4().hex[:8]
+    start = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(prefix, seconds, start, results)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    start.wait()
+    writes = 0
+    errors = Counter()
+    for _ in workers:
+        count, failed = results.get()
+        writes += count
+        errors.update(failed)
+    for process in workers:
+        process.join()
+    return prefix, writes, errors
+
+
+def check(prefix):
+    """
+    Returns the tax documents of the run that do not have exactly one company.
+    """
+    from django.db.models import Count
+
+    from apps.core.company.models import Company
+
+    counts = (
+        Company.all_objects.filter(tax_document__startswith=prefix)
+        .values('tax_document').annotate(rows=Count('store_code'))
+    )
+    return [row['tax_document'] for row in counts if row['rows'] != 1]
+
+
+def main(seconds):
+    from benchmarks.hot_paths import delete_companies
+
+    print('%-10s %10s %12s %12s  %s' % ('processes', 'writes', 'writes/sec', 'per process', 'errors'))
+    for processes in PROCESSES:
+        prefix, writes, errors = run(processes, seconds)
+        try:
+            duplicated = check(prefix)
+        finally:
+            delete_companies(prefix)
+        print('%-10d %10d %12.1f %12.1f  %s' % (
+            processes, writes, writes / seconds, writes / seconds / processes,
+            ', '.join('%s: %d' % item for item in errors.items()) or '-',
+        ))
+        if duplicated:
+            print('  tax documents without exactly one company: %s' % ', '.join(duplicated))
+
+
+if __name__ == '__main__':
+    django.setup()
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS)
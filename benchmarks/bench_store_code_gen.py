@@ -0,0 +1,45 @@
+"""
+Benchmark of the store code generation paths.
+
+Compares the per call path used by StoreModel.gen_strcode before batching (a new
+StoreCodeGen for every code) against StoreCodeGen.gen_storecode_batch.
+
+Run it from the project root with:
+    python -m benchmarks.bench_store_code_gen
+"""
+import timeit
+
+from apps.core.store import store_code_gen
+from apps.core.store.store_code_gen import StoreCodeGen
+
+PREFIX = 'COMP'
+SIZES = (1000, 10000, 100000)
+
+
+def per_call(n):
+    return [StoreCodeGen().gen_storecode(PREFIX) for _ in range(n)]
+
+
+def shared_per_call(n, gen=StoreCodeGen()):
+    return [gen.gen_storecode(PREFIX) for _ in range(n)]
+
+
+def batch(n, gen=StoreCodeGen()):
+    return gen.gen_storecode_batch(n, PREFIX)
+
+
+def codes_per_second(func, n, repeat=3):
+    best = min(timeit.repeat(lambda: func(n), number=1, repeat=repeat))
+    return n / best
+
+
+def main():
+    print('numpy available: %s' % (store_code_gen.numpy is not None))
+    print('%-18s %10s %16s' % ('path', 'codes', 'codes/sec'))
+    for n in SIZES:
+        for name, func in (('per_call', per_call), ('shared_per_call', shared_per_call), ('batch', batch)):
+            print('%-18s %10d %16.0f' % (name, n, codes_per_second(func, n)))
+
+
+if __name__ == '__main__':
+    main()
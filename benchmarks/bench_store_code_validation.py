@@ -0,0 +1,45 @@
+"""
+Micro-benchmark of store code validation for the Company, CustomUser and UserProfile prefixes.
+
+Compares the checks StoreModel.clean used to run (two regular expressions formatted and
+matched on every call) against the registered StoreCodeValidator paths.
+
+Run it from the project root with:
+    python -m benchmarks.bench_store_code_validation
+"""
+import re
+import timeit
+
+from apps.core.store.store_code_gen import StoreCodeGen
+from apps.core.store.validators import register_store_code_validator
+
+PREFIXES = ('COMP', 'USR', 'USRP')
+CODES_PER_PREFIX = 10000
+
+
+def legacy_clean(prefix, code):
+    return bool(
+        re.match('^%s\\d{9}([A-N]|[P-Z])[a-zA-Z]{4}$' % prefix, str(code)) or
+        re.match('^%s\\d{5}([A-N]|[P-Z])[a-zA-Z]{4}$' % prefix, str(code))
+    )
+
+
+def main():
+    gen = StoreCodeGen(user_seed=1234)
+    print('%-6s %-16s %16s' % ('prefix', 'path', 'codes/sec'))
+    for prefix in PREFIXES:
+        codes = gen.gen_storecode_batch(CODES_PER_PREFIX, prefix)
+        validator = register_store_code_validator(prefix)
+        paths = (
+            ('legacy_clean', lambda: [legacy_clean(prefix, code) for code in codes]),
+            ('compiled_regex', lambda: [validator.matches(code) for code in codes]),
+            ('structural', lambda: [validator.is_valid(code) for code in codes]),
+            ('validate_many', lambda: validator.validate_many(codes)),
+        )
+        for name, func in paths:
+            best = min(timeit.repeat(func, number=1, repeat=5))
+            print('%-6s %-16s %16.0f' % (prefix, name, len(codes) / best))
+
+
+if __name__ == '__main__':
+    main()
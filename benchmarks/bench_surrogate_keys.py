@@ -0,0 +1,78 @@
+"""
+Benchmark of varchar store code primary keys against bigint surrogate keys on Postgres.
+
+Builds two temporary parent/child table pairs with the same rows, one keyed and joined by
+store code (StoreModel) and one by a bigint id (SurrogateKeyStoreModel), then reports the
+primary key and foreign key index sizes and the time of a full parent/child join.
+
+Run it from the project root against the configured Postgres database with:
+    DJANGO_SETTINGS_MODULE=ecommerce.settings.develop python -m benchmarks.bench_surrogate_keys [rows]
+"""
+import sys
+import time
+
+import django
+
+ROWS = 1000000
+
+SCHEMAS = {
+    'varchar': (
+        'CREATE TEMPORARY TABLE bench_parent_varchar (store_code varchar(25) PRIMARY KEY)',
+        'CREATE TEMPORARY TABLE bench_child_varchar ('
+        ' store_code varchar(25) PRIMARY KEY,'
+        ' parent_id varchar(25) NOT NULL REFERENCES bench_parent_varchar (store_code))',
+        "INSERT INTO bench_parent_varchar SELECT 'COMP' || lpad(n::text, 9, '0') || 'abcd'"
+        ' FROM generate_series(1, %(rows)s) n',
+        "INSERT INTO bench_child_varchar SELECT 'USRP' || lpad(n::text, 9, '0') || 'abcd',"
+        " 'COMP' || lpad(n::text, 9, '0') || 'abcd' FROM generate_series(1, %(rows)s) n",
+        'CREATE INDEX bench_child_varchar_parent ON bench_child_varchar (parent_id)',
+    ),
+    'bigint': (
+        'CREATE TEMPORARY TABLE bench_parent_bigint ('
+        ' id bigint PRIMARY KEY, store_code varchar(25) UNIQUE NOT NULL)',
+        'CREATE TEMPORARY TABLE bench_child_bigint ('
+        ' id bigint PRIMARY KEY, store_code varchar(25) UNIQUE NOT NULL,'
+        ' parent_id bigint NOT NULL REFERENCES bench_parent_bigint (id))',
+        "INSERT INTO bench_parent_bigint SELECT n, 'COMP' || lpad(n::text, 9, '0') || 'abcd'"
+        ' FROM generate_series(1, %(rows)s) n',
+        "INSERT INTO bench_child_bigint SELECT n, 'USRP' || lpad(n::text, 9, '0') || 'abcd', n"
+        ' FROM generate_series(1, %(rows)s) n',
+        'CREATE INDEX bench_child_bigint_parent ON bench_child_bigint (parent_id)',
+    ),
+}
+
+INDEXES = {
+    'varchar': ('bench_parent_varchar_pkey', 'bench_child_varchar_parent'),
+    'bigint': ('bench_parent_bigint_pkey', 'bench_child_bigint_parent'),
+}
+
+JOIN = 'SELECT count(*) FROM bench_child_%s c JOIN bench_parent_%s p ON p.%s = c.parent_id'
+
+
+def main(rows):
+    from django.db import connection
+
+    print('%-8s %18s %18s %12s' % ('key', 'parent pk index', 'child fk index', 'join (ms)'))
+    with connection.cursor() as cursor:
+        for key, statements in SCHEMAS.items():
+            for statement in statements:
+                cursor.execute(statement % {'rows': rows})
+            cursor.execute('ANALYZE bench_parent_%s; ANALYZE bench_child_%s' % (key, key))
+            sizes = []
+            for index in INDEXES[key]:
+                cursor.execute('SELECT pg_size_pretty(pg_relation_size(%s::regclass))', [index])
+                sizes.append(cursor.fetchone()[0])
+            join = JOIN % (key, key, 'store_code' if key == 'varchar' else 'id')
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                cursor.execute(join)
+                cursor.fetchone()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print('%-8s %18s %18s %12.1f' % (key, sizes[0], sizes[1], best * 1000))
+
+
+if __name__ == '__main__':
+    django.setup()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
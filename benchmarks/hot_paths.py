@@ -0,0 +1,131 @@
+"""
+Benchmark cases of the model and request hot paths, run by the `benchmark` management command:
+
+    python manage.py benchmark                   # every case, compared to the baseline
+    python manage.py benchmark 'store.*' --save  # record the baseline of some cases
+
+Database cases run against the configured database (Postgres for meaningful numbers) and
+remove the rows they create. Request cases go through the test client and the whole
+middleware stack, with query profiling turned off.
+"""
+import itertools
+import uuid
+
+from django.test import Client
+from django.test.utils import override_settings
+
+from apps.core.company.models import Company
+from apps.core.store.models import StoreHistory
+from apps.core.store.store_code_gen import StoreCodeGen
+from apps.core.users.models import CustomUser
+from benchmarks.runner import benchmark
+
+SEED_ROWS = 500
+THREADS = 4
+
+
+def bench_name():
+    """
+    Returns a prefix unique to this run for the names of the rows a case creates.
+    """
+    return 'bench-%s-' % uuid.uuid4().hex[:8]
+
+
+def delete_companies(prefix):
+    codes = list(Company.all_objects.filter(name__startswith=prefix).values_list('store_code', flat=True))
+    StoreHistory.objects.filter(model=Company._meta.label, store_code__in=codes).delete()
+    Company.all_objects.filter(store_code__in=codes).delete()
+
+
+def seed_companies(bench, rows=SEED_ROWS):
+    prefix = bench_name()
+    bench.cleanup(delete_companies, prefix)
+    return Company.objects.bulk_create_coded(
+        Company(name='%s%d' % (prefix, i), doctype='EIN') for i in range(rows)
+    )
+
+
+def create_superuser(bench):
+    username = bench_name() + 'admin'
+    bench.cleanup(lambda: CustomUser.objects.filter(username=username).delete())
+    return CustomUser.objects.create_superuser(username, username + '@example.com', 'bench', user_type='SADM')
+
+
+def request_client(bench):
+    """
+    Returns a test Client logged in as a superuser, with every host allowed.
+    """
+    overrides = override_settings(ALLOWED_HOSTS=['*'], QUERY_PROFILING_SAMPLE_RATE=0)
+    overrides.enable()
+    bench.cleanup(overrides.disable)
+    client = Client()
+    client.force_login(create_superuser(bench))
+    return client
+
+
+@benchmark('store.gen_storecode')
+def gen_storecode(bench):
+    gen = StoreCodeGen()
+    bench(gen.gen_storecode, 'COMP')
+
+
+@benchmark('store.gen_storecode_batch')
+def gen_storecode_batch(bench):
+    gen = StoreCodeGen()
+    bench(gen.gen_storecode_batch, 1000, 'COMP')
+
+
+@benchmark('store.clean')
+def store_model_clean(bench):
+    company = Company(store_code=Company.gen_strcode(), name='clean')
+    bench(company.clean)
+
+
+@benchmark('company.save', threshold=0.5)
+def company_save(bench):
+    prefix = bench_name()
+    bench.cleanup(delete_companies, prefix)
+    counter = itertools.count()
+    bench(lambda: Company(name='%s%d' % (prefix, next(counter))).save())
+
+
+@benchmark('company.save_concurrent', threshold=0.5)
+def company_save_concurrent(bench):
+    prefix = bench_name()
+    bench.cleanup(delete_companies, prefix)
+    counter = itertools.count()
+    bench.threaded(lambda: Company(name='%s%d' % (prefix, next(counter))).save(), THREADS)
+
+
+@benchmark('users.create_user', threshold=0.5)
+def create_user(bench):
+    prefix = bench_name()
+    bench.cleanup(lambda: CustomUser.objects.filter(username__startswith=prefix).delete())
+    counter = itertools.count()
+
+    def create():
+        username = '%s%d' % (prefix, next(counter))
+        return CustomUser.objects.create_user(username, username + '@example.com', 'bench-password', user_type='CLI')
+
+    bench(create)
+
+
+@benchmark('admin.company_changelist', threshold=0.5)
+def admin_company_changelist(bench):
+    seed_companies(bench)
+    client = request_client(bench)
+    bench(client.get, '/admin/company/company/')
+
+
+@benchmark('api.company_list', threshold=0.5)
+def api_company_list(bench):
+    seed_companies(bench)
+    client = request_client(bench)
+    bench(client.get, '/api/companies/')
+
+
+@benchmark('api.company_detail', threshold=0.5)
+def api_company_detail(bench):
+    company = seed_companies(bench, 1)[0]
+    client = request_client(bench)
+    bench(client.get, '/api/companies/%s/' % company.store_code)
@@ -0,0 +1,247 @@
+"""
+Small benchmark runner with stored baselines, used by the `benchmark` management command.
+
+Cases are functions registered with @benchmark that get a Bench and hand it the callable
+to time, pytest-benchmark style:
+
+    @benchmark('store.gen_storecode')
+    def gen_storecode(bench):
+        gen = StoreCodeGen()
+        bench(gen.gen_storecode, 'COMP')
+
+Bench calibrates how many calls make a round of at least `min_time` seconds, runs `rounds`
+rounds and keeps the time per call of each one. Cases clean up the rows they create with
+bench.cleanup(), which runs even when the case fails.
+
+Baselines are the median time per call of each case, kept in a JSON file. A case regresses
+when its median is more than its threshold (a share, 0.25 is 25%) slower than the baseline.
+Baselines only compare on the machine and database that recorded them, so none is committed:
+record one with `--save` before comparing.
+
+The cases write to the database, so the command only runs them against a test database
+(see is_test_database) unless told otherwise.
+"""
+import json
+import os
+import platform
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.base.creation import TEST_DATABASE_PREFIX
+
+DEFAULT_ROUNDS = 7
+DEFAULT_MIN_TIME = 0.1
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+# Calls per round are doubled until a round takes min_time, up to this many
+MAX_NUMBER = 1 << 20
+
+CASES = {}
+
+
+class Case(object):
+
+    def __init__(self, name, func, threshold=None):
+        self.name = name
+        self.func = func
+        self.threshold = threshold
+
+
+def benchmark(name, threshold=None):
+    """
+    Registers the decorated function as the case `name`.
+
+    Args:
+        name (str): Dotted case name, matched by the patterns of the command.
+        threshold (float): Slowdown over the baseline reported as a regression. Defaults to
+            the one of the run.
+    """
+    def decorator(func):
+        CASES[name] = Case(name, func, threshold)
+        return func
+    return decorator
+
+
+def get_cases(patterns=None):
+    """
+    Returns the registered cases matching any of the fnmatch `patterns`, or all of them.
+    """
+    return [case for name, case in sorted(CASES.items()) if not patterns or any(fnmatch(name, p) for p in patterns)]
+
+
+class Result(object):
+    """
+    Times per call of each round of a case, in seconds.
+    """
+
+    def __init__(self, name, times, number, threads=1):
+        self.name = name
+        self.times = times
+        self.number = number
+        self.threads = threads
+
+    @property
+    def median(self):
+        return statistics.median(self.times)
+
+    @property
+    def ops(self):
+        return 1 / self.median if self.median else float('inf')
+
+    def as_dict(self):
+        return {
+            'median_ms': self.median * 1000,
+            'min_ms': min(self.times) * 1000,
+            'max_ms': max(self.times) * 1000,
+            'ops': self.ops,
+            'rounds': len(self.times),
+            'number': self.number,
+            'threads': self.threads,
+        }
+
+
+class Bench(object):
+    """
+    Timer handed to each case.
+    """
+
+    def __init__(self, name, rounds=DEFAULT_ROUNDS, min_time=DEFAULT_MIN_TIME):
+        self.name = name
+        self.rounds = rounds
+        self.min_time = min_time
+        self.result = None
+        self._cleanups = []
+
+    def cleanup(self, func, *args, **kwargs):
+        """
+        Registers a function called after the case, last registered first.
+        """
+        self._cleanups.append((func, args, kwargs))
+
+    def run_cleanups(self):
+        while self._cleanups:
+            func, args, kwargs = self._cleanups.pop()
+            func(*args, **kwargs)
+
+    def calibrate(self, run_round):
+        """
+        Returns the calls per round that take at least min_time, warming up on the way.
+        """
+        number = 1
+        while number < MAX_NUMBER:
+            if run_round(number) >= self.min_time:
+                return number
+            number *= 2
+        return number
+
+    def __call__(self, func, *args, **kwargs):
+        """
+        Times `func(*args, **kwargs)` and returns its last result.
+        """
+        value = None
+
+        def run_round(number):
+            nonlocal value
+            start = time.perf_counter()
+            for _ in range(number):
+                value = func(*args, **kwargs)
+            return time.perf_counter() - start
+
+        number = self.calibrate(run_round)
+        self.result = Result(self.name, [run_round(number) / number for _ in range(self.rounds)], number)
+        return value
+
+    def threaded(self, func, threads=4):
+        """
+        Times `func()` called by `threads` threads at once, as the time per call of the whole
+        group (the inverse of the throughput). Each thread closes its database connections.
+        """
+        barrier = threading.Barrier(threads)
+
+        def worker(number):
+            try:
+                barrier.wait()
+                for _ in range(number):
+                    func()
+            finally:
+                connections.close_all()
+
+        def run_round(number):
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                start = time.perf_counter()
+                for future in [executor.submit(worker, number) for _ in range(threads)]:
+                    future.result()
+                return time.perf_counter() - start
+
+        number = self.calibrate(run_round)
+        self.result = Result(
+            self.name, [run_round(number) / (number * threads) for _ in range(self.rounds)], number, threads,
+        )
+
+
+def run_case(case, rounds=DEFAULT_ROUNDS, min_time=DEFAULT_MIN_TIME):
+    """
+    Runs one case and returns its Result.
+    """
+    bench = Bench(case.name, rounds, min_time)
+    try:
+        case.func(bench)
+    finally:
+        bench.run_cleanups()
+    if bench.result is None:
+        raise RuntimeError('Benchmark %s did not time anything' % case.name)
+    return bench.result
+
+
+def is_test_database(alias=DEFAULT_DB_ALIAS):
+    """
+    Returns whether the database `alias` is a test database: its name has the test prefix or is
+    its TEST NAME, or it is an in-memory SQLite database.
+    """
+    connection = connections[alias]
+    name = str(connection.settings_dict['NAME'])
+    if connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(name):
+        return True
+    return name.startswith(TEST_DATABASE_PREFIX) or name == connection.settings_dict.get('TEST', {}).get('NAME')
+
+
+def load_baseline(path=DEFAULT_BASELINE_PATH):
+    """
+    Returns the baseline results by case name, empty when there is no file.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('results', {})
+
+
+def save_baseline(results, path=DEFAULT_BASELINE_PATH):
+    """
+    Stores `results` as the baseline of their cases, keeping the other cases of the file.
+    """
+    baseline = load_baseline(path)
+    baseline.update({result.name: result.as_dict() for result in results})
+    data = {
+        'recorded': datetime.now(timezone.utc).isoformat(),
+        'machine': '%s %s, Python %s' % (platform.node(), platform.machine(), platform.python_version()),
+        'database': connections['default'].vendor,
+        'results': baseline,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare(result, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the change of the median against the baseline (0.1 is 10% slower) and whether it
+    is a regression, or (None, False) when the case has no baseline.
+    """
+    if not baseline:
+        return None, False
+    change = result.median * 1000 / baseline['median_ms'] - 1
+    return change, change > threshold
@@ -0,0 +1,16 @@
+"""
+Celery application of the project, for the work that must not run on the request path:
+bulk imports, soft delete archival, cache warming and aggregate refreshes.
+
+Configuration comes from the CELERY_* settings. Tasks are discovered in the tasks module of
+each installed app, and periodic ones are scheduled by django-celery-beat.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings.production')
+
+app = Celery('ecommerce')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
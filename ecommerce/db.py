@@ -0,0 +1,150 @@
+"""
+Database connection metrics.
+
+With persistent connections (CONN_MAX_AGE) most requests reuse the connection their worker
+thread already holds, and only some pay for a new one. ConnectionMetricsMiddleware counts
+both cases and times the connects, so the effect of the settings (or of a pooler such as
+PgBouncer in front of Postgres) can be checked in production.
+"""
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionMetrics(object):
+    """
+    Thread safe counters of connection checkouts (reused connections) and connects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.timed_connects = 0
+            self.connect_seconds = 0.0
+            self.max_connect_seconds = 0.0
+
+    def record(self, connected, connect_seconds=None):
+        """
+        Records a request that reused a connection, or one that `connected`, in
+        `connect_seconds` when the connect was timed.
+        """
+        with self._lock:
+            if not connected:
+                self.checkouts += 1
+            else:
+                self.connects += 1
+                if connect_seconds is not None:
+                    self.timed_connects += 1
+                    self.connect_seconds += connect_seconds
+                    self.max_connect_seconds = max(self.max_connect_seconds, connect_seconds)
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict, with the share of requests that reused a connection.
+        """
+        with self._lock:
+            total = self.checkouts + self.connects
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'reuse_ratio': self.checkouts / total if total else None,
+                'avg_connect_ms': (
+                    self.connect_seconds / self.timed_connects * 1000 if self.timed_connects else None
+                ),
+                'max_connect_ms': self.max_connect_seconds * 1000,
+            }
+
+
+# Process wide metrics of the default database
+connection_metrics = ConnectionMetrics()
+
+
+def add_server_timing(response, timing):
+    """
+    Appends a metric such as 'db;dur=1.5' to the Server-Timing header of `response`.
+    """
+    response['Server-Timing'] = (
+        '%s, %s' % (response['Server-Timing'], timing) if response.has_header('Server-Timing') else timing
+    )
+    return response
+
+
+class ConnectionMetricsMiddleware(object):
+    """
+    Records whether each request reused the default database connection or opened a new
+    one, and how long the connect took.
+
+    The connection is never opened here, so requests that do not query (static files,
+    health checks) are not counted and cost nothing. New connects are logged and reported in
+    a Server-Timing header (db-connect). Under ASGI the connects happen in the sync thread
+    shared by concurrent requests, so they are counted but not timed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, using=DEFAULT_DB_ALIAS, metrics=None):
+        self.get_response = get_response
+        self.using = using
+        self.metrics = metrics or connection_metrics
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        connection = connections[self.using]
+        if connection.connection is not None:
+            self.metrics.record(False)
+            return self.get_response(request)
+        timings = []
+        connection.connect = self.timed_connect(connection.connect, timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            # Drops the instance attribute, which shadows the method of the backend
+            del connection.connect
+        if connection.connection is not None:
+            connect_seconds = timings[0] if timings else None
+            self.record_connect(connect_seconds)
+            if connect_seconds is not None:
+                add_server_timing(response, 'db-connect;dur=%.1f' % (connect_seconds * 1000))
+        return response
+
+    async def __acall__(self, request):
+        was_open = await sync_to_async(self.is_open)()
+        response = await self.get_response(request)
+        if was_open:
+            self.metrics.record(False)
+        elif await sync_to_async(self.is_open)():
+            self.record_connect(None)
+        return response
+
+    def is_open(self):
+        return connections[self.using].connection is not None
+
+    def timed_connect(self, connect, timings):
+        """
+        Wraps the connect method of the connection to append the seconds it takes to `timings`.
+        """
+        def timed():
+            start = time.perf_counter()
+            connect()
+            timings.append(time.perf_counter() - start)
+        return timed
+
+    def record_connect(self, connect_seconds):
+        if connect_seconds is None:
+            logger.debug('Opened a %s database connection', self.using)
+        else:
+            logger.debug('Opened a %s database connection in %.1f ms', self.using, connect_seconds * 1000)
+        self.metrics.record(True, connect_seconds)
@@ -0,0 +1,292 @@
+"""
+Sampled per-request query profiling.
+
+QueryProfilingMiddleware profiles a random QUERY_PROFILING_SAMPLE_RATE share of the
+requests: it counts their queries, times them and groups them by fingerprint (the SQL with
+literals and IN lists normalized), so repeated queries stand out. A fingerprint run
+QUERY_PROFILING_N_PLUS_ONE or more times in one request is flagged as a likely N+1 query,
+for example `profile.user` read in a loop without select_related('user'), along with the
+line of project code that ran it.
+
+Profiled requests get a Server-Timing header and one structured log line on the
+`ecommerce.profiling` logger. Every connection runs the queries through an execute wrapper
+that only does work while a profile is active, so requests that are not sampled pay a
+context variable lookup per query. `profile_queries()` profiles any block, in tests,
+commands or tasks.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from ecommerce.db import add_server_timing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_N_PLUS_ONE = 5
+# Duplicated fingerprints reported per request
+REPORTED_DUPLICATES = 10
+# View name of the requests that matched no URL pattern, so their paths do not grow the stats
+UNRESOLVED_VIEW = '<unresolved>'
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_TABLE_RE = re.compile(r'\bFROM\s+"?(\w+)"?', re.IGNORECASE)
+_COLUMNS_RE = re.compile(r'^SELECT (?:DISTINCT )?.+? FROM ')
+
+
+def fingerprint(sql):
+    """
+    Returns `sql` with its parameters, literals and IN lists replaced, so the queries that
+    only differ by their values share a fingerprint.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def get_caller():
+    """
+    Returns 'path:line' of the innermost frame of project code that is not this module, or None.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            return '%s:%d' % (filename[len(PROJECT_ROOT) + 1:], frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+class QueryProfile(object):
+    """
+    Queries run while the profile is active, grouped by fingerprint.
+
+    Mutated in place, so queries the async ORM runs in sync threads are recorded too.
+    """
+
+    def __init__(self, n_plus_one=DEFAULT_N_PLUS_ONE):
+        self.n_plus_one = n_plus_one
+        self.count = 0
+        self.seconds = 0.0
+        # fingerprint: [count, seconds, caller recorded when the count reached n_plus_one]
+        self.fingerprints = {}
+
+    def record(self, sql, seconds):
+        key = fingerprint(sql)
+        entry = self.fingerprints.setdefault(key, [0, 0.0, None])
+        entry[0] += 1
+        entry[1] += seconds
+        self.count += 1
+        self.seconds += seconds
+        if entry[0] == self.n_plus_one:
+            # The stack is only walked once per flagged fingerprint
+            entry[2] = get_caller()
+
+    def duplicates(self):
+        """
+        Returns the fingerprints run more than once, most repeated first, as dicts.
+        """
+        repeated = sorted(
+            ((key, entry) for key, entry in self.fingerprints.items() if entry[0] > 1),
+            key=lambda item: item[1][0], reverse=True,
+        )
+        return [
+            {
+                'fingerprint': hashlib.sha1(key.encode()).hexdigest()[:12],
+                'count': count,
+                'ms': round(seconds * 1000, 1),
+                'table': (match.group(1) if (match := _TABLE_RE.search(key)) else None),
+                'n_plus_one': count >= self.n_plus_one,
+                'caller': caller,
+                # The column list is left out, the rest of the query tells more
+                'sql': _COLUMNS_RE.sub('SELECT ... FROM ', key)[:200],
+            }
+            for key, (count, seconds, caller) in repeated
+        ]
+
+    def has_n_plus_one(self):
+        return any(entry[0] >= self.n_plus_one for entry in self.fingerprints.values())
+
+    def as_dict(self):
+        duplicates = self.duplicates()
+        return {
+            'queries': self.count,
+            'db_ms': round(self.seconds * 1000, 1),
+            'unique_queries': len(self.fingerprints),
+            'n_plus_one': sum(1 for duplicate in duplicates if duplicate['n_plus_one']),
+            'duplicates': duplicates[:REPORTED_DUPLICATES],
+        }
+
+
+_current_profile = ContextVar('query_profile', default=None)
+
+
+def profile_execute(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, recording the query in the active profile if any.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - start)
+
+
+def install(connection, **kwargs):
+    if profile_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_execute)
+
+
+def install_all():
+    """
+    Installs the execute wrapper on the connections of the current thread opened before
+    this module was imported. Later ones get it from the connection_created signal.
+    """
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+connection_created.connect(install, dispatch_uid='ecommerce.profiling.install')
+
+
+@contextmanager
+def profile_queries(n_plus_one=None):
+    """
+    Profiles the queries of the block and yields the QueryProfile.
+    """
+    profile = QueryProfile(n_plus_one or getattr(settings, 'QUERY_PROFILING_N_PLUS_ONE', DEFAULT_N_PLUS_ONE))
+    install_all()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+class ProfileStats(object):
+    """
+    Thread safe totals of the profiled requests, per view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+
+    def record(self, view, profile):
+        with self._lock:
+            totals = self.views.setdefault(view, {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'n_plus_one': 0})
+            totals['requests'] += 1
+            totals['queries'] += profile.count
+            totals['db_ms'] += profile.seconds * 1000
+            totals['n_plus_one'] += profile.has_n_plus_one()
+
+    def snapshot(self):
+        """
+        Returns the totals of each view, with the average queries and database time per request.
+        """
+        with self._lock:
+            return {
+                view: dict(
+                    totals,
+                    avg_queries=totals['queries'] / totals['requests'],
+                    avg_db_ms=totals['db_ms'] / totals['requests'],
+                )
+                for view, totals in self.views.items()
+            }
+
+
+# Process wide totals of the profiled requests
+profile_stats = ProfileStats()
+
+
+class QueryProfilingMiddleware(object):
+    """
+    Profiles the queries of a sample of the requests, see the module docstring.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, stats=None):
+        self.get_response = get_response
+        self.stats = stats or profile_stats
+        self.sample_rate = getattr(settings, 'QUERY_PROFILING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+        self.n_plus_one = getattr(settings, 'QUERY_PROFILING_N_PLUS_ONE', DEFAULT_N_PLUS_ONE)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        install_all()
+        profile = QueryProfile(self.n_plus_one)
+        token = _current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        # The async ORM runs its queries on the connections of the sync thread
+        await sync_to_async(install_all)()
+        profile = QueryProfile(self.n_plus_one)
+        token = _current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    def get_view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return UNRESOLVED_VIEW
+        return match.view_name or match._func_path
+
+    def report(self, request, response, profile):
+        view = self.get_view_name(request)
+        self.stats.record(view, profile)
+        data = dict(
+            profile.as_dict(), view=view, path=request.path, method=request.method, status=response.status_code
+        )
+        add_server_timing(response, 'db;dur=%.1f;desc="%d queries"' % (profile.seconds * 1000, profile.count))
+        if data['n_plus_one']:
+            add_server_timing(response, 'n-plus-one;desc="%d repeated queries"' % data['n_plus_one'])
+            logger.warning('Possible N+1 queries: %s', json.dumps(data), extra={'query_profile': data})
+        else:
+            logger.info('Query profile: %s', json.dumps(data), extra={'query_profile': data})
+        return response
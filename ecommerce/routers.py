@@ -0,0 +1,143 @@
+"""
+Read replica routing for the company, store and users apps.
+
+Writes always go to the primary (`default`), reads to a random replica from
+settings.DATABASE_REPLICAS. A request that writes is pinned to the primary for the rest of
+the request, and ReplicaStickinessMiddleware keeps the same client on the primary for
+REPLICA_STICKY_SECONDS afterwards with a cookie, so it reads its own writes while the
+replicas catch up. Code outside requests (commands, tasks) can pin with `use_primary()`.
+A single read that must see the latest data passes the `primary=True` hint to
+`router.db_for_read`, which does not pin anything.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ROUTED_APP_LABELS = frozenset({'company', 'store', 'users'})
+STICKY_COOKIE_NAME = 'db_pin'
+DEFAULT_STICKY_SECONDS = 5
+
+
+class RoutingState(object):
+    """
+    Whether reads of the current request (or `use_primary` block) must go to the primary,
+    and whether it wrote. Kept in a context variable and mutated in place, so changes made in
+    the sync threads of the async ORM are seen by the request.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_routing_state = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def use_primary():
+    """
+    Sends every read of the block to the primary.
+    """
+    token = _routing_state.set(RoutingState(pinned=True))
+    try:
+        yield
+    finally:
+        _routing_state.reset(token)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter(object):
+    """
+    Database router that reads the routed apps from the replicas and writes them to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        if hints.get('primary'):
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        state = _routing_state.get()
+        if not replicas or (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        state = _routing_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware(object):
+    """
+    Pins the reads of a request to the primary when the client wrote less than
+    REPLICA_STICKY_SECONDS ago, and marks the client when the request writes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_sticky_seconds(self):
+        return getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(STICKY_COOKIE_NAME, 0))
+        except ValueError:
+            pinned_until = 0
+        state = RoutingState(pinned=pinned_until > time.time())
+        return state, _routing_state.set(state)
+
+    def finish(self, state, response):
+        if state.wrote and get_replicas():
+            seconds = self.get_sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE_NAME, '%.3f' % (time.time() + seconds), max_age=seconds, httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -35,10 +35,12 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
     'model_utils',
+    'django_celery_beat',
 ]
 
 PROJECT_APPS = [
@@ -48,16 +50,23 @@ PROJECT_APPS = [
 
 ]
     
-API_APPS = []
+API_APPS = [
+    'rest_framework',
+    'apps.api.apps.ApiConfig',
+]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS  + PROJECT_APPS + API_APPS
 
 MIDDLEWARE = [
+    'ecommerce.db.ConnectionMetricsMiddleware',
+    'ecommerce.routers.ReplicaStickinessMiddleware',
+    'ecommerce.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.core.company.tenancy.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +74,10 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'ecommerce.urls'
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Session users are read through the cache and permissions come from the user_type,
+# see apps.core.users.backends and apps.core.users.permissions (USER_TYPE_PERMISSIONS)
+AUTHENTICATION_BACKENDS = ['apps.core.users.backends.RolePermissionBackend']
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -93,11 +106,140 @@ DATABASES = {
         "NAME": os.getenv('SQL_DATABASE'),
         "USER": os.getenv('SQL_USER'),
         "PASSWORD": os.getenv('SQL_PASSWORD'),
-        "HOST": "db",  # set in docker-compose.yml
-        "PORT": 5432,  # default postgres port
+        "HOST": os.getenv('SQL_HOST', 'db'),  # set in docker-compose.yml
+        "PORT": int(os.getenv('SQL_PORT', 5432)),  # default postgres port
+        # Seconds a connection is kept open for the next requests of the same thread, 0 closes
+        # it at the end of each request. Health checks drop connections the server closed.
+        "CONN_MAX_AGE": int(os.getenv('SQL_CONN_MAX_AGE', 0)),
+        "CONN_HEALTH_CHECKS": os.getenv('SQL_CONN_HEALTH_CHECKS', '1') == '1',
+        # Set SQL_PGBOUNCER=1 behind PgBouncer in transaction mode, which can not hold
+        # server side cursors (QuerySet.iterator()) across transactions
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv('SQL_PGBOUNCER', '0') == '1',
     }
 }
 
+# Read replicas, comma separated: "host[:port]" entries for Postgres, database files for SQLite.
+# Each one becomes a "replica<N>" alias that ecommerce.routers.ReplicaRouter reads from.
+# Clients that wrote are kept on the primary for REPLICA_STICKY_SECONDS.
+
+DATABASE_REPLICAS = []
+
+for replica in filter(None, os.getenv('SQL_REPLICAS', '').split(',')):
+    replica_config = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if 'sqlite' in (replica_config['ENGINE'] or ''):
+        replica_config['NAME'] = replica
+    else:
+        replica_host, _, replica_port = replica.partition(':')
+        replica_config.update(HOST=replica_host, PORT=int(replica_port or replica_config['PORT']))
+    DATABASE_REPLICAS.append('replica%d' % (len(DATABASE_REPLICAS) + 1))
+    DATABASES[DATABASE_REPLICAS[-1]] = replica_config
+
+DATABASE_ROUTERS = ['ecommerce.routers.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(os.getenv('SQL_REPLICA_STICKY_SECONDS', 5))
+
+# Share of the requests whose queries ecommerce.profiling.QueryProfilingMiddleware profiles,
+# and how many runs of the same query in one request are reported as N+1 queries.
+QUERY_PROFILING_SAMPLE_RATE = float(os.getenv('QUERY_PROFILING_SAMPLE_RATE', 0.01))
+QUERY_PROFILING_N_PLUS_ONE = int(os.getenv('QUERY_PROFILING_N_PLUS_ONE', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Redis when REDIS_URL is set (docker-compose), process local memory otherwise (tests)
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Sessions live in the cache when Redis is available, so authenticated requests need no query.
+# SESSION_ENGINE can be set to django.contrib.sessions.backends.cached_db to keep a copy in the
+# database, or to django.contrib.sessions.backends.signed_cookies to keep them client side.
+
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cache' if REDIS_URL else 'django.contrib.sessions.backends.db',
+)
+
+USER_PERMISSION_CACHE_TIMEOUT = int(os.getenv('USER_PERMISSION_CACHE_TIMEOUT', 300))
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+# JSON only: the browsable API renders forms and instances on every request
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+# Rows per page of the keyset paginated lists, see apps.api.pagination
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 50))
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'ecommerce': {
+            'handlers': ['console'],
+            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+
+# Celery
+# https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html
+# Redis is the broker when REDIS_URL is set. Without it (tests, local runs) tasks run eagerly
+# in process, which CELERY_TASK_ALWAYS_EAGER can also force.
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL or 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', '0' if REDIS_URL else '1') == '1'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = 'UTC'
+# Batch work goes to its own queue, so it never delays the short tasks
+CELERY_TASK_ROUTES = {
+    'apps.core.store.tasks.archive_removed_rows': {'queue': 'bulk'},
+    'apps.core.store.tasks.import_file': {'queue': 'bulk'},
+}
+# Long tasks: take one message at a time and acknowledge it once done
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'archive-removed-rows': {
+        'task': 'apps.core.store.tasks.archive_all_removed',
+        'schedule': 24 * 60 * 60,
+    },
+    'warm-store-cache': {
+        'task': 'apps.core.store.tasks.warm_store_cache',
+        'schedule': 10 * 60,
+    },
+    'refresh-history-aggregate': {
+        'task': 'apps.core.store.tasks.refresh_history_aggregate',
+        'schedule': 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,3 +283,38 @@ STATICFILES_DIRS = []
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Store codes
+# STORE_CODE_BLOCK_SIZE: store codes each process reserves per database round trip
+# STORE_BULK_BATCH_SIZE: rows per chunk in StoreModel bulk inserts
+# STORE_CODE_PERMUTATION_KEY: key that spreads allocated codes over the whole code space.
+#   Never change it once codes have been allocated, new codes could collide with old ones.
+#   Leave it empty to encode the counters as they are.
+# STORE_CODE_RESOLVER_CACHE_SIZE: instances kept per process by the store code resolver, 0 disables it
+# STORE_CACHE_TIMEOUT: seconds StoreModel instances stay in the shared cache (get_cached)
+# STORE_LOCAL_CACHE_TIMEOUT / STORE_LOCAL_CACHE_SIZE: in-process tier in front of the shared cache
+# STORE_EXACT_COUNT_LIMIT: estimated_count() (admin changelists) counts exactly below this many rows
+# STORE_INVALIDATE_LIMIT: QuerySet.update() drops up to this many rows from the caches one by one,
+#   larger updates clear the in-process caches and leave the shared entries to expire
+# STORE_SAVE_RETRIES: times the insert of a new StoreModel is retried after a store code collision or deadlock
+
+STORE_CODE_BLOCK_SIZE = int(os.getenv('STORE_CODE_BLOCK_SIZE', 100))
+STORE_BULK_BATCH_SIZE = int(os.getenv('STORE_BULK_BATCH_SIZE', 1000))
+STORE_CODE_PERMUTATION_KEY = os.getenv('STORE_CODE_PERMUTATION_KEY', 'store-code')
+STORE_CODE_RESOLVER_CACHE_SIZE = int(os.getenv('STORE_CODE_RESOLVER_CACHE_SIZE', 0))
+STORE_CACHE_TIMEOUT = int(os.getenv('STORE_CACHE_TIMEOUT', 300))
+STORE_LOCAL_CACHE_TIMEOUT = int(os.getenv('STORE_LOCAL_CACHE_TIMEOUT', 5))
+STORE_LOCAL_CACHE_SIZE = int(os.getenv('STORE_LOCAL_CACHE_SIZE', 10000))
+STORE_EXACT_COUNT_LIMIT = int(os.getenv('STORE_EXACT_COUNT_LIMIT', 10000))
+STORE_INVALIDATE_LIMIT = int(os.getenv('STORE_INVALIDATE_LIMIT', 10000))
+STORE_SAVE_RETRIES = int(os.getenv('STORE_SAVE_RETRIES', 3))
+
+
+# Tenancy
+# Users and their profiles belong to a Company, the active tenant of their requests,
+# see apps.core.company.tenancy.
+# TENANT_ROW_LEVEL_SECURITY: send the active tenant to Postgres with every query, for the
+#   row level security policies created by the setup_tenancy command
+
+TENANT_ROW_LEVEL_SECURITY = os.getenv('TENANT_ROW_LEVEL_SECURITY', '0') == '1'
@@ -5,3 +5,6 @@ from .base import *
 DEBUG = True
 ALLOWED_HOSTS = origins.split(" ") if (origins := os.getenv("DJANGO_ALLOWED_HOSTS", default="")) else []
 CSRF_TRUSTED_ORIGINS = origins.split(" ") if (origins := os.getenv("CSRF_TRUSTED_ORIGINS", default="")) else []
+
+# Profile the queries of every request
+QUERY_PROFILING_SAMPLE_RATE = float(os.getenv('QUERY_PROFILING_SAMPLE_RATE', 1))
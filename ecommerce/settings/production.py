@@ -4,3 +4,11 @@ from .base import *
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS').split()
+
+# Persistent database connections. Each gunicorn worker thread keeps one connection open, so
+# Postgres (or PgBouncer) needs max_connections >= WEB_WORKERS * WEB_THREADS per web container,
+# plus the connections of the other services.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('SQL_CONN_MAX_AGE', 600))
+DATABASES['default']['OPTIONS'] = {
+    'connect_timeout': int(os.getenv('SQL_CONNECT_TIMEOUT', 5)),
+}
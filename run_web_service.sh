@@ -1,3 +1,10 @@
 #!/bin/bash
 # This file will run when the web service starts
-gunicorn ecommerce.wsgi:application --bind 0.0.0.0:8000 
\ No newline at end of file
+# WEB_MODE=asgi serves ecommerce.asgi with uvicorn workers, for the async views under /api/async/
+# WEB_WORKERS and WEB_THREADS size the server, each thread holds one persistent database connection
+if [ "$WEB_MODE" = "asgi" ]
+then
+    gunicorn ecommerce.asgi:application --bind 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker --workers ${WEB_WORKERS:-2}
+else
+    gunicorn ecommerce.wsgi:application --bind 0.0.0.0:8000 --workers ${WEB_WORKERS:-1} --threads ${WEB_THREADS:-1}
+fi